@@ -0,0 +1,63 @@
+"""
+Load test for the database session handling of the Capra API.
+Sends concurrent /drive/ and /instructions/{id} requests and samples the connection pool.
+Run from the repository root: python -m benchmarks.bench_db_load
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REQUESTS = 2000
+CONCURRENCY = 16
+
+
+def main() -> None:
+    """Prints throughput and the number of pooled database connections during the load test"""
+    logging.disable(logging.INFO)
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{directory}/bench.db"
+
+    # pylint: disable=import-outside-toplevel
+    from fastapi.testclient import TestClient
+    from main import app, controller, engine
+
+    # Only the database is measured, drives finish immediately
+    controller.remote_control = lambda *args, **kwargs: {}
+    client = TestClient(app)
+    client.post("/drive/", json={"angle": 0.0, "speed": 1, "distance": 0.1})
+
+    samples = []
+    done = threading.Event()
+
+    def sample_pool():
+        while not done.wait(0.05):
+            samples.append(engine.pool.checkedin() + engine.pool.checkedout())
+
+    def request(i: int) -> int:
+        if i % 4 == 0:
+            response = client.post(
+                "/drive/", json={"angle": 0.0, "speed": 1, "distance": 0.1})
+        else:
+            response = client.get("/instructions/1")
+        return response.status_code
+
+    sampler = threading.Thread(target=sample_pool)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        statuses = list(executor.map(request, range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+
+    print(f"requests:        {REQUESTS} ({statuses.count(200)} ok)")
+    print(f"throughput:      {REQUESTS / elapsed:.0f} requests/s")
+    print(f"pool connections: min {min(samples, default=0)}, max {max(samples, default=0)}")
+    print(f"checked out after test: {engine.pool.checkedout()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+End-to-end benchmarks of the API against the in-process Capra Hircus simulator, no robot or broker needed.
+Measures the velocity stream rate and jitter at the robot, /drive/ latency and throughput,
+/stop/ latency until the robot stopped, and send_path delivery time per transport.
+Run from the repository root: python -m benchmarks.bench_end_to_end
+"""
+import logging
+import os
+import statistics
+import time
+
+# The benchmark uses its own in-memory database
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+# pylint: disable=wrong-import-position
+from fastapi.testclient import TestClient
+from capra_control import STOP_MODE
+from main import app, fleet, journal
+from path_transport import TRANSPORTS
+from simulator import FakeBroker, FakeHircus, attach_controller
+from benchmarks.bench_path_transport import survey_path
+
+DRIVE_REQUESTS = 200
+STOP_REQUESTS = 50
+STREAM_SECONDS = 5.0
+PATH_NODES = 20_000
+
+
+def percentiles(samples: list) -> str:
+    """Formats the median, 99th percentile and maximum of samples in seconds as milliseconds"""
+    p99 = statistics.quantiles(samples, n=100, method="inclusive")[98] if len(samples) > 1 else samples[0]
+    return f"p50 {statistics.median(samples) * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms  max {max(samples) * 1000:7.2f} ms"
+
+
+def bench_velocity_stream(controller, robot) -> None:
+    """Drives straight and reports the velocity message rate and jitter seen by the robot"""
+    robot.reset()
+    controller.mq_set_mode(1)
+    controller.remote_control(STREAM_SECONDS, 1, 0.0)
+    stats = robot.get_velocity_stats()
+    print(f"velocity stream: {stats['frames']} frames at {stats['rate_hz']:.2f} Hz, "
+          f"jitter {stats['jitter_ms']:.2f} ms, max deviation {stats['max_deviation_ms']:.2f} ms")
+
+
+def bench_drive(client, robot) -> None:
+    """Posts driving instructions and reports request latency and throughput"""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(DRIVE_REQUESTS):
+        request_start = time.perf_counter()
+        response = client.post("/drive/", json={"angle": 0.0, "speed": 1, "distance": 0.1})
+        latencies.append(time.perf_counter() - request_start)
+        assert response.status_code == 200
+    duration = time.perf_counter() - start
+    print(f"/drive/:  {DRIVE_REQUESTS / duration:7.0f} req/s  {percentiles(latencies)}")
+    client.post("/stop/")
+    robot.wait_for(lambda r: r.mode == STOP_MODE)
+
+
+def bench_stop(client, controller, robot) -> None:
+    """Stops a running drive and reports the time until the response and until the robot stopped"""
+    api_latencies, robot_latencies = [], []
+    for _ in range(STOP_REQUESTS):
+        client.post("/drive/", json={"angle": 0.0, "speed": 1, "distance": 100})
+        robot.wait_for(lambda r: r.speed > 0)
+        robot.mode_changes.clear()
+        start = time.monotonic()
+        client.post("/stop/")
+        api_latencies.append(time.monotonic() - start)
+        robot.wait_for(lambda r: any(mode == STOP_MODE for _, mode in r.mode_changes))
+        stopped_at = next(at for at, mode in robot.mode_changes if mode == STOP_MODE)
+        robot_latencies.append(stopped_at - start)
+    print(f"/stop/ response:        {percentiles(api_latencies)}")
+    print(f"/stop/ robot stopped:   {percentiles(robot_latencies)}")
+    stats = controller.stop_latency.get_stats()
+    print(f"stop acknowledgements:  {stats['count']} acknowledged, {stats['failures']} failed, p99 bucket {stats['p99_ms']} ms")
+
+
+def bench_send_path(controller, robot) -> None:
+    """Sends a large path with every transport and reports the time until the robot has it"""
+    data = survey_path(PATH_NODES)
+    for name, transport in TRANSPORTS.items():
+        robot.reset()
+        start = time.perf_counter()
+        controller.send_route(data, transport=transport)
+        robot.wait_for(lambda r: r.paths, 30)
+        print(f"send_path {name:10} {PATH_NODES} nodes delivered in {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+
+def main() -> None:
+    """Runs every benchmark against a simulated robot"""
+    # Every velocity message is logged at INFO level, which would drown the results
+    logging.disable(logging.INFO)
+    broker = FakeBroker()
+    robot = FakeHircus(broker)
+    robot.start()
+    controller = fleet.default.controller
+    attach_controller(controller, broker)
+    controller.connect_to_robot()
+    try:
+        with TestClient(app) as client:
+            bench_velocity_stream(controller, robot)
+            bench_drive(client, robot)
+            bench_stop(client, controller, robot)
+            bench_send_path(controller, robot)
+    finally:
+        journal.flush()
+        controller.disconnect_from_robot()
+        robot.stop()
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Benchmark for calculating the segment lengths of long paths, geopy loop versus the vectorised geometry module.
+Run from the repository root: python -m benchmarks.bench_path_geometry
+"""
+import time
+import numpy as np
+from geopy.distance import geodesic
+import geometry
+
+NODES = 20_000
+
+
+def random_walk(nodes: int) -> np.ndarray:
+    """Returns a survey-like path of nodes roughly one metre apart"""
+    rng = np.random.default_rng(42)
+    steps = rng.normal(0, 1e-5, size=(nodes, 2))
+    return np.array([52.0403, 5.5671]) + np.cumsum(steps, axis=0)
+
+
+def geopy_loop(positions: np.ndarray) -> list:
+    """Segment lengths as calculated before the geometry module"""
+    return [geodesic(tuple(positions[i]), tuple(positions[i + 1])).km * 1000 for i in range(len(positions) - 1)]
+
+
+def timed(function, *args) -> tuple:
+    """Returns the result of a call and its duration in seconds"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    """Prints the duration of each method and its deviation from geopy"""
+    positions = random_walk(NODES)
+    reference, geopy_time = timed(geopy_loop, positions)
+    print(f"{NODES} nodes")
+    print(f"geopy loop:  {geopy_time * 1000:9.1f} ms")
+    for method in (geometry.ELLIPSOIDAL, geometry.HAVERSINE):
+        path_geometry, duration = timed(geometry.compute_path_geometry, positions, method)
+        deviation = np.max(np.abs(path_geometry.lengths - reference))
+        print(f"{method + ':':12} {duration * 1000:9.1f} ms  ({geopy_time / duration:.0f}x, max deviation {deviation:.2e} m)")
+
+
+if __name__ == "__main__":
+    main()
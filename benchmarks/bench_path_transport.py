@@ -0,0 +1,48 @@
+"""
+Benchmark for the bytes sent over the network per path node with each send_path transport.
+Run from the repository root: python -m benchmarks.bench_path_transport
+"""
+import json
+import time
+from capra_control import TOPIC_SEND_PATH
+from models.edge import Edge
+from models.node import Node
+from models.route_capra import CapraRoute
+from path_transport import TOPIC_SEND_PATH_CHUNK, TRANSPORTS, bytes_on_air
+from benchmarks.bench_path_geometry import random_walk
+
+NODES = 20_000
+
+
+def survey_path(nodes: int) -> dict:
+    """Returns a survey-like path with nodes roughly one metre apart"""
+    route = CapraRoute("Survey")
+    for i, (lat, lon) in enumerate(random_walk(nodes).tolist()):
+        route.add_node(Node(f"Node_{i}", i, lat, lon, 53.61400798801333))
+        if i:
+            route.add_edge(Edge(f"Edge_{i - 1}", f"Node_{i - 1}", f"Node_{i}", 0.4))
+    return route.get_formatted_route()
+
+
+def main() -> None:
+    """Prints messages, bytes on air and encoding time of every transport"""
+    data = survey_path(NODES)
+    print(f"{NODES} nodes, MQTT QoS 1")
+    print(f"{'transport':12} {'messages':>8} {'payload':>10} {'on air':>10} {'per node':>9} {'encode':>9}")
+    for name, transport in TRANSPORTS.items():
+        start = time.perf_counter()
+        if transport is None:
+            messages = [json.dumps(data).encode("utf-8")]
+            topic = TOPIC_SEND_PATH
+        else:
+            payload = transport.encode(data)
+            messages = transport.get_messages(payload) if transport.chunked else [payload]
+            topic = TOPIC_SEND_PATH_CHUNK if transport.chunked else TOPIC_SEND_PATH
+        duration = time.perf_counter() - start
+        size = sum(len(message) for message in messages)
+        on_air = bytes_on_air(messages, topic)
+        print(f"{name:12} {len(messages):8} {size:10} {on_air:10} {on_air / NODES:9.1f} {duration * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark for the memory used by a 100 000 node route, nested dicts per node versus the column storage of CapraRoute.
+Run from the repository root: python -m benchmarks.bench_route_memory
+"""
+import time
+import tracemalloc
+from models.edge import Edge
+from models.node import Node
+from models.route_capra import CapraRoute
+from benchmarks.bench_path_geometry import random_walk
+
+NODES = 100_000
+
+
+def dict_route(positions: list) -> tuple:
+    """Nodes and edges formatted when they are added, as CapraRoute did before"""
+    nodes, edges = [], []
+    for i, (lat, lon) in enumerate(positions):
+        nodes.append(Node(f"Node_{i}", i, lat, lon).get_formatted_node())
+        if i:
+            edges.append(Edge(f"Edge_{i - 1}", f"Node_{i - 1}", f"Node_{i}", 0.4).get_formatted_edge())
+    return nodes, edges
+
+
+def column_route(positions: list) -> CapraRoute:
+    """Nodes and edges stored in the columns of CapraRoute"""
+    route = CapraRoute("Survey")
+    for i, (lat, lon) in enumerate(positions):
+        route.add_node(Node(f"Node_{i}", i, lat, lon))
+        if i:
+            route.add_edge(Edge(f"Edge_{i - 1}", f"Node_{i - 1}", f"Node_{i}", 0.4))
+    return route
+
+
+def measure(function, *args) -> tuple:
+    """Returns the result of a call, its duration in seconds and the memory it still holds in bytes"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    duration = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, duration, size
+
+
+def main() -> None:
+    """Prints the memory per node of both representations and the time to serialise the route"""
+    positions = random_walk(NODES).tolist()
+    print(f"{NODES} nodes (durations include tracing overhead)")
+    _, duration, size = measure(dict_route, positions)
+    print(f"nested dicts: {size / 1e6:7.1f} MB  {size / NODES:6.0f} bytes per node  build {duration:5.2f} s")
+    route, duration, size = measure(column_route, positions)
+    print(f"columns:      {size / 1e6:7.1f} MB  {size / NODES:6.0f} bytes per node  build {duration:5.2f} s")
+    start = time.perf_counter()
+    route.get_formatted_route()
+    print(f"formatting the columns when serialising: {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
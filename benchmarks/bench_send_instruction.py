@@ -0,0 +1,52 @@
+"""
+Microbenchmark for the per-tick cost of ControlCapra.send_instruction.
+Run from the repository root: python -m benchmarks.bench_send_instruction
+"""
+import json
+import logging
+import timeit
+from capra_control import ControlCapra, encode_instruction
+from models.driving_instruction import DrivingInstruction
+
+TICKS = 100_000
+
+
+class NullClient:
+    """MQTT client stand-in that drops every message"""
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        """Drops the message"""
+        return topic, payload, qos, retain
+
+    def is_connected(self):
+        """Always connected, so send_instruction publishes every tick"""
+        return True
+
+
+def uncached_send_instruction(controller: ControlCapra, speed: int, angle: float) -> None:
+    """send_instruction as it was before the payload cache"""
+    instruction = DrivingInstruction(speed, angle)
+    msg_json = json.dumps(instruction.get_formatted_instruction())
+    controller.client.publish("capra/remote/direct_velocity", msg_json)
+    controller.logger.info("Sent instruction: %s", msg_json)
+
+
+def main() -> None:
+    """Prints the per-tick cost with and without the payload cache"""
+    logging.disable(logging.INFO)
+    controller = ControlCapra("localhost", 1883)
+    controller.client = NullClient()
+    encode_instruction.cache_clear()
+
+    before = timeit.timeit(lambda: uncached_send_instruction(
+        controller, 1, 0.4), number=TICKS)
+    after = timeit.timeit(
+        lambda: controller.send_instruction(1, 0.4), number=TICKS)
+
+    print(f"uncached: {before / TICKS * 1e6:.2f} us/tick")
+    print(f"cached:   {after / TICKS * 1e6:.2f} us/tick")
+    print(f"speedup:  {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
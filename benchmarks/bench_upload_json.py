@@ -0,0 +1,79 @@
+"""
+Benchmark for ingesting a 100 MB path file, streaming parser versus reading the whole file with json.load.
+Run from the repository root: python -m benchmarks.bench_upload_json
+"""
+import json
+import os
+import tempfile
+import resource
+import time
+from sqlalchemy.orm import sessionmaker
+from database import Base, create_database_engine
+from models.edge import Edge
+from models.node import Node
+import path_ingest
+
+FILE_SIZE = 100 * 1024 * 1024
+
+
+def write_path_file(f, size: int) -> int:
+    """Writes a path file of about size bytes in the Capra Hircus format, returns the number of nodes"""
+    f.write(b'{"timestamp": "2024-04-2 12:56:51", "path_uuid": "Survey", "map_uuid": "", "position_encoding": 0, "nodes": [\n')
+    # A node and its edge take about 400 bytes
+    nodes = size // 400
+    for i in range(nodes):
+        node = Node(f"Node_{i}", i, 52.0403 + i * 1e-6, 5.5671 + i * 1e-6, 0.0).get_formatted_node()
+        node.update({"actions": [], "isIndoor": False})
+        f.write((",\n" if i else "").encode() + json.dumps(node, indent=2).encode())
+    f.write(b'\n], "edges": [\n')
+    for i in range(nodes - 1):
+        edge = Edge(f"Edge_{i}", f"Node_{i}", f"Node_{i + 1}", 0.4).get_formatted_edge()
+        f.write((",\n" if i else "").encode() + json.dumps(edge).encode())
+    f.write(b'\n], "is_indoor": false}\n')
+    return nodes
+
+
+def measure(function, *args) -> tuple:
+    """Returns the result of a call, its duration in seconds and how much it raised the peak resident memory in bytes"""
+    peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    result = function(*args)
+    duration = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak_before
+    return result, duration, peak * 1024
+
+
+def json_load(filename: str) -> dict:
+    """Reads the file as the upload endpoint did before streaming ingestion"""
+    with open(filename, "rb") as f:
+        return json.loads(f.read())
+
+
+def streaming_ingest(filename: str, session_factory) -> dict:
+    """Parses, validates and stores the file with the streaming parser"""
+    with open(filename, "rb") as f:
+        return path_ingest.ingest_path(f, session_factory, filename)
+
+
+def main() -> None:
+    """Prints duration, throughput and peak memory of both methods"""
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "survey.json")
+        with open(filename, "wb") as f:
+            nodes = write_path_file(f, FILE_SIZE)
+        size = os.path.getsize(filename)
+        engine = create_database_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+
+        print(f"{size / 1e6:.0f} MB, {nodes} nodes")
+        # The streaming ingest runs first, the peak memory of json.load would hide its peak
+        path, duration, peak = measure(streaming_ingest, filename, session_factory)
+        print(f"streaming + storing: {duration:6.1f} s  {size / 1e6 / duration:6.1f} MB/s  peak +{peak / 1e6:7.1f} MB ({path['nodes']} nodes stored)")
+        _, duration, peak = measure(json_load, filename)
+        print(f"json.load only:      {duration:6.1f} s  {size / 1e6 / duration:6.1f} MB/s  peak +{peak / 1e6:7.1f} MB")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
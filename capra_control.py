@@ -1,42 +1,138 @@
 """Module containing helper functions for controlling a Capra Hircus Robot"""
 import json
-import time
 import logging
-import math
+import functools
+import threading
+from collections.abc import Callable
 import paho.mqtt.client as mqtt
-from geopy.distance import geodesic
+import geometry
+import path_simplify
+from clock import SYSTEM_CLOCK, Clock
+from histogram import LatencyHistogram
+from log_config import SampledLog
+from metrics import REGISTRY
 from models.driving_instruction import DrivingInstruction
 from models.coordinate import Coordinate
+from models.route_capra import CapraRoute
+from mqtt_connection import MAX_QUEUED_MESSAGES, MqttConnection
+from odometry import OdometryTracker
+from path_cache import PathPayloadCache
+from path_transport import TOPIC_SEND_PATH_CHUNK, PathTransport
+from telemetry import TelemetryHub
+from ticker import DeadlineTicker
 
 # pylint: disable=line-too-long
 TOPIC_SEND_PATH = 'capra/navigation/send_path'
 TOPIC_REMOTE = "capra/remote/direct_velocity"
 TOPIC_SET_MODE = "capra/robot/set_operation_mode"
 
-# Radius of the earth in kilometres
-R = 6371.0
+# Topics on which the robot publishes its state
+TOPIC_STATUS = "capra/robot/status"
+TOPIC_BATTERY = "capra/robot/battery"
+TOPIC_ODOMETRY = "capra/robot/odometry"
+TELEMETRY_TOPICS = [TOPIC_STATUS, TOPIC_BATTERY, TOPIC_ODOMETRY]
+
+# Velocity frames are sent 10 times per second, a lost frame is replaced by the next one.
+# Paths and mode changes are sent once and have to arrive.
+TOPIC_QOS = {
+    TOPIC_SEND_PATH: 1,
+    TOPIC_SEND_PATH_CHUNK: 1,
+    TOPIC_REMOTE: 0,
+    TOPIC_SET_MODE: 1
+}
+
+# Instructions on TOPIC_REMOTE should be sent at 10 Hz
+FREQUENCY = 0.1
+# Ticks this close to the end of a drive (in seconds) end the drive
+TICK_TOLERANCE = 1e-6
+# Closed loop drives are aborted after this many times the expected duration
+ODOMETRY_TIME_LIMIT = 2.0
+# Closed loop drives are aborted when no odometry position arrived for this many seconds
+ODOMETRY_STALL_TIMEOUT = 0.5
+# Number of encoded velocity messages kept in memory
+PAYLOAD_CACHE_SIZE = 128
+# Operation mode in which the robot follows the velocity stream
+DRIVE_MODE = 1
+# Operation mode that stops the robot, and seconds an emergency stop waits for the broker's acknowledgement
+STOP_MODE = 5
+STOP_ACK_TIMEOUT = 1.0
+# Path chunks published before waiting for the broker's acknowledgements, so the client's queue never overflows
+CHUNK_WINDOW = MAX_QUEUED_MESSAGES // 2
+# Seconds a window of path chunks may take to be acknowledged
+CHUNK_ACK_TIMEOUT = 5.0
+# Return codes of messages the client accepted, messages published while disconnected are sent after reconnecting
+QUEUED_RC = (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN)
+
+TICK_JITTER = REGISTRY.histogram("capra_drive_tick_jitter_seconds", "Delay of velocity ticks after their deadline")
+MISSED_DEADLINES = REGISTRY.counter("capra_drive_missed_deadlines_total", "Velocity ticks skipped because a deadline was missed by a full period")
+DRIVES = REGISTRY.counter("capra_drives_total", "Drives finished, by how they ended", ("result",))
+GEOMETRY_SECONDS = REGISTRY.histogram("capra_geometry_seconds", "Time spent calculating distances and angles", ("function",))
+
+
+@functools.lru_cache(maxsize=PAYLOAD_CACHE_SIZE, typed=True)
+def encode_instruction(speed: int, angle: float = 0.0) -> bytes:
+    """
+    Returns the encoded TOPIC_REMOTE message for a speed and angle.
+    Speed and angle are constant during a drive, so every tick after the first is a cache hit.
+    """
+    instruction = DrivingInstruction(speed, angle)
+    return json.dumps(instruction.get_formatted_instruction()).encode("utf-8")
 
 
 class ControlCapra():
     """
-    Class for controlling a Capra Hircus using MQTT Protocol
+    Class for controlling a Capra Hircus using MQTT Protocol.
+    Drives are paced by the clock, a VirtualClock replays them faster than real time.
     """
 
-    def __init__(self, broker_address: str, broker_port: int) -> None:
+    def __init__(self, broker_address: str, broker_port: int, topic_qos: dict | None = None, clock: Clock = SYSTEM_CLOCK) -> None:
         self.broker_address = broker_address
         self.broker_port = broker_port
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.clock = clock
+        self.connection = MqttConnection(
+            broker_address, broker_port, {**TOPIC_QOS, **(topic_qos or {})})
+        # Mode changes and stops use their own connection, so they never wait behind velocity or path messages
+        self.priority = MqttConnection(
+            broker_address, broker_port, {**TOPIC_QOS, **(topic_qos or {})})
+        self.stop_latency = LatencyHistogram()
+        # Set by an emergency stop, velocity messages are dropped until the mode is changed again
+        self.halted = threading.Event()
+        # Number of emergency stops, lets a drive tell whether a stop arrived since it was started
+        self.stop_count = 0
+        self._velocity_lock = threading.Lock()
+        self.telemetry = TelemetryHub(TELEMETRY_TOPICS)
+        self.odometry = OdometryTracker(clock)
+        self.path_cache = PathPayloadCache()
+        for topic in TELEMETRY_TOPICS:
+            self.connection.subscribe(topic, self._on_telemetry)
 
         self.logger = logging.getLogger(__name__)
         logging.basicConfig(level=logging.INFO)
         self.logger.setLevel(logging.INFO)
+        # Velocity frames are sent every tick, in sampled mode they are logged as one summary per interval
+        self.instruction_log = SampledLog(self.logger, "Sent instruction: %s", "Sent instructions", clock=clock)
+
+    @property
+    def client(self) -> mqtt.Client:
+        """The paho MQTT client owned by the connection manager"""
+        return self.connection.client
+
+    @client.setter
+    def client(self, client: mqtt.Client) -> None:
+        self.connection.client = client
+
+    def _on_telemetry(self, message: mqtt.MQTTMessage) -> None:
+        """Stores a telemetry message received from the robot"""
+        self.telemetry.add_message(message.topic, message.payload)
+        if message.topic == TOPIC_ODOMETRY:
+            self.odometry.add_message(message.payload)
 
     def connect_to_robot(self) -> None:
-        """Establishes connection to Capra Hircus"""
+        """Establishes connection to Capra Hircus and starts the MQTT network loop"""
         try:
             self.logger.info("Connecting to robot at %s:%d",
                              self.broker_address, self.broker_port)
-            self.client.connect(self.broker_address, self.broker_port)
+            self.connection.connect()
             self.logger.info("Successfully connected to robot")
         except ConnectionRefusedError:
             self.logger.error("Connection refused")
@@ -47,17 +143,75 @@ class ControlCapra():
         except ConnectionError as e:
             self.logger.error(
                 "An unexpected error occured during connection: %s", e)
+        else:
+            try:
+                self.priority.connect()
+            except (ConnectionError, OSError) as e:
+                self.logger.warning("Priority connection failed, mode changes share the main connection: %s", e)
+
+    def disconnect_from_robot(self) -> None:
+        """Closes the connections to Capra Hircus"""
+        self.connection.disconnect()
+        self.priority.disconnect()
+        self.logger.info("Disconnected from robot")
+
+    def _command_connection(self) -> MqttConnection:
+        """The priority connection when it is up, otherwise the main connection"""
+        return self.priority if self.priority.is_connected else self.connection
 
     def mq_set_mode(self, mode: int) -> None:
-        """Sets the mode of the Capra Hircus."""
+        """Sets the mode of the Capra Hircus. Any mode other than stopped ends an emergency stop."""
         mode_message = '{"operation_mode": %d}' % (mode)
+        if mode != STOP_MODE:
+            self.halted.clear()
         try:
-            self.client.publish(TOPIC_SET_MODE, mode_message)
+            self._command_connection().publish(TOPIC_SET_MODE, mode_message)
             self.logger.info("Mode set to: %d", mode)
         except ConnectionError as e:
             self.logger.error(
                 "An unexpected error occured during setting mode: %s", e)
 
+    def set_drive_mode(self, stop_event: threading.Event | None = None, stops: int | None = None) -> bool:
+        """
+        Sets the drive mode, which ends an emergency stop, unless stop_event is set or another emergency
+        stop happened since stops was read from stop_count. Returns whether the mode was set.
+        Runs under the velocity lock, so a concurrent emergency stop is published after the mode.
+        """
+        with self._velocity_lock:
+            if (stop_event is not None and stop_event.is_set()) or (stops is not None and stops != self.stop_count):
+                self.logger.info("Drive mode not set, the drive was stopped")
+                return False
+            self.mq_set_mode(DRIVE_MODE)
+        return True
+
+    def emergency_stop(self, received_at: float | None = None, timeout: float = STOP_ACK_TIMEOUT) -> dict:
+        """
+        Stops the robot on the priority connection at QoS 1 and waits for the broker's acknowledgement.
+        Velocity messages are dropped from now on, until the mode is changed again.
+        The latency from received_at (clock.monotonic() when the stop was requested) to the
+        acknowledgement is recorded in the stop_latency histogram and returned.
+        """
+        received_at = self.clock.monotonic() if received_at is None else received_at
+        with self._velocity_lock:
+            self.stop_count += 1
+            self.halted.set()
+        acknowledged = False
+        try:
+            info = self._command_connection().publish(
+                TOPIC_SET_MODE, '{"operation_mode": %d}' % STOP_MODE, qos=1)
+            info.wait_for_publish(timeout)
+            acknowledged = bool(info.is_published())
+        except (ConnectionError, RuntimeError, ValueError) as e:
+            self.logger.error("Emergency stop could not be sent: %s", e)
+        latency = self.clock.monotonic() - received_at
+        if acknowledged:
+            self.stop_latency.observe(latency)
+            self.logger.info("Emergency stop acknowledged after %.1f ms", latency * 1000)
+        else:
+            self.stop_latency.observe_failure()
+            self.logger.error("Emergency stop was not acknowledged within %.1f s", timeout)
+        return {"acknowledged": acknowledged, "latency_ms": latency * 1000}
+
     @staticmethod
     def load_path_file(filename: str) -> dict:
         """Loads a Capra Hircus path file in json format."""
@@ -70,89 +224,199 @@ class ControlCapra():
             data = {}
         return data
 
-    def send_path(self, filename: str) -> None:
-        """Sends a path to drive structured in the format as specified on the Capra Hircus documentation."""
-        msg = self.load_path_file(filename)
-        msg_json = json.dumps(msg)
+    def send_path(self, filename: str, tolerance: float | None = None, min_spacing: float = 0.0,
+                  transport: PathTransport | None = None) -> None:
+        """
+        Sends a path to drive structured in the format as specified on the Capra Hircus documentation.
+        With a tolerance (and optionally a minimum node spacing) in metres, nodes that do not change
+        the shape of the path are removed first to keep the message small.
+        A transport sends the path compact, compressed and/or in chunks, see PathTransport.
+        The encoded path is cached until the file changes, so sending it again only costs a publish.
+        """
         try:
-            self.client.publish(TOPIC_SEND_PATH, msg_json)
+            payload = self.path_cache.get_file_payload(filename, tolerance, min_spacing, transport)
+        except FileNotFoundError:
+            self.logger.error("The file %s was not found.", filename)
+            return
+        if self.send_payload(payload, transport):
             self.logger.info("Path sent from file: %s", filename)
-        except ConnectionError as e:
+
+    def send_route(self, route: dict | CapraRoute, tolerance: float | None = None, min_spacing: float = 0.0,
+                   transport: PathTransport | None = None) -> bool:
+        """Sends a path that is already loaded, returns whether it was published"""
+        msg = route.get_formatted_route() if isinstance(route, CapraRoute) else route
+        if tolerance is not None and msg:
+            msg, report = path_simplify.simplify_path(msg, tolerance, min_spacing)
+            self.logger.info("Simplified path from %d to %d nodes, %d to %d bytes",
+                             report["nodes_before"], report["nodes_after"], report["bytes_before"], report["bytes_after"])
+        payload = transport.encode(msg) if transport is not None else self.path_cache.encode(msg)
+        return self.send_payload(payload, transport)
+
+    def send_payload(self, payload: bytes, transport: PathTransport | None = None) -> bool:
+        """
+        Publishes an encoded path, as chunk messages when the transport is chunked. Chunks are published
+        in windows of CHUNK_WINDOW messages, each window is acknowledged by the broker before the next.
+        Returns whether the whole path was published, False when the client refused a message.
+        """
+        try:
+            if transport is not None and transport.chunked:
+                messages = transport.get_messages(payload)
+                window = []
+                for index, message in enumerate(messages):
+                    if len(window) == CHUNK_WINDOW:
+                        deadline = self.clock.monotonic() + CHUNK_ACK_TIMEOUT
+                        for info in window:
+                            info.wait_for_publish(max(0.0, deadline - self.clock.monotonic()))
+                            if not info.is_published():
+                                self.logger.error("Path chunk was not acknowledged within %.1f s", CHUNK_ACK_TIMEOUT)
+                                return False
+                        window = []
+                    info = self.connection.publish(TOPIC_SEND_PATH_CHUNK, message)
+                    if info.rc not in QUEUED_RC:
+                        self.logger.error("Path chunk %d of %d was refused: %s", index + 1, len(messages), mqtt.error_string(info.rc))
+                        return False
+                    window.append(info)
+                self.logger.info("Path sent in %d chunks, %d bytes", len(messages), len(payload))
+            else:
+                info = self.connection.publish(TOPIC_SEND_PATH, payload)
+                if info.rc not in QUEUED_RC:
+                    self.logger.error("Path was refused: %s", mqtt.error_string(info.rc))
+                    return False
+                self.logger.info("Path sent, %d bytes", len(payload))
+            return True
+        except (ConnectionError, RuntimeError, ValueError) as e:
             self.logger.error(
                 "An unexpected error occured during sending path: %s", e)
+            return False
 
     def calculate_distance_angle(self, coord_1: Coordinate, coord_2: Coordinate) -> dict:
-        """Calculates the distance and angle between two coordinates using the Haversine formula."""
-
-        # Convert coordinates to radians
-        lat1 = math.radians(coord_1[0])
-        lon1 = math.radians(coord_1[1])
-        lat2 = math.radians(coord_2[0])
-        lon2 = math.radians(coord_2[1])
-
-        # Calculate deltas
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-
-        # Haversine
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * \
-            math.cos(lat2) * math.sin(dlon/2)**2
-
-        # Angle and distance between coordinates on three dimensional plane
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        distance = R * c
+        """
+        Calculates the distance and angle between two coordinates using the Haversine formula.
+        distance is in kilometres and angle is the central angle in radians between the coordinates.
+        The heading to steer by is initial_bearing, final_bearing is the heading on arrival,
+        both in degrees clockwise from north. Use geometry.compute_legs for many coordinates at once.
+        """
+        with GEOMETRY_SECONDS.labels("compute_legs").time():
+            legs = geometry.compute_legs(coord_1, coord_2)
+        distance = float(legs.lengths[0]) / 1000
 
-        self.logger.info(
-            "Calculated distance: %f and angle: %f between coordinates", distance, c)
-        return {"distance": distance, "angle": c}
+        self.logger.debug(
+            "Calculated distance: %f and bearing: %f between coordinates", distance, legs.bearings[0])
+        return {
+            "distance": distance,
+            "angle": distance * 1000 / geometry.EARTH_RADIUS,
+            "initial_bearing": float(legs.bearings[0]),
+            "final_bearing": float(legs.final_bearings[0])
+        }
 
-    def calculate_distances_from_path(self, filename: str) -> list:
-        """Opens a route file and calculates distance between each node."""
+    def calculate_distances_from_path(self, filename: str, method: str = geometry.ELLIPSOIDAL) -> list:
+        """
+        Opens a route file and calculates distance between each node in metres.
+        All segments are calculated in one vectorised pass, method selects between the
+        ellipsoidal (WGS-84) and the faster haversine (spherical) formula.
+        """
         data = self.load_path_file(filename)
-        distances = []
-        position = "position"
-        nodes = "nodes"
 
         try:
-            for i in range(len(data[nodes])-1):
-                x_1 = data[nodes][i][position]["x"]
-                y_1 = data[nodes][i][position]["y"]
-                coord_1 = (x_1, y_1)
-                x_2 = data[nodes][i+1][position]["x"]
-                y_2 = data[nodes][i+1][position]["y"]
-                coord_2 = (x_2, y_2)
-                distances.append(geodesic(coord_1, coord_2).km * 1000)
-            self.logger.info("Calculated distances from path: %s", filename)
-        except IndexError:
+            positions = geometry.load_positions(data)
+        except (KeyError, TypeError):
             self.logger.error('Invalid data format in json file: %s', filename)
+            return []
 
-        return distances
+        with GEOMETRY_SECONDS.labels("compute_path_geometry").time():
+            path_geometry = geometry.compute_path_geometry(positions, method)
+        self.logger.info("Calculated distances from path: %s", filename)
+        return path_geometry.lengths.tolist()
 
     def send_instruction(self, speed: int, angle: float = 0.0) -> None:
         """
         Used for remotely controlling Capra Hircus using odometry.
         Instructions should be send at a frenquency of 10Hz.
+        Instructions are dropped while the connection is down instead of piling up in the client buffer,
+        and after an emergency stop.
         """
-        instruction = DrivingInstruction(speed, angle)
-        msg_json = json.dumps(instruction.get_formatted_instruction())
+        msg = encode_instruction(speed, angle)
         try:
-            self.client.publish(TOPIC_REMOTE, msg_json)
-            self.logger.info("Sent instruction: %s", msg_json)
+            with self._velocity_lock:
+                if self.halted.is_set():
+                    return
+                self.connection.publish(TOPIC_REMOTE, msg, drop_if_disconnected=True)
+            self.instruction_log(msg, speed=speed, angle=angle)
         except ConnectionError as e:
             self.logger.error(
                 "An unexpected error occured during sending instruction: %s", e)
 
-    def remote_control(self, distance: float = 0.1, speed: int = 1, angle: float = 0.0) -> None:
-        """Instructs a Capra Hircus robot to drive for a given distance, with a given angle and speed."""
-        frequency = 0.1  # 10 Hz
+    def remote_control(self, distance: float = 0.1, speed: int = 1, angle: float = 0.0, stop_event: threading.Event | None = None, odometry: bool = False, on_progress: Callable[[float], None] | None = None) -> dict:
+        """
+        Instructs a Capra Hircus robot to drive for a given distance, with a given angle and speed.
+        Instructions are paced on absolute 10 Hz deadlines and the distance covered is computed
+        from the time actually elapsed. With odometry, the distance covered is measured from the
+        odometry topic instead, and the drive is aborted when no position arrived for
+        ODOMETRY_STALL_TIMEOUT seconds or when it takes ODOMETRY_TIME_LIMIT times longer than
+        expected. Setting stop_event interrupts the drive before the next instruction is sent.
+        on_progress is called with the distance covered after every instruction.
+        Returns the distance covered together with the ticker statistics.
+        """
+        ticker = DeadlineTicker(FREQUENCY, self.clock)
+        progress_log = SampledLog(self.logger, "Distance covered: %f/%f", "Drive progress", clock=self.clock)
         distance_covered = 0.0
+        time_limit_reached = False
+        odometry_stalled = False
 
         # Get absolute value of speed to handle negative speed values
-        distance_per_instruction = abs(speed) * frequency
+        duration = distance / abs(speed)
+        if odometry:
+            self.odometry.reset()
+            duration *= ODOMETRY_TIME_LIMIT
+        end = ticker.start() + duration - TICK_TOLERANCE
+        self.logger.info("Drive started: %f m at speed %d, angle %f%s",
+                         distance, speed, angle, " with odometry" if odometry else "")
 
-        while distance_covered < distance:
+        while stop_event is None or not stop_event.is_set():
             self.send_instruction(speed, angle)
-            time.sleep(frequency)
-            self.logger.info("Distance covered: %f/%f",
-                             distance_covered, distance)
-            distance_covered += distance_per_instruction
+            missed_deadlines = ticker.missed_deadlines
+            if ticker.wait(stop_event):
+                self.logger.info("Drive interrupted at %f/%f",
+                                 distance_covered, distance)
+                break
+            TICK_JITTER.observe(ticker.last_jitter)
+            if ticker.missed_deadlines > missed_deadlines:
+                MISSED_DEADLINES.inc(ticker.missed_deadlines - missed_deadlines)
+            if odometry:
+                distance_covered = self.odometry.travelled
+                last_position = self.odometry.last_update if self.odometry.updates else None
+                odometry_stalled = ticker.last_tick - max(last_position or 0.0, ticker.started_at) >= ODOMETRY_STALL_TIMEOUT - TICK_TOLERANCE
+            else:
+                distance_covered = abs(speed) * ticker.elapsed
+            progress_log(distance_covered, distance, distance_covered=distance_covered)
+            if on_progress is not None:
+                on_progress(distance_covered)
+            if odometry and distance_covered >= distance:
+                break
+            if odometry_stalled or ticker.last_tick >= end:
+                time_limit_reached = odometry
+                break
+
+        self.instruction_log.flush()
+        progress_log.flush()
+        if odometry_stalled:
+            self.logger.error("Drive aborted, no odometry for %.1f seconds at %f/%f",
+                              ODOMETRY_STALL_TIMEOUT, distance_covered, distance)
+            DRIVES.labels("time_limit").inc()
+        elif time_limit_reached:
+            self.logger.error("Drive aborted, odometry reported %f/%f after %.1f seconds",
+                              distance_covered, distance, ticker.elapsed)
+            DRIVES.labels("time_limit").inc()
+        elif stop_event is not None and stop_event.is_set():
+            DRIVES.labels("interrupted").inc()
+        else:
+            DRIVES.labels("completed").inc()
+
+        report = ticker.get_stats()
+        report["distance_covered"] = distance_covered
+        report["odometry"] = odometry
+        report["time_limit_reached"] = time_limit_reached
+        report["odometry_stalled"] = odometry_stalled
+        self.logger.info("Drive finished: %d ticks, %d missed deadlines, mean jitter %.2f ms, max jitter %.2f ms",
+                         report["ticks"], report["missed_deadlines"], report["mean_jitter_ms"], report["max_jitter_ms"])
+        return report
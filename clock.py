@@ -0,0 +1,120 @@
+"""Module containing the clocks that pace drives, the real one and a virtual one for tests and simulations"""
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable
+
+# pylint: disable=line-too-long
+
+
+class Clock():
+    """
+    Real time. monotonic() measures intervals and time() returns timestamps, sleep and wait block the thread.
+    Calling the clock returns monotonic(), so it can be used wherever a time function is expected.
+    """
+
+    def __init__(self, monotonic: Callable[[], float] = time.monotonic) -> None:
+        self._monotonic = monotonic
+
+    def __call__(self) -> float:
+        return self.monotonic()
+
+    def monotonic(self) -> float:
+        """Returns seconds of a clock that never goes backwards"""
+        return self._monotonic()
+
+    def time(self) -> float:
+        """Returns the current time as seconds since the epoch"""
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        """Blocks for a number of seconds"""
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def wait(self, event: threading.Event | None, timeout: float) -> bool:
+        """Blocks until the event is set or the timeout passed, returns True when the event is set"""
+        if event is None:
+            self.sleep(timeout)
+            return False
+        return event.wait(timeout)
+
+
+# Clock used when no clock is given
+SYSTEM_CLOCK = Clock()
+
+
+class VirtualClock(Clock):
+    """
+    Simulated time that only moves when a thread sleeps or waits on the clock, or calls advance,
+    so an hour of driving replays in milliseconds. Callbacks scheduled with call_at and call_every
+    run in time order on the thread that moves the clock, at their due time. One thread moves the
+    clock at a time; waiting returns early when a callback sets the event.
+    """
+
+    def __init__(self, start: float = 0.0, epoch: float | None = None) -> None:
+        super().__init__()
+        self._now = start
+        self.epoch = time.time() - start if epoch is None else epoch
+        self._timers: list[tuple[float, int, Callable[[], None], float | None]] = []
+        self._cancelled: set[int] = set()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._advancing = threading.RLock()
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def time(self) -> float:
+        return self.epoch + self._now
+
+    def sleep(self, seconds: float) -> None:
+        self._advance_to(self._now + max(0.0, seconds))
+
+    def wait(self, event: threading.Event | None, timeout: float) -> bool:
+        return self._advance_to(self._now + max(0.0, timeout), event)
+
+    def advance(self, seconds: float) -> None:
+        """Moves the clock forward, running the callbacks that become due"""
+        self._advance_to(self._now + seconds)
+
+    def call_at(self, when: float, callback: Callable[[], None]) -> int:
+        """Runs a callback once the clock reaches when, returns an id for cancelling it"""
+        return self._schedule(when, callback, None)
+
+    def call_every(self, period: float, callback: Callable[[], None]) -> int:
+        """Runs a callback every period seconds from now on, returns an id for cancelling it"""
+        if period <= 0:
+            raise ValueError("period must be positive")
+        return self._schedule(self._now + period, callback, period)
+
+    def cancel(self, timer_id: int) -> None:
+        """Cancels a scheduled callback"""
+        with self._lock:
+            if any(timer[1] == timer_id for timer in self._timers):
+                self._cancelled.add(timer_id)
+
+    def _schedule(self, when: float, callback: Callable[[], None], period: float | None) -> int:
+        timer_id = next(self._ids)
+        with self._lock:
+            heapq.heappush(self._timers, (when, timer_id, callback, period))
+        return timer_id
+
+    def _advance_to(self, target: float, event: threading.Event | None = None) -> bool:
+        """Runs the callbacks due up to target and moves the clock there, stops early when the event is set"""
+        with self._advancing:
+            while event is None or not event.is_set():
+                with self._lock:
+                    if not self._timers or self._timers[0][0] > target:
+                        self._now = max(self._now, target)
+                        break
+                    when, timer_id, callback, period = heapq.heappop(self._timers)
+                    self._now = max(self._now, when)
+                    if timer_id in self._cancelled:
+                        self._cancelled.discard(timer_id)
+                        continue
+                    if period is not None:
+                        heapq.heappush(self._timers, (when + period, timer_id, callback, period))
+                callback()
+        return event is not None and event.is_set()
@@ -0,0 +1,112 @@
+"""Module containing the database engine and session handling of the Capra API"""
+import os
+import time
+from typing import Iterator
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from metrics import REGISTRY
+
+# pylint: disable=line-too-long
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./capra_db.db")
+
+# Connections kept open by the pool, and extra connections allowed under load
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+# Milliseconds SQLite waits for a lock held by another connection
+BUSY_TIMEOUT = 5000
+
+QUERY_SECONDS = REGISTRY.histogram("capra_db_query_seconds", "Time spent executing SQL statements, by statement type", ("statement",))
+
+Base = declarative_base()
+
+
+def create_database_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    """
+    Creates the database engine. SQLite connections are pooled and shared between threads,
+    and file databases use write-ahead logging so reads do not block on writes.
+    """
+    if not url.startswith("sqlite"):
+        database_engine = create_engine(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_pre_ping=True)
+        instrument_engine(database_engine)
+        return database_engine
+
+    in_memory = url in ("sqlite://", "sqlite:///:memory:")
+    if in_memory:
+        # Every connection to an in-memory database is a new database, so share one connection
+        database_engine = create_engine(
+            url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        database_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            poolclass=QueuePool,
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW
+        )
+
+    @event.listens_for(database_engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT}")
+        cursor.close()
+
+    instrument_engine(database_engine)
+    return database_engine
+
+
+def instrument_engine(database_engine) -> None:
+    """Observes the duration of every statement executed by the engine in QUERY_SECONDS, labelled by its first keyword"""
+
+    @event.listens_for(database_engine, "before_cursor_execute")
+    def start_query(connection, _cursor, _statement, _parameters, _context, _executemany):
+        connection.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(database_engine, "after_cursor_execute")
+    def end_query(connection, _cursor, statement, _parameters, _context, _executemany):
+        started_at = connection.info["query_started_at"].pop()
+        keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        QUERY_SECONDS.labels(keyword).observe(time.perf_counter() - started_at)
+
+    @event.listens_for(database_engine, "handle_error")
+    def failed_query(context):
+        started = context.connection.info.get("query_started_at") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+engine = create_database_engine()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def get_db() -> Iterator[Session]:
+    """Dependency providing a database session that is closed after the request"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def upgrade_schema(database_engine, base=Base) -> None:
+    """
+    Creates missing tables, and adds columns and indexes that were introduced after a table
+    was created. New columns have to be nullable, existing rows get NULL.
+    """
+    base.metadata.create_all(bind=database_engine)
+    inspector = inspect(database_engine)
+    for table in base.metadata.sorted_tables:
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        with database_engine.begin() as connection:
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=database_engine.dialect)
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}')
+        for index in table.indexes:
+            index.create(bind=database_engine, checkfirst=True)
@@ -0,0 +1,193 @@
+"""Module containing a background scheduler for driving instructions"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from capra_control import ControlCapra
+from clock import SYSTEM_CLOCK, Clock
+
+# pylint: disable=line-too-long
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_CANCELLED = "cancelled"
+JOB_FAILED = "failed"
+
+# Number of finished jobs kept around for status lookups
+MAX_FINISHED_JOBS = 1000
+
+
+@dataclass
+class DriveJob:
+    """Class for defining a driving job executed by the DriveScheduler"""
+
+    instruction_id: int
+    distance: float
+    speed: int
+    angle: float = 0.0
+    odometry: bool = False
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = JOB_QUEUED
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    report: dict | None = None
+    # Metres covered so far, updated by the controller while the job runs
+    distance_covered: float = 0.0
+    cancel_event: threading.Event = field(
+        default_factory=threading.Event, repr=False)
+    # Set once the job has finished, whether it completed, was cancelled or failed
+    done: threading.Event = field(
+        default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        """Returns True when the job will not run (anymore)"""
+        return self.status in (JOB_COMPLETED, JOB_CANCELLED, JOB_FAILED)
+
+    def set_progress(self, distance_covered: float) -> None:
+        """Stores the metres covered so far while the job runs"""
+        self.distance_covered = distance_covered
+
+    def get_formatted_job(self) -> dict:
+        """Returns the job status as a dict"""
+        return {
+            "job_id": self.job_id,
+            "instruction_id": self.instruction_id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "distance_covered": self.distance_covered,
+            "report": self.report
+        }
+
+
+class DriveScheduler():
+    """
+    Runs driving jobs one at a time on a dedicated worker thread,
+    so the 10 Hz velocity stream never blocks the API. Job timestamps are taken from the clock.
+    """
+
+    def __init__(self, controller: ControlCapra, name: str = "drive-scheduler", clock: Clock = SYSTEM_CLOCK) -> None:
+        self.controller = controller
+        self.name = name
+        self.clock = clock
+        self.jobs: OrderedDict[str, DriveJob] = OrderedDict()
+        self.current_job: DriveJob | None = None
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self) -> None:
+        """Starts the worker thread if it is not running yet"""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run, name=self.name, daemon=True)
+            self._worker.start()
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Cancels all jobs and stops the worker thread"""
+        self.cancel_all()
+        self._queue.put(None)
+        if self._worker is not None:
+            self._worker.join(timeout)
+            self._worker = None
+
+    def submit(self, instruction_id: int, distance: float, speed: int, angle: float = 0.0, odometry: bool = False) -> DriveJob:
+        """Queues a driving instruction and returns the created job, with odometry the drive is closed loop"""
+        return self.submit_many([DriveJob(instruction_id, distance, speed, angle, odometry)])[0]
+
+    def submit_many(self, jobs: list[DriveJob]) -> list[DriveJob]:
+        """Queues jobs to be driven one after another, no other job is queued in between"""
+        with self._lock:
+            for job in jobs:
+                self.jobs[job.job_id] = job
+                self._queue.put(job)
+            self._trim_jobs()
+        self.start()
+        for job in jobs:
+            self.logger.info("Queued drive job %s for instruction %d",
+                             job.job_id, job.instruction_id)
+        return jobs
+
+    def get_job(self, job_id: str) -> DriveJob | None:
+        """Returns a job by its id, or None when it is unknown"""
+        return self.jobs.get(job_id)
+
+    def cancel_all(self) -> int:
+        """Cancels the running job and every queued job, returns the number of cancelled jobs"""
+        cancelled = 0
+        with self._lock:
+            for job in self.jobs.values():
+                if not job.finished:
+                    job.cancel_event.set()
+                    cancelled += 1
+        if cancelled:
+            self.logger.info("Cancelled %d drive job(s)", cancelled)
+        return cancelled
+
+    def _trim_jobs(self) -> None:
+        """Forgets the oldest finished jobs once MAX_FINISHED_JOBS is exceeded"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def _run(self) -> None:
+        """Worker loop executing queued jobs in order"""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            self._execute(job)
+
+    def _execute(self, job: DriveJob) -> None:
+        """Executes a single job on the worker thread"""
+        # An emergency stop from now on cancels the job instead of being lifted by its drive mode
+        stops = self.controller.stop_count
+        if job.cancel_event.is_set():
+            job.status = JOB_CANCELLED
+            job.finished_at = self.clock.time()
+            job.done.set()
+            return
+
+        job.status = JOB_RUNNING
+        job.started_at = self.clock.time()
+        self.current_job = job
+        try:
+            if self.controller.set_drive_mode(job.cancel_event, stops):
+                job.report = self.controller.remote_control(
+                    job.distance, job.speed, job.angle, stop_event=job.cancel_event, odometry=job.odometry, on_progress=job.set_progress)
+            else:
+                job.cancel_event.set()
+            if job.cancel_event.is_set():
+                job.status = JOB_CANCELLED
+            elif job.report.get("odometry_stalled"):
+                # A closed-loop drive without odometry does not know how far it drove
+                job.status = JOB_FAILED
+                job.error = f"Odometry stopped reporting at {job.report['distance_covered']:.2f} of {job.distance:.2f} m"
+            elif job.report.get("time_limit_reached"):
+                # A closed-loop drive that ran out of time did not cover its distance
+                job.status = JOB_FAILED
+                job.error = f"Odometry reported {job.report['distance_covered']:.2f} of {job.distance:.2f} m within the time limit"
+            else:
+                job.status = JOB_COMPLETED
+            job.distance_covered = (job.report or {}).get("distance_covered", job.distance_covered)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            job.status = JOB_FAILED
+            job.error = str(e)
+            self.logger.error("Drive job %s failed: %s", job.job_id, e)
+        finally:
+            job.finished_at = self.clock.time()
+            self.current_job = None
+            job.done.set()
+        self.logger.info("Drive job %s %s", job.job_id, job.status)
@@ -0,0 +1,158 @@
+"""Module containing the registry of Capra Hircus robots controlled by the API"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable
+from capra_control import ControlCapra
+from clock import SYSTEM_CLOCK, Clock
+from drive_scheduler import DriveScheduler
+from histogram import LATENCY_BUCKETS_MS
+from metrics import Counter, Gauge, Histogram, Metric
+
+# pylint: disable=line-too-long
+
+# Seconds a command dispatched to the whole fleet waits for each robot
+DISPATCH_TIMEOUT = 5.0
+# Threads used for dispatching commands to several robots at once
+MAX_DISPATCH_WORKERS = 16
+
+
+@dataclass
+class Robot:
+    """Class for defining a robot of the fleet, with its own MQTT connection and drive scheduler"""
+
+    robot_id: str
+    controller: ControlCapra
+    scheduler: DriveScheduler
+
+    def get_formatted_robot(self) -> dict:
+        """Returns the robot and the state of its connection"""
+        return {
+            "robot_id": self.robot_id,
+            "broker_address": self.controller.broker_address,
+            "broker_port": self.controller.broker_port,
+            "connection": self.controller.connection.get_status()["state"],
+            "current_job": self.scheduler.current_job.job_id if self.scheduler.current_job else None
+        }
+
+
+def parse_fleet(spec: str) -> dict[str, tuple[str, int]]:
+    """
+    Parses a fleet description like "hircus-1=10.46.28.1:1883,hircus-2=10.46.28.2",
+    returns the broker address and port of every robot id. The port defaults to 1883.
+    """
+    robots = {}
+    for entry in filter(None, (entry.strip() for entry in spec.split(","))):
+        robot_id, _, address = entry.partition("=")
+        host, _, port = address.partition(":")
+        if not robot_id or not host:
+            raise ValueError(f"Invalid robot in fleet description: {entry}")
+        robots[robot_id.strip()] = (host.strip(), int(port) if port else 1883)
+    return robots
+
+
+class FleetRegistry():
+    """
+    Keeps a ControlCapra and DriveScheduler for every robot. Each robot has its own MQTT connection
+    and drive worker thread, so a slow or unreachable robot never delays commands to the others.
+    Commands for several robots are dispatched concurrently on a thread pool.
+    All robots of the fleet share one clock.
+    """
+
+    def __init__(self, default_robot_id: str | None = None, clock: Clock = SYSTEM_CLOCK) -> None:
+        self.default_robot_id = default_robot_id
+        self.clock = clock
+        self.robots: dict[str, Robot] = {}
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self.logger = logging.getLogger(__name__)
+
+    def register(self, robot_id: str, broker_address: str, broker_port: int, topic_qos: dict | None = None) -> Robot:
+        """Adds a robot to the fleet, the first robot is the default one"""
+        controller = ControlCapra(broker_address, broker_port, topic_qos, self.clock)
+        robot = Robot(robot_id, controller, DriveScheduler(controller, name=f"drive-scheduler-{robot_id}", clock=self.clock))
+        with self._lock:
+            if robot_id in self.robots:
+                raise ValueError(f"Robot {robot_id} is already registered")
+            self.robots[robot_id] = robot
+            if self.default_robot_id is None:
+                self.default_robot_id = robot_id
+        self.logger.info("Registered robot %s at %s:%d", robot_id, broker_address, broker_port)
+        return robot
+
+    def unregister(self, robot_id: str) -> None:
+        """Stops a robot's drive scheduler, disconnects it and removes it from the fleet"""
+        with self._lock:
+            robot = self.robots.pop(robot_id)
+        robot.scheduler.shutdown()
+        robot.controller.disconnect_from_robot()
+
+    def get(self, robot_id: str | None = None) -> Robot:
+        """Returns a robot by id, or the default robot. Raises KeyError for an unknown robot"""
+        return self.robots[robot_id or self.default_robot_id]
+
+    @property
+    def default(self) -> Robot:
+        """The robot used by requests that do not name a robot"""
+        return self.get()
+
+    def start(self) -> None:
+        """Starts the drive scheduler of every robot"""
+        for robot in list(self.robots.values()):
+            robot.scheduler.start()
+
+    def shutdown(self) -> None:
+        """Stops every drive scheduler and closes every robot connection"""
+        self.dispatch(lambda robot: robot.scheduler.shutdown())
+        self.dispatch(lambda robot: robot.controller.disconnect_from_robot())
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def get_metrics(self) -> list[Metric]:
+        """Returns the connection, drive queue, emergency stop and path cache metrics of every robot"""
+        connected = Gauge("capra_robot_connected", "Whether the MQTT connection to the robot is up", ("robot",))
+        disconnects = Counter("capra_mqtt_disconnects_total", "Connections to the robot that were lost", ("robot",))
+        jobs = Gauge("capra_drive_jobs_pending", "Drive jobs queued or running", ("robot",))
+        stop_latency = Histogram("capra_stop_latency_seconds", "Time from a stop request to the broker's acknowledgement", ("robot",), LATENCY_BUCKETS_MS)
+        cache_hits = Counter("capra_path_cache_hits_total", "Path payloads served from the cache", ("robot",))
+        cache_misses = Counter("capra_path_cache_misses_total", "Path payloads that had to be encoded", ("robot",))
+        cache_bytes = Gauge("capra_path_cache_bytes", "Size of the cached path payloads", ("robot",))
+        for robot in list(self.robots.values()):
+            controller = robot.controller
+            connected.labels(robot.robot_id).set(1 if controller.connection.is_connected else 0)
+            disconnects.labels(robot.robot_id).inc(controller.connection.disconnects)
+            jobs.labels(robot.robot_id).set(sum(not job.finished for job in list(robot.scheduler.jobs.values())))
+            stop_latency.attach(controller.stop_latency, robot.robot_id)
+            cache_stats = controller.path_cache.get_stats()
+            cache_hits.labels(robot.robot_id).inc(cache_stats["hits"])
+            cache_misses.labels(robot.robot_id).inc(cache_stats["misses"])
+            cache_bytes.labels(robot.robot_id).set(cache_stats["bytes"])
+        return [connected, disconnects, jobs, stop_latency, cache_hits, cache_misses, cache_bytes]
+
+    def dispatch(self, command: Callable[[Robot], object], robot_ids: list[str] | None = None,
+                 timeout: float = DISPATCH_TIMEOUT) -> dict[str, dict]:
+        """
+        Runs a command for several robots (all by default) at the same time.
+        Returns per robot id whether it succeeded, its result or error; robots that did not
+        finish within the timeout are reported as pending and keep running in the background.
+        """
+        robots = [self.get(robot_id) for robot_id in robot_ids] if robot_ids is not None else list(self.robots.values())
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(MAX_DISPATCH_WORKERS, thread_name_prefix="fleet-dispatch")
+            executor = self._executor
+        futures = {executor.submit(command, robot): robot.robot_id for robot in robots}
+        wait(futures, timeout)
+        results = {}
+        for future, robot_id in futures.items():
+            if not future.done():
+                self.logger.warning("Command for robot %s did not finish within %.1f s", robot_id, timeout)
+                results[robot_id] = {"status": "pending"}
+            elif future.exception() is not None:
+                self.logger.error("Command for robot %s failed: %s", robot_id, future.exception())
+                results[robot_id] = {"status": "failed", "error": str(future.exception())}
+            else:
+                results[robot_id] = {"status": "ok", "result": future.result()}
+        return results
@@ -0,0 +1,166 @@
+"""Module containing vectorised geometry for Capra Hircus paths"""
+from dataclasses import dataclass
+import numpy as np
+
+# pylint: disable=line-too-long
+
+# Mean radius of the earth in metres, used by the haversine formula
+EARTH_RADIUS = 6371000.0
+# WGS-84 ellipsoid, used by the ellipsoidal (Vincenty) formula
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+VINCENTY_TOLERANCE = 1e-12
+VINCENTY_MAX_ITERATIONS = 200
+
+HAVERSINE = "haversine"
+ELLIPSOIDAL = "ellipsoidal"
+
+
+@dataclass
+class LegGeometry:
+    """
+    Class for defining the geometry of legs between pairs of coordinates.
+    Bearings are in degrees clockwise from north. turn_angles[i] is the turn in degrees
+    from leg i to leg i + 1, positive to the left (counterclockwise) like the robot's angle.
+    """
+
+    lengths: np.ndarray
+    bearings: np.ndarray
+    final_bearings: np.ndarray
+    turn_angles: np.ndarray
+
+
+@dataclass
+class PathGeometry(LegGeometry):
+    """Class for defining the geometry of a path, segment i runs from node i to node i + 1"""
+
+    positions: np.ndarray
+    cumulative: np.ndarray
+
+    @property
+    def total_length(self) -> float:
+        """Length of the whole path in metres"""
+        return float(self.cumulative[-1]) if len(self.cumulative) else 0.0
+
+
+def load_positions(data: dict) -> np.ndarray:
+    """
+    Returns the node positions of a Capra Hircus path as a contiguous (n, 2) array
+    of latitude (x) and longitude (y) in degrees.
+    """
+    nodes = data.get("nodes", [])
+    positions = np.empty((len(nodes), 2), dtype=np.float64)
+    for i, node in enumerate(nodes):
+        position = node["position"]
+        positions[i, 0] = position["x"]
+        positions[i, 1] = position["y"]
+    return positions
+
+
+def haversine_distances(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Returns the great-circle distances in metres between arrays of (lat, lon) degrees"""
+    lat1, lon1 = np.radians(start[..., 0]), np.radians(start[..., 1])
+    lat2, lon2 = np.radians(end[..., 0]), np.radians(end[..., 1])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def ellipsoidal_distances(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """
+    Returns the distances in metres on the WGS-84 ellipsoid between arrays of (lat, lon) degrees,
+    using Vincenty's inverse formula. Agrees with geopy's geodesic to well below a millimetre,
+    except for nearly antipodal points, which do not occur on a driving path.
+    """
+    u1 = np.arctan((1 - WGS84_F) * np.tan(np.radians(start[..., 0])))
+    u2 = np.arctan((1 - WGS84_F) * np.tan(np.radians(end[..., 0])))
+    lon_delta = np.radians(end[..., 1] - start[..., 1])
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    lam = lon_delta.copy()
+    active = np.ones(lam.shape, dtype=bool)
+    for _ in range(VINCENTY_MAX_ITERATIONS):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+        c = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+        lam_next = lon_delta + (1 - c) * WGS84_F * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+        converged = np.abs(lam_next - lam) < VINCENTY_TOLERANCE
+        lam = np.where(active, lam_next, lam)
+        active &= ~converged
+        if not active.any():
+            break
+
+    u_squared = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    a = 1 + u_squared / 16384 * (4096 + u_squared * (-768 + u_squared * (320 - 175 * u_squared)))
+    b = u_squared / 1024 * (256 + u_squared * (-128 + u_squared * (74 - 47 * u_squared)))
+    delta_sigma = b * sin_sigma * (cos_2sigma_m + b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    return WGS84_B * a * (sigma - delta_sigma)
+
+
+def initial_bearings(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Returns the initial great-circle bearings in degrees clockwise from north, in [0, 360)"""
+    lat1, lat2 = np.radians(start[..., 0]), np.radians(end[..., 0])
+    lon_delta = np.radians(end[..., 1] - start[..., 1])
+    y = np.sin(lon_delta) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon_delta)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def final_bearings(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Returns the great-circle bearings on arrival in degrees clockwise from north, in [0, 360)"""
+    return (initial_bearings(end, start) + 180) % 360
+
+
+def turn_angles(arrival_bearings: np.ndarray, departure_bearings: np.ndarray) -> np.ndarray:
+    """Returns the turn in degrees between bearings, in (-180, 180] and positive to the left"""
+    return 180 - (departure_bearings - arrival_bearings + 180) % 360
+
+
+def distances(start: np.ndarray, end: np.ndarray, method: str = HAVERSINE) -> np.ndarray:
+    """Returns the distances in metres between arrays of (lat, lon) degrees"""
+    if method == HAVERSINE:
+        return haversine_distances(start, end)
+    if method == ELLIPSOIDAL:
+        return ellipsoidal_distances(start, end)
+    raise ValueError(f"Unknown distance method: {method}")
+
+
+def compute_legs(start: np.ndarray, end: np.ndarray, method: str = HAVERSINE) -> LegGeometry:
+    """
+    Computes distance, initial and final bearing of every (start, end) pair of (lat, lon) degrees
+    and the turn between consecutive legs in one vectorised pass.
+    """
+    start = np.ascontiguousarray(start, dtype=np.float64).reshape(-1, 2)
+    end = np.ascontiguousarray(end, dtype=np.float64).reshape(-1, 2)
+    departures = initial_bearings(start, end)
+    arrivals = final_bearings(start, end)
+    return LegGeometry(
+        lengths=distances(start, end, method),
+        bearings=departures,
+        final_bearings=arrivals,
+        turn_angles=turn_angles(arrivals[:-1], departures[1:])
+    )
+
+
+def compute_path_geometry(positions: np.ndarray, method: str = HAVERSINE) -> PathGeometry:
+    """Computes segment lengths, bearings, turns and cumulative distance of a path in one pass"""
+    positions = np.ascontiguousarray(positions, dtype=np.float64).reshape(-1, 2)
+    legs = compute_legs(positions[:-1], positions[1:], method)
+    return PathGeometry(
+        lengths=legs.lengths,
+        bearings=legs.bearings,
+        final_bearings=legs.final_bearings,
+        turn_angles=legs.turn_angles,
+        positions=positions,
+        cumulative=np.cumsum(legs.lengths)
+    )
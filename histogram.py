@@ -0,0 +1,68 @@
+"""Module containing a fixed-bucket latency histogram"""
+import bisect
+import threading
+
+# pylint: disable=line-too-long
+
+# Upper bounds of the buckets in milliseconds, slower observations go in an overflow bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class LatencyHistogram():
+    """
+    Counts latencies in fixed buckets, so recording takes constant time and memory.
+    Percentiles are reported as the upper bound of the bucket they fall in.
+    """
+
+    def __init__(self, buckets_ms: tuple = LATENCY_BUCKETS_MS) -> None:
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        """Records a latency in seconds"""
+        milliseconds = seconds * 1000
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets_ms, milliseconds)] += 1
+            self.count += 1
+            self.total_ms += milliseconds
+            self.max_ms = max(self.max_ms, milliseconds)
+
+    def observe_failure(self) -> None:
+        """Records an operation that did not complete, it has no latency"""
+        with self._lock:
+            self.failures += 1
+
+    def percentile(self, fraction: float) -> float | None:
+        """Returns the bucket bound below which the fraction of latencies falls, None without observations"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = fraction * self.count
+            seen = 0
+            for bound, count in zip(self.buckets_ms, self.counts):
+                seen += count
+                if seen >= rank:
+                    return float(bound)
+            return self.max_ms
+
+    def get_stats(self) -> dict:
+        """Returns count, failures, mean, max, percentiles and bucket counts in milliseconds"""
+        stats = {
+            "count": self.count,
+            "failures": self.failures,
+            "mean_ms": self.total_ms / self.count if self.count else None,
+            "max_ms": self.max_ms if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99)
+        }
+        with self._lock:
+            buckets = {f"le_{bound}": count for bound, count in zip(self.buckets_ms, self.counts)}
+            buckets["le_inf"] = self.counts[-1]
+        stats["buckets"] = buckets
+        return stats
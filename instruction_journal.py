@@ -0,0 +1,215 @@
+"""Module containing a write-behind journal for storing instructions"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+# pylint: disable=line-too-long
+
+# Records written per transaction, a full batch is flushed right away
+BATCH_SIZE = 100
+# Seconds a record waits at most before it is flushed
+FLUSH_INTERVAL = 0.5
+# Records kept in memory at most, appending to a full journal flushes on the caller's thread, or is refused while the database fails
+MAX_PENDING = 1000
+
+
+class JournalFullError(RuntimeError):
+    """Raised when records are appended to a full journal while writing to the database fails"""
+
+
+class JournalWriteError(RuntimeError):
+    """Raised by flush when records could not be written and were quarantined"""
+
+
+def is_transient(error: Exception) -> bool:
+    """Returns whether a write failed because of the database, like a lock or a lost connection, rather than the rows"""
+    return isinstance(error, (OperationalError, PoolTimeoutError))
+
+
+class InstructionJournal():
+    """
+    Accepts records in memory and writes them to the database in batched transactions
+    from a background thread, so callers do not wait for disk I/O.
+    Ids are assigned by the journal when a record is appended, so the journal has to be
+    the only writer of the table. At most MAX_PENDING records or FLUSH_INTERVAL seconds
+    of records are lost when the process is killed; shutdown() flushes everything.
+    Rows that cannot be written, like one violating a constraint, are quarantined instead of being
+    retried forever. While the database fails, nothing is written on the caller's thread and
+    appending to a full journal raises JournalFullError.
+    """
+
+    def __init__(self, session_factory, model, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, max_pending: int = MAX_PENDING) -> None:
+        self.session_factory = session_factory
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending: OrderedDict[int, dict] = OrderedDict()
+        self.flushed = 0
+        # Records that could not be written, the most recent max_pending of them
+        self.quarantined: list[dict] = []
+        self.quarantined_count = 0
+        # Set when the last flush failed because of the database, cleared by the next successful flush
+        self.failing = False
+        self._last_id: int | None = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopping = False
+        self._worker: threading.Thread | None = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self) -> None:
+        """Starts the background flush thread if it is not running yet"""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stopping = False
+            self._worker = threading.Thread(
+                target=self._run, name="instruction-journal", daemon=True)
+            self._worker.start()
+
+    def shutdown(self) -> None:
+        """Stops the background thread and writes all pending records"""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        try:
+            self.flush()
+        except JournalWriteError:
+            pass  # Logged by flush, the other records were written
+
+    def append(self, values: dict) -> dict:
+        """Assigns an id to a record and queues it for writing, returns the record"""
+        return self.append_many([values])[0]
+
+    def append_many(self, values: list[dict]) -> list[dict]:
+        """
+        Assigns consecutive ids to records and queues them for writing in the same batch.
+        Raises JournalFullError when the journal is full and the database is failing.
+        """
+        if self._last_id is None:
+            self._load_last_id()
+        created_at = datetime.utcnow()
+        with self._lock:
+            if self.failing and len(self.pending) + len(values) > self.max_pending:
+                raise JournalFullError(f"{len(self.pending)} records are waiting to be written and the database is failing")
+            records = []
+            for record_values in values:
+                self._last_id += 1
+                record = {**record_values, "id": self._last_id, "created_at": created_at}
+                self.pending[record["id"]] = record
+                records.append(record)
+            pending = len(self.pending)
+            if pending >= self.batch_size:
+                self._wakeup.notify()
+        # A failing database is only retried by the background thread
+        if pending >= self.max_pending and not self.failing:
+            try:
+                self.flush()
+            except JournalWriteError:
+                pass  # Logged by flush
+        self.start()
+        return records
+
+    def get(self, record_id: int) -> dict | None:
+        """Returns a record that has not been written yet"""
+        return self.pending.get(record_id)
+
+    def flush(self) -> int:
+        """
+        Writes all pending records in one transaction, returns the number of records written.
+        When the rows of the batch are the problem, the records are written one at a time and those
+        that fail are quarantined, then JournalWriteError is raised. When the database is the problem,
+        like a lock, the records stay pending for the next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                records = list(self.pending.values())
+            if not records:
+                return 0
+            written, quarantined, error = records, [], None
+            try:
+                self._write(records)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if is_transient(e):
+                    self._set_failing(len(records), e)
+                    return 0
+                written, quarantined, error = self._write_each(records)
+            else:
+                self.failing = False
+            with self._lock:
+                for record in written + quarantined:
+                    del self.pending[record["id"]]
+                self.quarantined = (self.quarantined + quarantined)[-self.max_pending:]
+                self.quarantined_count += len(quarantined)
+            self.flushed += len(written)
+        if quarantined:
+            self.logger.error("Quarantined %d records that could not be written, ids %s: %s",
+                              len(quarantined), ", ".join(str(record["id"]) for record in quarantined[:10]), error)
+            raise JournalWriteError(f"{len(quarantined)} records could not be written: {error}") from error
+        return len(written)
+
+    def _write(self, records: list[dict]) -> None:
+        """Inserts records in one transaction"""
+        # Every row of a batched insert needs the same columns, missing values are NULL
+        columns = [column.name for column in self.model.__table__.columns]
+        rows = [{column: record.get(column) for column in columns} for record in records]
+        with self.session_factory() as db:
+            db.execute(self.model.__table__.insert(), rows)
+            db.commit()
+
+    def _write_each(self, records: list[dict]) -> tuple[list[dict], list[dict], Exception | None]:
+        """
+        Writes records one at a time after their batch failed, returns the written and the failed records
+        and the last error. Stops at an error of the database, the remaining records stay pending.
+        """
+        written, failed, error = [], [], None
+        for record in records:
+            try:
+                self._write([record])
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if is_transient(e):
+                    self._set_failing(len(records) - len(written) - len(failed), e)
+                    break
+                failed.append(record)
+                error = e
+            else:
+                written.append(record)
+        else:
+            self.failing = False
+        return written, failed, error
+
+    def _set_failing(self, count: int, error: Exception) -> None:
+        self.failing = True
+        self.logger.error("Writing %d records failed, retrying on the next flush: %s", count, error)
+
+    def _load_last_id(self) -> None:
+        """Reads the highest id in the table, ids of new records continue from there"""
+        with self.session_factory() as db:
+            last_id = db.query(func.max(self.model.id)).scalar() or 0
+        with self._lock:
+            if self._last_id is None:
+                self._last_id = last_id
+
+    def _run(self) -> None:
+        """Flushes every FLUSH_INTERVAL seconds, or earlier when a batch is full and the database is not failing"""
+        while True:
+            with self._lock:
+                # A failing database is retried every interval, also when a batch is full
+                if not self._stopping and (len(self.pending) < self.batch_size or self.failing):
+                    self._wakeup.wait(self.flush_interval)
+                stopping = self._stopping
+            try:
+                self.flush()
+            except JournalWriteError:
+                pass  # Logged by flush, the other records were written
+            if stopping:
+                break
@@ -10,5 +10,5 @@ class RouteAbstractClass(ABC):
         pass
 
     @abstractmethod
-    def get_formatted_instruction(self) -> dict:
+    def get_formatted_route(self) -> dict:
         """Returns a formatted route in JSON format"""
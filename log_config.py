@@ -0,0 +1,129 @@
+"""Module containing the logging setup of the API and sampled logging for the 10 Hz control loop"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from clock import SYSTEM_CLOCK, Clock
+
+# pylint: disable=line-too-long
+
+LOG_FULL = "full"
+LOG_SAMPLED = "sampled"
+
+# Settings are read from the environment, unset or empty variables use the defaults
+# Level of the root logger
+LOG_LEVEL = (os.getenv("CAPRA_LOG_LEVEL") or "INFO").upper()
+# "sampled" logs one summary per LOG_INTERVAL seconds for records logged every tick, "full" logs every record
+LOG_MODE = (os.getenv("CAPRA_LOG_MODE") or LOG_SAMPLED).lower()
+LOG_INTERVAL = float(os.getenv("CAPRA_LOG_INTERVAL") or 1.0)
+# "text" or "json" lines
+LOG_FORMAT = (os.getenv("CAPRA_LOG_FORMAT") or "text").lower()
+# Records are written by a background thread, so logging never blocks the control loop on I/O
+LOG_ASYNC = (os.getenv("CAPRA_LOG_ASYNC") or "true").lower() in ("1", "true", "yes")
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, the fields of summary records are included"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        summary = getattr(record, "summary", None)
+        if summary is not None:
+            data["summary"] = summary
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT, use_queue: bool = LOG_ASYNC) -> QueueListener | None:
+    """
+    Configures the root logger like logging.basicConfig, unless it already has handlers.
+    With use_queue, records are put on a queue and written by a listener thread, which is
+    stopped at exit after writing the queued records. Returns the listener.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    root.setLevel(level)
+    if not use_queue:
+        root.addHandler(handler)
+        return None
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(QueueHandler(log_queue))
+    return listener
+
+
+class SampledLog():
+    """
+    Log record that is logged on every tick of a loop. In full mode every call is logged with its
+    message. In sampled mode calls are aggregated and one summary record is logged every interval
+    seconds or every n calls: the number of calls and the minimum and maximum of every value.
+    flush() logs the summary of the remaining calls, like at the end of a drive.
+    """
+
+    def __init__(self, logger: logging.Logger, message: str, summary: str, level: int = logging.INFO,
+                 mode: str = LOG_MODE, interval: float = LOG_INTERVAL, every: int | None = None, clock: Clock = SYSTEM_CLOCK) -> None:
+        self.logger = logger
+        self.message = message
+        self.summary = summary
+        self.level = level
+        self.sampled = mode != LOG_FULL
+        self.interval = interval
+        self.every = every
+        self.clock = clock
+        self.count = 0
+        self.started_at = 0.0
+        self.values: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **values: float) -> None:
+        """Logs the message with args in full mode, adds the values to the summary in sampled mode"""
+        if not self.logger.isEnabledFor(self.level):
+            return
+        if not self.sampled:
+            self.logger.log(self.level, self.message, *args)
+            return
+        now = self.clock.monotonic()
+        with self._lock:
+            if not self.count:
+                self.started_at = now
+            self.count += 1
+            for name, value in values.items():
+                bounds = self.values.get(name)
+                if bounds is None:
+                    self.values[name] = [value, value]
+                elif value < bounds[0]:
+                    bounds[0] = value
+                elif value > bounds[1]:
+                    bounds[1] = value
+            due = now - self.started_at >= self.interval or (self.every is not None and self.count >= self.every)
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Logs the summary of the calls since the previous summary"""
+        with self._lock:
+            if not self.count:
+                return
+            count, values = self.count, self.values
+            elapsed = self.clock.monotonic() - self.started_at
+            self.count = 0
+            self.values = {}
+        ranges = "".join(f", {name} {low:g}..{high:g}" for name, (low, high) in values.items())
+        summary = {"count": count, "elapsed": elapsed, **{name: {"min": low, "max": high} for name, (low, high) in values.items()}}
+        self.logger.log(self.level, "%s: %d in %.1f s%s", self.summary, count, elapsed, ranges, extra={"summary": summary})
@@ -1,30 +1,51 @@
 """API Module for controlling a Capra Hircus"""
+import asyncio
+import atexit
 import json
 import logging
-from typing import List
-from fastapi import FastAPI, HTTPException, File, UploadFile
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Iterator, List
+from fastapi import APIRouter, FastAPI, HTTPException, File, UploadFile, Query, Depends, Response, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy import create_engine, Column, Integer, Float
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from capra_control import ControlCapra
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import Column, Integer, Float, DateTime, Index, String
+from sqlalchemy.orm import Session
+from database import Base, SessionLocal, engine, get_db, upgrade_schema
+from drive_scheduler import DriveJob, DriveScheduler
+from fleet import FleetRegistry, Robot, parse_fleet
+from instruction_journal import InstructionJournal, JournalFullError
+from log_config import configure_logging
+from mission_queue import DEFAULT_MISSION_LIMIT, MissionQueue
+from metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, MetricsMiddleware
+from models.drive_job_response import DriveJobResponse
+from models.drive_job_status import DriveJobStatus
 from models.instruction_create import InstructionCreate
 from models.instruction_response import InstructionResponse
+from models.mission_create import MissionCreate
+from path_ingest import MAX_PATH_SIZE, PathIngestError, PathTooLargeError, ingest_path
+from path_store import StoredPath, load_route
+from path_transport import TRANSPORTS
 
 
 # pylint: disable=line-too-long
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging, see log_config for the CAPRA_LOG_* settings
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Define SQLAlchemy models
-Base = declarative_base()
-
 BROKER_ADRRESS = "10.46.28.1"
 BROKER_PORT = 1883
-controller = ControlCapra(BROKER_ADRRESS, BROKER_PORT)
+DEFAULT_ROBOT_ID = "hircus"
+# Robots of the fleet as "robot_id=address:port,...", the first one is used when no robot is named
+CAPRA_FLEET = os.getenv("CAPRA_FLEET", f"{DEFAULT_ROBOT_ID}={BROKER_ADRRESS}:{BROKER_PORT}")
+
+fleet = FleetRegistry()
+for fleet_robot_id, (fleet_address, fleet_port) in parse_fleet(CAPRA_FLEET).items():
+    fleet.register(fleet_robot_id, fleet_address, fleet_port)
+controller = fleet.default.controller
+scheduler = fleet.default.scheduler
 
 API_META_DESCRIPTION = """
 This API is used for interfacing with a Capra Hircus robot using Python and MQTT.
@@ -41,91 +62,246 @@ class Instruction(Base):
     angle = Column(Float, nullable=False)
     speed = Column(Integer, nullable=False)
     distance = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    robot_id = Column(String, index=True)
+
+    __table_args__ = (
+        Index("ix_instructions_speed_angle", "speed", "angle"),
+    )
+
+
+# Number of instructions accepted by one batch request
+MAX_BATCH_SIZE = 500
+# Number of instructions returned per page
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Rows fetched per round trip when streaming instructions
+STREAM_BATCH_SIZE = 500
+
+# Create tables, and add columns and indexes missing from older databases
+upgrade_schema(engine)
+
+# Instructions are written to the database in batches on a background thread
+journal = InstructionJournal(SessionLocal, Instruction)
+atexit.register(journal.shutdown)
+
+# Missions are stored in the database and executed step by step by a worker thread per robot
+missions = MissionQueue(fleet, SessionLocal, journal)
+
+
+def collect_metrics() -> list:
+    """Returns the metrics of the robots and the instruction journal, collected on every scrape"""
+    pending = Gauge("capra_journal_pending", "Instructions waiting to be written to the database")
+    pending.set(len(journal.pending))
+    flushed = Counter("capra_journal_flushed_total", "Instructions written to the database")
+    flushed.inc(journal.flushed)
+    quarantined = Counter("capra_journal_quarantined_total", "Instructions that could not be written to the database")
+    quarantined.inc(journal.quarantined_count)
+    failing = Gauge("capra_journal_failing", "Whether writing instructions to the database is failing")
+    failing.set(journal.failing)
+    return [*fleet.get_metrics(), pending, flushed, quarantined, failing]
+
 
+REGISTRY.add_collector(collect_metrics)
 
-# Configure MySQL database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./capra_db.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Starts the drive schedulers and instruction journal, stops them and closes the robot connections on shutdown"""
+    fleet.start()
+    journal.start()
+    missions.start()
+    yield
+    missions.shutdown()
+    fleet.shutdown()
+    journal.shutdown()
 
 # FastAPI app
 app = FastAPI(
     title="Capra API",
     description=API_META_DESCRIPTION,
     summary="API for interfacing with a Capra Hircus robot.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 origins = [
     "http://localhost:5173"
 ]
 
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The cursor of the next page of instructions
+    expose_headers=["X-Next-After-Id"],
 )
 
 # API endpoints
 
-
-def store_instruction(instruction: InstructionCreate) -> InstructionCreate:
-    """Stores instruction on the database."""
-    logger.info("Received instruction: %s", instruction)
-    db = SessionLocal()
-    db_instruction = Instruction(**instruction.model_dump())
-    db.add(db_instruction)
-    db.commit()
-    db.refresh(db_instruction)
-
-    return db_instruction
+# Endpoints controlling one robot, served at /robots/{robot_id}/... and at the root for the default robot
+robot_router = APIRouter()
 
 
-def send_instruction(instruction: InstructionCreate) -> InstructionCreate:
-    """Instructs the robot to drive by sending an instruction"""
-    # Instruct robot to drive
-    controller.mq_set_mode(1)
-
+async def get_robot(robot_id: str | None = None) -> Robot:
+    """
+    Dependency providing the robot named in the path, or the default robot. It is async, so it is resolved
+    on the event loop and the stop endpoints never wait for a worker thread before taking their timestamp.
+    """
     try:
-        controller.remote_control(instruction.distance,
-                                  instruction.speed, instruction.angle)
-        logger.info("Instruction sent to robot: %s", instruction)
-    except ValueError as exc:
-        logger.error("Error sending instruction to robot: %s", exc)
-        raise HTTPException(
-            status_code=422, detail="Invalid parameters for driving instruction") from exc
-
-    return instruction
-
-
-@app.post("/drive/", response_model=InstructionResponse)
-async def drive(instruction: InstructionCreate):
-    """Creates a driving instruction and sends it to the robot"""
-    instruction = store_instruction(instruction)
-    send_instruction(instruction)
-
-    return instruction
+        return fleet.get(robot_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail="Robot not found") from e
 
 
+def store_instruction(instruction: InstructionCreate, robot_id: str | None = None) -> InstructionResponse:
+    """Stores instruction on the database, the write happens in the background"""
+    logger.info("Received instruction: %s", instruction)
+    try:
+        record = journal.append({**instruction.model_dump(), "robot_id": robot_id})
+    except JournalFullError as e:
+        raise HTTPException(status_code=503, detail="Instructions cannot be stored right now") from e
+
+    return InstructionResponse(**record)
+
+
+def send_instruction(instruction: InstructionCreate, odometry: bool = False, drive_scheduler: DriveScheduler | None = None) -> dict:
+    """Queues an instruction on the drive scheduler, the robot starts driving in the background"""
+    job = (drive_scheduler or scheduler).submit(instruction.id, instruction.distance,
+                                                instruction.speed, instruction.angle, odometry)
+    logger.info("Instruction queued for robot: %s", instruction)
+
+    return {
+        "id": instruction.id,
+        "angle": instruction.angle,
+        "speed": instruction.speed,
+        "distance": instruction.distance,
+        "job_id": job.job_id,
+        "status": job.status
+    }
+
+
+@robot_router.post("/drive/", response_model=DriveJobResponse)
+def drive(instruction: InstructionCreate, odometry: bool = False, robot: Robot = Depends(get_robot)):
+    """
+    Creates a driving instruction and queues it for the robot, returns the drive job id.
+    With odometry, the drive ends when the robot's odometry reports the distance was covered.
+    """
+    instruction = store_instruction(instruction, robot.robot_id)
+
+    return send_instruction(instruction, odometry, robot.scheduler)
+
+
+@robot_router.post("/drive/batch", response_model=List[DriveJobResponse])
+def drive_batch(instructions: List[InstructionCreate] = Body(..., min_length=1, max_length=MAX_BATCH_SIZE), odometry: bool = False,
+                robot: Robot = Depends(get_robot)):
+    """
+    Creates a sequence of driving instructions and queues them to be driven one after another.
+    The instructions are stored in one batch, returns the instruction and drive job ids in order.
+    """
+    logger.info("Received batch of %d instructions for robot %s", len(instructions), robot.robot_id)
+    try:
+        records = journal.append_many([{**instruction.model_dump(), "robot_id": robot.robot_id} for instruction in instructions])
+    except JournalFullError as e:
+        raise HTTPException(status_code=503, detail="Instructions cannot be stored right now") from e
+    jobs = robot.scheduler.submit_many([
+        DriveJob(record["id"], record["distance"], record["speed"], record["angle"], odometry) for record in records])
+
+    return [
+        {
+            "id": record["id"],
+            "angle": record["angle"],
+            "speed": record["speed"],
+            "distance": record["distance"],
+            "job_id": job.job_id,
+            "status": job.status
+        }
+        for record, job in zip(records, jobs)
+    ]
+
+
+@robot_router.get("/drive/{job_id}", response_model=DriveJobStatus)
+async def get_drive_job(job_id: str, robot: Robot = Depends(get_robot)):
+    """Retrieves the status of a drive job"""
+    job = robot.scheduler.get_job(job_id)
+    if job is None:
+        logger.warning("Drive job not found: %s", job_id)
+        raise HTTPException(status_code=404, detail="Drive job not found")
+    return job.get_formatted_job()
+
+
+def stop(robot: Robot, received_at: float | None = None) -> dict:
+    """
+    Pauses the running mission of a robot, cancels its drive jobs and stops it on the priority connection,
+    returns the acknowledgement. The mission is paused first, so it cannot start another step meanwhile.
+    """
+    missions.interrupt(robot.robot_id)
+    robot.scheduler.cancel_all()
+    return robot.controller.emergency_stop(received_at)
+
+
+# The stop endpoints are async and wait for the acknowledgement on a separate thread,
+# so a stop never queues behind other requests in the worker thread pool
 @app.post("/stop/")
-def stop_robot():
-    """Send instruction to the robot to stop driving"""
-    logger.info("Stopping robot")
-    controller.mq_set_mode(5)
-    return {"message": "Robot stopped"}
-
-
-@app.get("/connect_to_robot")
-def connect_to_robot():
+async def stop_robot():
+    """
+    Send instruction to every robot of the fleet to stop driving, at the same time. Returns per robot
+    whether the broker acknowledged the stop, the status is 503 when a stop was not acknowledged.
+    """
+    received_at = fleet.clock.monotonic()
+    logger.info("Stopping all robots")
+    results = await asyncio.to_thread(fleet.dispatch, lambda robot: stop(robot, received_at))
+    robots = {}
+    for robot_id, result in results.items():
+        robots[robot_id] = {"status": result["status"], "acknowledged": False, **result.get("result", {})}
+        if "error" in result:
+            robots[robot_id]["error"] = result["error"]
+    if all(robot["acknowledged"] for robot in robots.values()):
+        return {"message": "Robot stopped", "robots": robots}
+    return JSONResponse(status_code=503, content={"message": "Not every robot acknowledged the stop", "robots": robots})
+
+
+@app.post("/robots/{robot_id}/stop/")
+async def stop_one_robot(robot: Robot = Depends(get_robot)):
+    """
+    Send instruction to one robot to stop driving, returns whether the broker acknowledged the stop.
+    The status is 503 when the stop was not acknowledged.
+    """
+    received_at = robot.controller.clock.monotonic()
+    logger.info("Stopping robot %s", robot.robot_id)
+    result = await asyncio.to_thread(stop, robot, received_at)
+    if result["acknowledged"]:
+        return {"message": "Robot stopped", "robot_id": robot.robot_id, **result}
+    return JSONResponse(status_code=503, content={"message": "Robot stop was not acknowledged", "robot_id": robot.robot_id, **result})
+
+
+@robot_router.get("/stop/latency")
+def get_stop_latency(robot: Robot = Depends(get_robot)):
+    """Returns the histogram of emergency stop latencies, from receiving the request to the broker's acknowledgement"""
+    return robot.controller.stop_latency.get_stats()
+
+
+@app.get("/robots")
+def get_robots():
+    """Lists the robots of the fleet and the state of their connections"""
+    return [robot.get_formatted_robot() for robot in fleet.robots.values()]
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Returns publish counts and latencies, drive tick jitter, database and request latencies in the Prometheus text format"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@robot_router.get("/connect_to_robot")
+def connect_to_robot(robot: Robot = Depends(get_robot)):
     """Establishes a connection to the Capra Hircus"""
     try:
         logger.info("Connecting to the robot")
-        controller.connect_to_robot()
+        robot.controller.connect_to_robot()
         logger.info("Successfully connected to the robot")
         return {"message": "Successfully connected to the robot"}
     except Exception as e:
@@ -134,12 +310,30 @@ def connect_to_robot():
             status_code=500, detail="Failed to connect to Capra Hircus, are you connected to its wifi?") from e
 
 
+@robot_router.get("/connection_status")
+def connection_status(robot: Robot = Depends(get_robot)):
+    """Returns the state of the connection to the Capra Hircus"""
+    return robot.controller.connection.get_status()
+
+
+@robot_router.get("/telemetry")
+def get_telemetry(robot: Robot = Depends(get_robot)):
+    """Returns the most recent telemetry message of every robot status topic"""
+    return robot.controller.telemetry.get_snapshot()
+
+
+@robot_router.get("/telemetry/stream")
+async def stream_telemetry(topic: List[str] = Query(None), robot: Robot = Depends(get_robot)):
+    """Streams telemetry of the robot as Server-Sent Events, optionally limited to the given topics"""
+    return StreamingResponse(robot.controller.telemetry.stream(topic), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
 @app.get("/instructions/{instruction_id}", response_model=InstructionResponse)
-def get_instruction(instruction_id: int):
+def get_instruction(instruction_id: int, db: Session = Depends(get_db)):
     """Retrieves an instruction from the Database"""
     logger.info("Fetching instruction with ID: %d", instruction_id)
-    db = SessionLocal()
-    instruction = db.query(Instruction).filter(
+    instruction = journal.get(instruction_id) or db.query(Instruction).filter(
         Instruction.id == instruction_id).first()
     if instruction is None:
         logger.warning("Instruction not found: %d", instruction_id)
@@ -149,32 +343,185 @@ def get_instruction(instruction_id: int):
 
 
 @app.post("/upload-json")
-async def upload_json(file: UploadFile = File(...)):
-    """Endpoint to upload a JSON file"""
+def upload_json(file: UploadFile = File(...)):
+    """
+    Uploads a Capra Hircus path file. The file is parsed, validated and stored while it is read,
+    so its size does not affect memory use. Returns the path id used to send the path to the robot.
+    """
+    logger.info("Uploading JSON file: %s", file.filename)
+    if not file.filename.endswith(".json"):
+        logger.warning(
+            "Uploaded file is not a JSON file: %s", file.filename)
+        return JSONResponse(status_code=400, content={"message": "Uploaded file must be a JSON file"})
+    if file.size is not None and file.size > MAX_PATH_SIZE:
+        logger.warning("Uploaded file is too large: %s", file.filename)
+        return JSONResponse(status_code=413, content={"message": f"Path files can be at most {MAX_PATH_SIZE} bytes"})
+
+    try:
+        path = ingest_path(file.file, SessionLocal, file.filename)
+    except PathTooLargeError as e:
+        logger.warning("Uploaded file is too large: %s", e)
+        return JSONResponse(status_code=413, content={"message": str(e)})
+    except PathIngestError as e:
+        logger.warning("Uploaded file is not a valid path: %s", e)
+        return JSONResponse(status_code=422, content={"message": f"Invalid path file: {e}"})
+    logger.info("JSON file uploaded and processed successfully")
+    return {"message": "JSON file uploaded and processed successfully", **path}
+
+
+@app.get("/paths/{path_id}")
+def get_path(path_id: int, db: Session = Depends(get_db)):
+    """Retrieves the metadata of an uploaded path"""
+    path = db.get(StoredPath, path_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Path not found")
+    return path.get_formatted_path()
+
+
+@robot_router.post("/paths/{path_id}/send")
+def send_path(path_id: int, tolerance: float | None = Query(None, gt=0),
+              transport: str = Query("json", pattern=f"^({'|'.join(TRANSPORTS)})$"),
+              robot: Robot = Depends(get_robot), db: Session = Depends(get_db)):
+    """
+    Sends an uploaded path to the robot, optionally simplified with a tolerance in metres.
+    The transport selects plain JSON, compact JSON, or compressed and chunked messages for large paths.
+    The encoded path is cached by its content hash, so sending it again only costs a publish.
+    """
+    path = db.get(StoredPath, path_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Path not found")
+    path_transport = TRANSPORTS[transport]
+    payload = robot.controller.path_cache.get_or_encode(
+        path.content_hash, lambda: load_route(db, path_id).get_formatted_route(), tolerance, transport=path_transport)
+    if not robot.controller.send_payload(payload, path_transport):
+        raise HTTPException(status_code=503, detail="Failed to send the path to the robot")
+    return {"message": "Path sent", "path_id": path_id, "path_uuid": path.path_uuid, "robot_id": robot.robot_id}
+
+
+@robot_router.post("/missions")
+def create_mission(mission: MissionCreate, robot: Robot = Depends(get_robot)):
+    """
+    Queues a mission, an ordered list of driving instructions and uploaded paths, for the robot.
+    The mission is executed in the background after the robot's earlier missions, returns its id.
+    """
     try:
-        logger.info("Uploading JSON file: %s", file.filename)
-        if not file.filename.endswith(".json"):
-            logger.warning(
-                "Uploaded file is not a JSON file: %s", file.filename)
-            return JSONResponse(status_code=400, content={"message": "Uploaded file must be a JSON file"})
+        return missions.submit(robot.robot_id, [step.model_dump() for step in mission.steps], mission.name)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+
+@robot_router.get("/missions")
+def get_missions(status: str | None = None, limit: int = Query(DEFAULT_MISSION_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+                 robot: Robot = Depends(get_robot)):
+    """Lists the most recent missions of the robot, optionally only those with a status"""
+    return missions.get_missions(robot.robot_id, status, limit)
+
 
-        contents = await file.read()
-        data = json.loads(contents)
-        logger.info("JSON file uploaded and processed successfully")
-        return {"message": "JSON file uploaded and processed successfully"}
-    except FileNotFoundError as e:
-        logger.error("Error processing JSON file: %s", e)
-        return JSONResponse(status_code=500, content={"message": f"Error processing JSON file: {str(e)}"})
+@app.get("/missions/{mission_id}")
+def get_mission(mission_id: int):
+    """Retrieves a mission with its steps and progress"""
+    mission = missions.get(mission_id)
+    if mission is None:
+        raise HTTPException(status_code=404, detail="Mission not found")
+    return mission
+
+
+def change_mission(mission_id: int, change) -> dict:
+    """Pauses, resumes or cancels a mission, unknown missions are 404 and impossible changes 409"""
+    try:
+        return change(mission_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail="Mission not found") from e
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+
+
+@app.post("/missions/{mission_id}/pause")
+def pause_mission(mission_id: int):
+    """Pauses a mission, a running drive is stopped and its progress is kept"""
+    return change_mission(mission_id, missions.pause)
+
+
+@app.post("/missions/{mission_id}/resume")
+def resume_mission(mission_id: int):
+    """Resumes a paused mission from where it stopped"""
+    return change_mission(mission_id, missions.resume)
+
+
+@app.post("/missions/{mission_id}/cancel")
+def cancel_mission(mission_id: int):
+    """Cancels a mission, a running drive is stopped"""
+    return change_mission(mission_id, missions.cancel)
+
+
+def filter_instructions(query, after_id: int = 0, min_speed: int | None = None, max_speed: int | None = None,
+                        min_angle: float | None = None, max_angle: float | None = None,
+                        since: datetime | None = None, until: datetime | None = None):
+    """Applies the keyset cursor and filters of the instruction listing to a query"""
+    query = query.filter(Instruction.id > after_id)
+    if min_speed is not None:
+        query = query.filter(Instruction.speed >= min_speed)
+    if max_speed is not None:
+        query = query.filter(Instruction.speed <= max_speed)
+    if min_angle is not None:
+        query = query.filter(Instruction.angle >= min_angle)
+    if max_angle is not None:
+        query = query.filter(Instruction.angle <= max_angle)
+    if since is not None:
+        query = query.filter(Instruction.created_at >= since)
+    if until is not None:
+        query = query.filter(Instruction.created_at < until)
+    return query.order_by(Instruction.id)
+
+
+def stream_instructions(filters: dict, limit: int | None) -> Iterator[bytes]:
+    """Yields instructions as newline delimited JSON, read in batches from a server-side cursor"""
+    with SessionLocal() as db:
+        query = filter_instructions(db.query(Instruction.id, Instruction.angle,
+                                             Instruction.speed, Instruction.distance), **filters)
+        if limit is not None:
+            query = query.limit(limit)
+        query = query.execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
+        for row in query:
+            yield json.dumps({"id": row.id, "angle": row.angle, "speed": row.speed, "distance": row.distance}).encode("utf-8") + b"\n"
 
 
 @app.get("/instructions", response_model=List[InstructionResponse])
-def get_all_instructions():
-    """Retrieves all instructions from the Database"""
-    db = SessionLocal()
-    instructions = db.query(Instruction).all()
+def get_all_instructions(response: Response,
+                         after_id: int = Query(0, ge=0),
+                         limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                         min_speed: int | None = None, max_speed: int | None = None,
+                         min_angle: float | None = None, max_angle: float | None = None,
+                         since: datetime | None = None, until: datetime | None = None,
+                         response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$")):
+    """
+    Retrieves instructions from the Database ordered by id, one page at a time.
+    Pass the X-Next-After-Id response header as after_id to fetch the next page.
+    With format=ndjson all matching instructions are streamed, unless a limit is given.
+    Instructions still waiting in the journal are listed once it flushed them.
+    """
+    filters = {
+        "after_id": after_id,
+        "min_speed": min_speed, "max_speed": max_speed,
+        "min_angle": min_angle, "max_angle": max_angle,
+        "since": since, "until": until
+    }
+    if response_format == "ndjson":
+        # The stream opens its own session, none is held while the response is sent
+        return StreamingResponse(stream_instructions(filters, limit), media_type="application/x-ndjson")
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    with SessionLocal() as db:
+        instructions = filter_instructions(db.query(Instruction), **filters).limit(limit).all()
+    if len(instructions) == limit:
+        response.headers["X-Next-After-Id"] = str(instructions[-1].id)
     return instructions
 
 
+app.include_router(robot_router)
+app.include_router(robot_router, prefix="/robots/{robot_id}")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
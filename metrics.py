@@ -0,0 +1,295 @@
+"""Module containing counters, gauges and histograms exposed in the Prometheus text format"""
+import math
+from abc import ABC, abstractmethod
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+from histogram import LatencyHistogram
+
+# pylint: disable=line-too-long
+
+# Upper bounds in milliseconds of the buckets for durations of publishes, queries and requests
+DURATION_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class CounterValue():
+    """A counter for one set of label values"""
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Adds to the counter"""
+        with self._lock:
+            self.value += amount
+
+
+class GaugeValue():
+    """A gauge for one set of label values, set directly or read from a function when collected"""
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function: Callable[[], float] | None = None
+
+    def set(self, value: float) -> None:
+        """Sets the gauge"""
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Reads the gauge from a function every time it is collected"""
+        self.function = function
+
+    def get(self) -> float:
+        """Returns the value of the gauge"""
+        return self.function() if self.function is not None else self.value
+
+
+class HistogramValue(LatencyHistogram):
+    """A histogram of durations for one set of label values"""
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observes the duration of the with block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Metric(ABC):
+    """
+    Base class of the metric types. A metric without label names is used directly, with label
+    names every combination of label values gets its own value, created on first use by labels().
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self._value = None if self.labelnames else self.labels()
+
+    @abstractmethod
+    def _new_value(self) -> object:
+        """Returns a new value for one set of label values"""
+
+    def labels(self, *values) -> object:
+        """Returns the value for the label values, in the order of the label names"""
+        key = tuple(str(value) for value in values)
+        value = self._values.get(key)
+        if value is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                value = self._values.setdefault(key, self._new_value())
+        return value
+
+    def clear(self) -> None:
+        """Forgets the values of all label combinations"""
+        with self._lock:
+            self._values = {} if self.labelnames else {(): self._new_value()}
+            self._value = self._values.get(())
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        """Yields the name, labels and value of every sample"""
+
+    def _label_sets(self) -> Iterator[tuple[dict, object]]:
+        for key, value in list(self._values.items()):
+            yield dict(zip(self.labelnames, key)), value
+
+
+class Counter(Metric):
+    """A count that only goes up, like published messages"""
+
+    type = "counter"
+
+    def _new_value(self) -> CounterValue:
+        return CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Adds to a counter without labels"""
+        self._value.inc(amount)
+
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        for labels, value in self._label_sets():
+            yield self.name, labels, value.value
+
+
+class Gauge(Metric):
+    """A value that goes up and down, like the state of a connection"""
+
+    type = "gauge"
+
+    def _new_value(self) -> GaugeValue:
+        return GaugeValue()
+
+    def set(self, value: float) -> None:
+        """Sets a gauge without labels"""
+        self._value.set(value)
+
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        for labels, value in self._label_sets():
+            yield self.name, labels, value.get()
+
+
+class Histogram(Metric):
+    """
+    Durations counted in preallocated buckets, observing takes constant time and memory.
+    Durations are observed in seconds, bucket bounds are given in milliseconds.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets_ms: tuple = DURATION_BUCKETS_MS) -> None:
+        self.buckets_ms = tuple(buckets_ms)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_value(self) -> HistogramValue:
+        return HistogramValue(self.buckets_ms)
+
+    def attach(self, histogram: LatencyHistogram, *values) -> None:
+        """Exposes an existing LatencyHistogram as the value for the label values"""
+        with self._lock:
+            self._values[tuple(str(value) for value in values)] = histogram
+
+    def observe(self, seconds: float) -> None:
+        """Observes a duration of a histogram without labels"""
+        self._value.observe(seconds)
+
+    def time(self):
+        """Observes the duration of a with block of a histogram without labels"""
+        return self._value.time()
+
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        for labels, value in self._label_sets():
+            with value._lock:  # pylint: disable=protected-access
+                counts = list(value.counts)
+                count = value.count
+                total_ms = value.total_ms
+            cumulative = 0
+            for bound, bucket_count in zip(value.buckets_ms, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound / 1000)}, cumulative
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, count
+            yield f"{self.name}_sum", labels, total_ms / 1000
+            yield f"{self.name}_count", labels, count
+
+
+class MetricsRegistry():
+    """
+    Holds the metrics of the process. Metrics are created once by name, asking for an existing
+    name returns the same metric. Collectors are called on every scrape and return metrics
+    built from state kept elsewhere, like connection and cache statistics.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self.collectors: list[Callable[[], Iterable[Metric]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: tuple, **kwargs) -> Metric:
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        """Returns the counter with the name, created when it does not exist"""
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        """Returns the gauge with the name, created when it does not exist"""
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets_ms: tuple = DURATION_BUCKETS_MS) -> Histogram:
+        """Returns the histogram with the name, created when it does not exist"""
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets_ms=buckets_ms)
+
+    def add_collector(self, collector: Callable[[], Iterable[Metric]]) -> None:
+        """Adds a function returning metrics that is called on every scrape"""
+        self.collectors.append(collector)
+
+    def collect(self) -> Iterator[Metric]:
+        """Yields the registered metrics and the metrics of the collectors"""
+        yield from list(self.metrics.values())
+        for collector in list(self.collectors):
+            yield from collector()
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: dict) -> str:
+    """Returns labels as {name="value",...}, with backslashes, quotes and newlines escaped"""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float | None) -> str:
+    """Returns a sample value, whole numbers without a decimal point"""
+    if value is None:
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+# Registry of the API process, rendered at /metrics
+REGISTRY = MetricsRegistry()
+
+
+class MetricsMiddleware():
+    """
+    ASGI middleware counting HTTP requests and observing their duration, by method and route template,
+    so /robots/{robot_id}/drive/ is one series for every robot. Requests matching no route share one series.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = REGISTRY) -> None:
+        self.app = app
+        self.requests = registry.counter("capra_http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+        self.duration = registry.histogram("capra_http_request_duration_seconds", "Time to handle an HTTP request", ("method", "route"))
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.duration.labels(scope["method"], route).observe(time.perf_counter() - start)
+            self.requests.labels(scope["method"], route, status).inc()
@@ -0,0 +1,485 @@
+"""Module containing the persistent mission queue and the executor running missions on a robot"""
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy.exc import SQLAlchemyError
+from database import Base
+from drive_scheduler import DriveJob, JOB_CANCELLED, JOB_FAILED
+from fleet import FleetRegistry, Robot
+from path_store import StoredPath, load_route
+from path_transport import TRANSPORTS
+
+# pylint: disable=line-too-long
+
+MISSION_QUEUED = "queued"
+MISSION_RUNNING = "running"
+MISSION_PAUSED = "paused"
+MISSION_COMPLETED = "completed"
+MISSION_CANCELLED = "cancelled"
+MISSION_FAILED = "failed"
+# Missions that have not finished, the first of them holds the queue of its robot
+UNFINISHED = (MISSION_QUEUED, MISSION_RUNNING, MISSION_PAUSED)
+
+STEP_DRIVE = "drive"
+STEP_PATH = "path"
+
+# Seconds the executor waits for new missions before looking again
+POLL_INTERVAL = 1.0
+# Seconds between checkpoints of the distance covered while a drive step runs
+CHECKPOINT_INTERVAL = 5.0
+# Seconds pause and cancel wait for the running step to be interrupted
+INTERRUPT_TIMEOUT = 5.0
+# Drive steps with less than this many metres left are done
+MIN_REMAINING_DISTANCE = 0.01
+# Missions returned per list request
+DEFAULT_MISSION_LIMIT = 100
+
+
+class Mission(Base):
+    """
+    Creates the table of missions, ordered lists of steps executed by one robot.
+    current_step and step_progress are the checkpoint: the steps before current_step are done,
+    and step_progress metres of the current drive step were already driven.
+    """
+    __tablename__ = "missions"
+    id = Column(Integer, primary_key=True, index=True)
+    robot_id = Column(String, nullable=False, index=True)
+    name = Column(String)
+    status = Column(String, nullable=False, default=MISSION_QUEUED, index=True)
+    step_count = Column(Integer, nullable=False)
+    current_step = Column(Integer, nullable=False, default=0)
+    step_progress = Column(Float, nullable=False, default=0.0)
+    error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    def get_formatted_mission(self, steps: list | None = None) -> dict:
+        """Returns the mission and its progress, with its steps when they are given"""
+        mission = {
+            "mission_id": self.id,
+            "robot_id": self.robot_id,
+            "name": self.name,
+            "status": self.status,
+            "step_count": self.step_count,
+            "current_step": self.current_step,
+            "step_progress": self.step_progress,
+            "progress": self.current_step / self.step_count if self.step_count else 1.0,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if steps is not None:
+            mission["steps"] = [step.get_formatted_step(self) for step in steps]
+        return mission
+
+
+class MissionStep(Base):
+    """Creates the table of mission steps, a driving instruction or a stored path to send"""
+    __tablename__ = "mission_steps"
+    mission_id = Column(Integer, ForeignKey("missions.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    angle = Column(Float)
+    speed = Column(Integer)
+    distance = Column(Float)
+    odometry = Column(Boolean)
+    path_id = Column(Integer)
+    tolerance = Column(Float)
+    transport = Column(String)
+
+    def get_formatted_step(self, mission: Mission | None = None) -> dict:
+        """Returns the step, with its status derived from the checkpoint of the mission"""
+        step = {"position": self.position, "kind": self.kind}
+        if self.kind == STEP_DRIVE:
+            step.update(angle=self.angle, speed=self.speed, distance=self.distance, odometry=self.odometry)
+        else:
+            step.update(path_id=self.path_id, tolerance=self.tolerance, transport=self.transport)
+        if mission is not None:
+            if self.position < mission.current_step:
+                step["status"] = MISSION_COMPLETED
+            elif self.position == mission.current_step and mission.status in (MISSION_RUNNING, MISSION_PAUSED, MISSION_FAILED):
+                step["status"] = mission.status
+            else:
+                step["status"] = MISSION_QUEUED if mission.status in UNFINISHED else MISSION_CANCELLED
+        return step
+
+
+class MissionExecutor():
+    """
+    Executes the missions of one robot one after another on a worker thread, step by step.
+    Drive steps are queued on the robot's DriveScheduler, path steps are sent through its path cache.
+    The checkpoint is written after every step, every checkpoint_interval seconds while a drive step
+    runs and when a mission is paused or interrupted, so a resumed mission continues where it stopped.
+    A paused mission holds the queue of its robot until it is resumed or cancelled. While the robot
+    is halted by an emergency stop no step is started, the mission is paused instead. All status changes of the robot's missions are made under one lock.
+    """
+
+    def __init__(self, robot: Robot, session_factory, journal=None, poll_interval: float = POLL_INTERVAL, checkpoint_interval: float = CHECKPOINT_INTERVAL) -> None:
+        self.robot = robot
+        self.session_factory = session_factory
+        self.journal = journal
+        self.poll_interval = poll_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.current_mission_id: int | None = None
+        self.current_job: DriveJob | None = None
+        # Pause or cancel requests for the running mission, with the error it ends with
+        self._requests: dict[int, tuple[str, str | None]] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stopping = False
+        self._worker: threading.Thread | None = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self) -> None:
+        """Starts the worker thread if it is not running yet"""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stopping = False
+            self._worker = threading.Thread(
+                target=self._run, name=f"mission-executor-{self.robot.robot_id}", daemon=True)
+            self._worker.start()
+
+    def shutdown(self, timeout: float = INTERRUPT_TIMEOUT) -> None:
+        """Interrupts the running mission, it is checkpointed and paused, and stops the worker thread"""
+        with self._lock:
+            self._stopping = True
+            if self.current_job is not None:
+                self.current_job.cancel_event.set()
+            self._changed.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+            self._worker = None
+
+    def interrupt(self, error: str) -> int | None:
+        """
+        Pauses the running mission without waiting, like on an emergency stop: its drive is cancelled
+        and no further step is started. Returns the id of the interrupted mission, if one was running.
+        """
+        with self._lock:
+            mission_id = self.current_mission_id
+            if mission_id is None:
+                return None
+            self._requests[mission_id] = (MISSION_PAUSED, error)
+            if self.current_job is not None:
+                self.current_job.cancel_event.set()
+        self.logger.warning("Mission %d interrupted: %s", mission_id, error)
+        return mission_id
+
+    def notify(self) -> None:
+        """Wakes up the worker thread to look for queued missions"""
+        with self._lock:
+            self._changed.notify_all()
+
+    def change_status(self, mission_id: int, status: str) -> None:
+        """
+        Pauses (MISSION_PAUSED), resumes (MISSION_QUEUED) or cancels (MISSION_CANCELLED) a mission.
+        A running mission is interrupted, its drive is cancelled and this waits until it was checkpointed.
+        Resuming is the operator's go-ahead after an emergency stop, it lifts the halt of the robot.
+        Raises ValueError when the mission cannot make the change.
+        """
+        with self._lock:
+            if mission_id == self.current_mission_id:
+                if status == MISSION_QUEUED:
+                    return
+                self._requests[mission_id] = (status, None)
+                if self.current_job is not None:
+                    self.current_job.cancel_event.set()
+                self._changed.wait_for(lambda: self.current_mission_id != mission_id, INTERRUPT_TIMEOUT)
+                return
+
+            with self.session_factory() as db:
+                mission = db.get(Mission, mission_id)
+                if mission.status == status:
+                    return
+                if mission.status not in (MISSION_QUEUED, MISSION_PAUSED) or (status == MISSION_QUEUED and mission.status != MISSION_PAUSED):
+                    raise ValueError(f"Mission {mission_id} is {mission.status}")
+                mission.status = status
+                if status == MISSION_QUEUED:
+                    mission.error = None
+                    self.robot.controller.halted.clear()
+                elif status == MISSION_CANCELLED:
+                    mission.finished_at = datetime.utcnow()
+                db.commit()
+            self._changed.notify_all()
+        self.logger.info("Mission %d %s", mission_id, "resumed" if status == MISSION_QUEUED else status)
+
+    def _run(self) -> None:
+        """Worker loop executing the queued missions of the robot in order"""
+        while True:
+            with self._lock:
+                if self._stopping:
+                    break
+            mission_id = self._claim_next()
+            if mission_id is None:
+                with self._lock:
+                    if not self._stopping:
+                        self._changed.wait(self.poll_interval)
+                continue
+            self._execute(mission_id)
+
+    def _claim_next(self) -> int | None:
+        """Marks the first unfinished mission of the robot as running, None when there is none or it is paused"""
+        with self._lock:
+            if self._stopping:
+                return None
+            with self.session_factory() as db:
+                mission = db.query(Mission).filter(
+                    Mission.robot_id == self.robot.robot_id, Mission.status.in_(UNFINISHED)).order_by(Mission.id).first()
+                if mission is None or mission.status != MISSION_QUEUED:
+                    return None
+                mission.status = MISSION_RUNNING
+                mission.started_at = mission.started_at or datetime.utcnow()
+                db.commit()
+                self.current_mission_id = mission.id
+                return mission.id
+
+    def _execute(self, mission_id: int) -> None:
+        """Executes the steps of a claimed mission from its checkpoint"""
+        with self.session_factory() as db:
+            mission = db.get(Mission, mission_id)
+            position, progress = mission.current_step, mission.step_progress
+            steps = [step.get_formatted_step() for step in db.query(MissionStep).filter(
+                MissionStep.mission_id == mission_id).order_by(MissionStep.position)]
+        self.logger.info("Mission %d started at step %d of %d", mission_id, position + 1, len(steps))
+
+        status, error = MISSION_COMPLETED, None
+        try:
+            while position < len(steps):
+                interruption = self._get_interruption(mission_id, stopped=False)
+                if interruption is not None:
+                    status, error = interruption
+                    break
+                step = steps[position]
+                if step["kind"] == STEP_DRIVE and step["distance"] - progress >= MIN_REMAINING_DISTANCE:
+                    job = self._drive(mission_id, position, progress, step)
+                    progress += (job.report or {}).get("distance_covered", 0.0)
+                    if job.status == JOB_FAILED:
+                        status, error = MISSION_FAILED, job.error
+                        break
+                    if job.status == JOB_CANCELLED:
+                        status, error = self._get_interruption(mission_id, stopped=True)
+                        break
+                elif step["kind"] == STEP_PATH and not self._send_path(step):
+                    status, error = MISSION_FAILED, f"Path {step['path_id']} could not be sent to the robot"
+                    break
+                position, progress = position + 1, 0.0
+                self._checkpoint(mission_id, position, progress)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            status, error = MISSION_FAILED, str(e)
+        self._finish(mission_id, status, position, progress, error)
+
+    def _get_interruption(self, mission_id: int, stopped: bool) -> tuple[str, str | None] | None:
+        """
+        Returns the status and error a mission ends with when pause or cancel was requested, the executor
+        is stopping or the robot is halted. A drive cancelled for another reason pauses the mission.
+        """
+        with self._lock:
+            request = self._requests.pop(mission_id, None)
+            if request is not None:
+                return request
+            if self._stopping:
+                return MISSION_PAUSED, "Interrupted by shutdown"
+        if self.robot.controller.halted.is_set():
+            return MISSION_PAUSED, "Robot is stopped"
+        return (MISSION_PAUSED, "Drive was stopped") if stopped else None
+
+    def _drive(self, mission_id: int, position: int, progress: float, step: dict) -> DriveJob:
+        """
+        Queues the rest of a drive step on the robot's scheduler and waits until it finished,
+        storing the distance covered every checkpoint_interval seconds while it drives.
+        """
+        distance = step["distance"] - progress
+        instruction_id = 0
+        if self.journal is not None:
+            instruction_id = self.journal.append({
+                "angle": step["angle"], "speed": step["speed"], "distance": distance, "robot_id": self.robot.robot_id})["id"]
+        job = DriveJob(instruction_id, distance, step["speed"], step["angle"], bool(step["odometry"]))
+        with self._lock:
+            self.current_job = job
+            # The scheduler sets the drive mode, which would lift an emergency stop
+            if mission_id in self._requests or self._stopping or self.robot.controller.halted.is_set():
+                job.cancel_event.set()
+        self.robot.scheduler.submit_many([job])
+        while not job.done.wait(self.checkpoint_interval):
+            if job.distance_covered > 0:
+                try:
+                    self._checkpoint(mission_id, position, progress + job.distance_covered)
+                except SQLAlchemyError as e:
+                    # The robot keeps driving, the next checkpoint is tried after the interval
+                    self.logger.warning("Mission %d checkpoint failed: %s", mission_id, e)
+        with self._lock:
+            self.current_job = None
+        return job
+
+    def _send_path(self, step: dict) -> bool:
+        """Sends a stored path to the robot, returns whether it was published"""
+        transport = TRANSPORTS[step["transport"]]
+        controller = self.robot.controller
+        with self.session_factory() as db:
+            path = db.get(StoredPath, step["path_id"])
+            if path is None:
+                raise ValueError(f"Path {step['path_id']} not found")
+            payload = controller.path_cache.get_or_encode(
+                path.content_hash, lambda: load_route(db, path.id).get_formatted_route(), step["tolerance"], transport=transport)
+        return controller.send_payload(payload, transport)
+
+    def _checkpoint(self, mission_id: int, position: int, progress: float) -> None:
+        """Stores how far the mission got"""
+        with self.session_factory() as db:
+            mission = db.get(Mission, mission_id)
+            mission.current_step = position
+            mission.step_progress = progress
+            db.commit()
+
+    def _finish(self, mission_id: int, status: str, position: int, progress: float, error: str | None) -> None:
+        """Stores the checkpoint and the status a mission ended with, and lets the next mission run"""
+        with self._lock:
+            with self.session_factory() as db:
+                mission = db.get(Mission, mission_id)
+                mission.status = status
+                mission.current_step = position
+                mission.step_progress = progress
+                mission.error = error
+                if status not in UNFINISHED:
+                    mission.finished_at = datetime.utcnow()
+                db.commit()
+            self.current_mission_id = None
+            self._requests.pop(mission_id, None)
+            self._changed.notify_all()
+        if status == MISSION_FAILED:
+            self.logger.error("Mission %d failed at step %d: %s", mission_id, position + 1, error)
+        else:
+            self.logger.info("Mission %d %s at step %d%s", mission_id, status, position + 1, f": {error}" if error else "")
+
+
+class MissionQueue():
+    """
+    Stores missions in the database and keeps a MissionExecutor for every robot of the fleet.
+    Missions that were running when the process stopped are paused on start, resuming them
+    continues from their checkpoint.
+    """
+
+    def __init__(self, fleet: FleetRegistry, session_factory, journal=None) -> None:
+        self.fleet = fleet
+        self.session_factory = session_factory
+        self.journal = journal
+        self.executors: dict[str, MissionExecutor] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def get_executor(self, robot_id: str) -> MissionExecutor:
+        """Returns the executor of a robot, raises KeyError for an unknown robot"""
+        with self._lock:
+            executor = self.executors.get(robot_id)
+            if executor is None:
+                executor = self.executors[robot_id] = MissionExecutor(self.fleet.get(robot_id), self.session_factory, self.journal)
+        executor.start()
+        return executor
+
+    def start(self) -> None:
+        """Pauses the missions interrupted by a crash and starts an executor for every robot"""
+        self.recover()
+        for robot_id in list(self.fleet.robots):
+            self.get_executor(robot_id)
+
+    def shutdown(self) -> None:
+        """Interrupts the running missions and stops the executors"""
+        with self._lock:
+            executors = list(self.executors.values())
+        for executor in executors:
+            executor.shutdown()
+
+    def interrupt(self, robot_id: str, error: str = "Robot was stopped") -> int | None:
+        """Pauses the running mission of a robot without waiting, returns its id if one was running"""
+        with self._lock:
+            executor = self.executors.get(robot_id)
+        return executor.interrupt(error) if executor is not None else None
+
+    def recover(self) -> int:
+        """Pauses missions left running by a crash, returns their number"""
+        with self.session_factory() as db:
+            missions = db.query(Mission).filter(Mission.status == MISSION_RUNNING).all()
+            for mission in missions:
+                mission.status = MISSION_PAUSED
+                mission.error = f"Interrupted at step {mission.current_step + 1}, resume to continue"
+            db.commit()
+        if missions:
+            self.logger.warning("Paused %d mission(s) interrupted by a restart", len(missions))
+        return len(missions)
+
+    def submit(self, robot_id: str, steps: list[dict], name: str | None = None) -> dict:
+        """
+        Stores a mission and queues it on the robot's executor. Steps have an instruction (angle, speed,
+        distance) or a path_id, see MissionStepCreate. Raises ValueError for unknown paths or transports.
+        """
+        executor = self.get_executor(robot_id)
+        with self.session_factory() as db:
+            rows = []
+            for position, step in enumerate(steps):
+                instruction = step.get("instruction")
+                if instruction is not None:
+                    rows.append(MissionStep(position=position, kind=STEP_DRIVE, angle=instruction.get("angle", 0.0), speed=instruction["speed"],
+                                            distance=instruction["distance"], odometry=step.get("odometry", False)))
+                    continue
+                transport = step.get("transport") or "json"
+                if transport not in TRANSPORTS:
+                    raise ValueError(f"Unknown transport: {transport}")
+                if db.get(StoredPath, step["path_id"]) is None:
+                    raise ValueError(f"Path {step['path_id']} not found")
+                rows.append(MissionStep(position=position, kind=STEP_PATH, path_id=step["path_id"],
+                                        tolerance=step.get("tolerance"), transport=transport))
+            mission = Mission(robot_id=robot_id, name=name, status=MISSION_QUEUED, step_count=len(rows))
+            db.add(mission)
+            db.flush()
+            for row in rows:
+                row.mission_id = mission.id
+            db.add_all(rows)
+            db.commit()
+            formatted = mission.get_formatted_mission()
+        executor.notify()
+        self.logger.info("Queued mission %d with %d steps for robot %s", formatted["mission_id"], len(rows), robot_id)
+        return formatted
+
+    def get(self, mission_id: int) -> dict | None:
+        """Returns a mission with its steps, None when it is unknown"""
+        with self.session_factory() as db:
+            mission = db.get(Mission, mission_id)
+            if mission is None:
+                return None
+            steps = db.query(MissionStep).filter(MissionStep.mission_id == mission_id).order_by(MissionStep.position).all()
+            return mission.get_formatted_mission(steps)
+
+    def get_missions(self, robot_id: str | None = None, status: str | None = None, limit: int = DEFAULT_MISSION_LIMIT) -> list[dict]:
+        """Returns the most recent missions, optionally of one robot and/or with a status"""
+        with self.session_factory() as db:
+            query = db.query(Mission)
+            if robot_id is not None:
+                query = query.filter(Mission.robot_id == robot_id)
+            if status is not None:
+                query = query.filter(Mission.status == status)
+            return [mission.get_formatted_mission() for mission in query.order_by(Mission.id.desc()).limit(limit)]
+
+    def pause(self, mission_id: int) -> dict:
+        """Pauses a mission after checkpointing its running step, raises KeyError or ValueError"""
+        return self._change_status(mission_id, MISSION_PAUSED)
+
+    def resume(self, mission_id: int) -> dict:
+        """Queues a paused mission again, it continues from its checkpoint. Raises KeyError or ValueError"""
+        return self._change_status(mission_id, MISSION_QUEUED)
+
+    def cancel(self, mission_id: int) -> dict:
+        """Cancels a mission, a running drive is stopped. Raises KeyError or ValueError"""
+        return self._change_status(mission_id, MISSION_CANCELLED)
+
+    def _change_status(self, mission_id: int, status: str) -> dict:
+        with self.session_factory() as db:
+            mission = db.get(Mission, mission_id)
+            if mission is None:
+                raise KeyError(mission_id)
+            robot_id = mission.robot_id
+        self.get_executor(robot_id).change_status(mission_id, status)
+        return self.get(mission_id)
@@ -4,6 +4,8 @@
 class Coordinate:
     """Class for defining a coordinate"""
 
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y) -> None:
         self.x = x
         self.y = y
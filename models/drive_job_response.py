@@ -0,0 +1,8 @@
+"""Drive Job Response model"""
+from models.instruction_response import InstructionResponse
+
+
+class DriveJobResponse(InstructionResponse):
+    """Stored instruction together with the drive job executing it"""
+    job_id: str
+    status: str
@@ -0,0 +1,15 @@
+"""Drive Job Status model"""
+from pydantic import BaseModel
+
+
+class DriveJobStatus(BaseModel):
+    """Status of a drive job on the drive scheduler"""
+    job_id: str
+    instruction_id: int
+    status: str
+    error: str | None = None
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    distance_covered: float = 0.0
+    report: dict | None = None
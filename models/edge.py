@@ -1,19 +1,25 @@
 """Edge data type"""
 from dataclasses import dataclass
 
+# Fields of an edge in the Capra Hircus format that are kept as attributes, other fields are kept in extra
+EDGE_FIELDS = ("uuid", "start_node_uuid", "end_node_uuid")
 
-@dataclass
+
+@dataclass(slots=True)
 class Edge:
     """Class for defining an edge"""
 
     uuid: str
     start_node_uuid: str
     end_node_uuid: str
+    speed: float = 1.0
+    # Other fields of the edge as uploaded, its actions replace the drive action built from speed
+    extra: dict | None = None
 
     def get_formatted_edge(self) -> dict:
         """Returns an edge in the correct format for Capra Hircus"""
 
-        return {
+        edge = {
             "uuid": self.uuid,
             "start_node_uuid": self.start_node_uuid,
             "end_node_uuid": self.end_node_uuid,
@@ -24,9 +30,38 @@ class Edge:
                             {
                                 "key": "speed",
                                 "type": 2,
-                                "value_float32": 1.0
+                                "value_float32": self.speed
                             }
                     ]
                 }
             ]
         }
+        if self.extra:
+            edge.update(self.extra)
+        return edge
+
+    @classmethod
+    def from_formatted_edge(cls, data: dict) -> "Edge":
+        """Creates an edge from the Capra Hircus format, raises ValueError for an invalid edge"""
+        if not isinstance(data, dict):
+            raise ValueError("Edge must be an object")
+        uuid = data.get("uuid")
+        if not isinstance(uuid, str) or not uuid:
+            raise ValueError("Edge uuid must be a non-empty string")
+        for key in ("start_node_uuid", "end_node_uuid"):
+            if not isinstance(data.get(key), str) or not data[key]:
+                raise ValueError(f"Edge {uuid}: {key} must be a non-empty string")
+        speed = 1.0
+        actions = data.get("actions", [])
+        if not isinstance(actions, list):
+            raise ValueError(f"Edge {uuid}: actions must be a list")
+        for action in actions:
+            if not isinstance(action, dict) or action.get("uuid") != "drive":
+                continue
+            for parameter in action.get("parameters", []):
+                if isinstance(parameter, dict) and parameter.get("key") == "speed":
+                    speed = parameter.get("value_float32", parameter.get("value_float64"))
+                    if not isinstance(speed, (int, float)) or isinstance(speed, bool):
+                        raise ValueError(f"Edge {uuid}: speed must be a number")
+        extra = {key: value for key, value in data.items() if key not in EDGE_FIELDS}
+        return cls(uuid, data["start_node_uuid"], data["end_node_uuid"], float(speed), extra or None)
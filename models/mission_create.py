@@ -0,0 +1,29 @@
+"""Mission Pydantic Models"""
+from typing import List
+from pydantic import BaseModel, Field, model_validator
+from models.instruction_create import InstructionCreate
+
+# Most steps in one mission
+MAX_MISSION_STEPS = 1000
+
+
+class MissionStepCreate(BaseModel):
+    """Step of a mission, either a driving instruction or an uploaded path that is sent to the robot"""
+    instruction: InstructionCreate | None = None
+    odometry: bool = False
+    path_id: int | None = None
+    tolerance: float | None = Field(None, gt=0)
+    transport: str = "json"
+
+    @model_validator(mode="after")
+    def check_step(self):
+        """Validate that the step either drives or sends a path"""
+        if (self.instruction is None) == (self.path_id is None):
+            raise ValueError("A step needs either an instruction or a path_id")
+        return self
+
+
+class MissionCreate(BaseModel):
+    """Mission model, the steps are executed in order"""
+    name: str | None = None
+    steps: List[MissionStepCreate] = Field(..., min_length=1, max_length=MAX_MISSION_STEPS)
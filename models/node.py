@@ -1,8 +1,11 @@
 """Node data type"""
 from dataclasses import dataclass
 
+# Fields of a node in the Capra Hircus format that are kept as attributes, other fields are kept in extra
+NODE_FIELDS = ("uuid", "sequence_number", "position")
 
-@dataclass
+
+@dataclass(slots=True)
 class Node:
     """Class for defining a node"""
 
@@ -11,11 +14,13 @@ class Node:
     x: float
     y: float
     z: float = 0.0
+    # Other fields of the node as uploaded, like its actions and isIndoor
+    extra: dict | None = None
 
     def get_formatted_node(self) -> dict:
         """Returns a node in the corect format for Capra Hircus"""
 
-        return {
+        node = {
             "uuid": self.uuid,
             "sequence_number": self.sequence_number,
             "position": {
@@ -24,3 +29,32 @@ class Node:
                 "z": self.z
             }
         }
+        if self.extra:
+            node.update(self.extra)
+        return node
+
+    @classmethod
+    def from_formatted_node(cls, data: dict) -> "Node":
+        """Creates a node from the Capra Hircus format, raises ValueError for an invalid node"""
+        if not isinstance(data, dict):
+            raise ValueError("Node must be an object")
+        uuid = data.get("uuid")
+        if not isinstance(uuid, str) or not uuid:
+            raise ValueError("Node uuid must be a non-empty string")
+        sequence_number = data.get("sequence_number")
+        if not isinstance(sequence_number, int) or isinstance(sequence_number, bool) or sequence_number < 0:
+            raise ValueError(f"Node {uuid}: sequence_number must be a non-negative integer")
+        position = data.get("position")
+        if not isinstance(position, dict):
+            raise ValueError(f"Node {uuid}: position must be an object")
+        coordinates = []
+        for axis in ("x", "y", "z"):
+            value = position.get(axis, 0.0 if axis == "z" else None)
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError(f"Node {uuid}: position {axis} must be a number")
+            coordinates.append(float(value))
+        x, y, z = coordinates
+        if not -90 <= x <= 90 or not -180 <= y <= 180:
+            raise ValueError(f"Node {uuid}: position is not a valid latitude and longitude")
+        extra = {key: value for key, value in data.items() if key not in NODE_FIELDS}
+        return cls(uuid, sequence_number, x, y, z, extra or None)
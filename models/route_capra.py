@@ -1,35 +1,94 @@
 """Route Class in Capra Hircus format"""
-
-from edge import Edge
-from node import Node
+import sys
+from array import array
+from typing import Iterator
+import numpy as np
+from models.edge import Edge
+from models.node import Node
 from interfaces.route_abc import RouteAbstractClass
 
 
 class CapraRoute(RouteAbstractClass):
-    """Class for defining a route in Capra Hircus format"""
+    """
+    Class for defining a route in Capra Hircus format. Nodes and edges are stored as columns:
+    positions in one float64 array and uuids as interned strings, so a node and its edge take about
+    280 bytes instead of 1.3 kB as nested dicts (see benchmarks/bench_route_memory.py).
+    They are formatted to the Capra Hircus shape when the route is serialised.
+    A route loaded from an uploaded file keeps the file's other top-level fields in header, and the
+    other fields of its nodes and edges, so it is serialised as it was uploaded.
+    """
 
-    def __init__(self, path_uuid, path_encoding=0) -> None:
+    def __init__(self, path_uuid, path_encoding=0, header: dict | None = None) -> None:
         self.path_uuid = path_uuid
         self.path_encoding = path_encoding
-        self.nodes = []
-        self.edges = []
+        self.header = header
+        self._node_uuids: list[str] = []
+        self._sequence_numbers = array("q")
+        # x, y, z of every node after each other
+        self._positions = array("d")
+        # Extra fields of every node and edge, None for most routes
+        self._node_extras: list[dict | None] = []
+        self._edge_extras: list[dict | None] = []
+        self._edge_uuids: list[str] = []
+        self._start_node_uuids: list[str] = []
+        self._end_node_uuids: list[str] = []
+        self._speeds = array("d")
 
     def add_node(self, node: Node) -> None:
         """Adds a node to the route"""
-
-        self.nodes.append(
-            node.get_formatted_node()
-        )
+        self._node_uuids.append(sys.intern(node.uuid))
+        self._sequence_numbers.append(node.sequence_number)
+        self._positions.extend((node.x, node.y, node.z))
+        self._node_extras.append(node.extra)
 
     def add_edge(self, edge: Edge) -> None:
         """Adds an edge to the route"""
+        self._edge_uuids.append(sys.intern(edge.uuid))
+        self._start_node_uuids.append(sys.intern(edge.start_node_uuid))
+        self._end_node_uuids.append(sys.intern(edge.end_node_uuid))
+        self._speeds.append(edge.speed)
+        self._edge_extras.append(edge.extra)
+
+    @property
+    def node_count(self) -> int:
+        """Number of nodes in the route"""
+        return len(self._node_uuids)
+
+    @property
+    def edge_count(self) -> int:
+        """Number of edges in the route"""
+        return len(self._edge_uuids)
+
+    @property
+    def positions(self) -> np.ndarray:
+        """Copy of the node positions as an (n, 3) array of x (latitude), y (longitude) and z"""
+        return np.array(self._positions, dtype=np.float64).reshape(-1, 3)
+
+    def iter_nodes(self) -> Iterator[Node]:
+        """Yields the nodes of the route"""
+        positions = self._positions
+        for i, (uuid, sequence_number, extra) in enumerate(zip(self._node_uuids, self._sequence_numbers, self._node_extras)):
+            yield Node(uuid, sequence_number, positions[3 * i], positions[3 * i + 1], positions[3 * i + 2], extra)
+
+    def iter_edges(self) -> Iterator[Edge]:
+        """Yields the edges of the route"""
+        for edge in zip(self._edge_uuids, self._start_node_uuids, self._end_node_uuids, self._speeds, self._edge_extras):
+            yield Edge(*edge)
+
+    @property
+    def nodes(self) -> list[dict]:
+        """The nodes in the correct format for Capra Hircus"""
+        return [node.get_formatted_node() for node in self.iter_nodes()]
 
-        self.edges.append(
-            edge.get_formatted_edge()
-        )
+    @property
+    def edges(self) -> list[dict]:
+        """The edges in the correct format for Capra Hircus"""
+        return [edge.get_formatted_edge() for edge in self.iter_edges()]
 
     def get_formatted_route(self) -> dict:
-        """Returns a route in the correct format for Capra Hircus"""
+        """Returns a route in the correct format for Capra Hircus, with the header of an uploaded file as uploaded"""
+        if self.header is not None:
+            return {**self.header, "path_uuid": self.path_uuid, "nodes": self.nodes, "edges": self.edges}
 
         return {
             "path_uuid": self.path_uuid,
@@ -12,3 +12,10 @@ class GeoJSONRoute(RouteAbstractClass):
     def add_feature(self, feature) -> None:
         """Add GeoJSON feature to Route"""
         self.features.append(feature)
+
+    def get_formatted_route(self) -> dict:
+        """Returns the route as a GeoJSON FeatureCollection"""
+        return {
+            "type": "FeatureCollection",
+            "features": [feature.get_formatted_feature() for feature in self.features]
+        }
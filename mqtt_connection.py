@@ -0,0 +1,155 @@
+"""Module containing a connection manager for the MQTT client of a Capra Hircus"""
+import logging
+import threading
+import time
+from typing import Callable
+import paho.mqtt.client as mqtt
+from metrics import REGISTRY
+
+# pylint: disable=line-too-long
+
+STATE_DISCONNECTED = "disconnected"
+STATE_CONNECTING = "connecting"
+STATE_CONNECTED = "connected"
+
+# Reconnect backoff in seconds, doubled after every failed attempt
+MIN_RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+# Upper bound for QoS > 0 messages waiting in the client buffer
+MAX_QUEUED_MESSAGES = 100
+
+# The count of the publish histogram is the number of published messages
+PUBLISH_SECONDS = REGISTRY.histogram("capra_mqtt_publish_seconds", "Time spent handing a message to the MQTT client", ("broker", "topic"))
+DROPPED = REGISTRY.counter("capra_mqtt_dropped_total", "Messages dropped while the connection was down", ("broker", "topic"))
+PUBLISH_ERRORS = REGISTRY.counter("capra_mqtt_publish_errors_total", "Messages the MQTT client refused", ("broker", "topic"))
+
+
+class MqttConnection():
+    """
+    Owns the paho MQTT client, runs its network loop on a background thread,
+    reconnects with exponential backoff and publishes with a QoS per topic.
+    """
+
+    def __init__(self, broker_address: str, broker_port: int, topic_qos: dict | None = None) -> None:
+        self.broker_address = broker_address
+        self.broker_port = broker_port
+        self.topic_qos = dict(topic_qos or {})
+        self.state = STATE_DISCONNECTED
+        self.connected_at: float | None = None
+        self.disconnects = 0
+        self.dropped_messages = 0
+        self.subscriptions: dict[str, tuple[Callable[[mqtt.MQTTMessage], None], int]] = {}
+        self.broker = f"{broker_address}:{broker_port}"
+        self._publish_seconds = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.reconnect_delay_set(MIN_RECONNECT_DELAY, MAX_RECONNECT_DELAY)
+        self.client.max_queued_messages_set(MAX_QUEUED_MESSAGES)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+
+    def connect(self) -> None:
+        """Connects to the broker and starts the network loop, connection errors are raised"""
+        self.state = STATE_CONNECTING
+        try:
+            self.client.connect(self.broker_address, self.broker_port)
+        except (ConnectionError, OSError):
+            self.state = STATE_DISCONNECTED
+            raise
+        self.client.loop_start()
+
+    def disconnect(self) -> None:
+        """Disconnects from the broker and stops the network loop"""
+        self.state = STATE_DISCONNECTED
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def set_qos(self, topic: str, qos: int) -> None:
+        """Sets the QoS level used when publishing on a topic"""
+        if qos not in (0, 1, 2):
+            raise ValueError("QoS must be 0, 1 or 2")
+        self.topic_qos[topic] = qos
+
+    def subscribe(self, topic: str, callback: Callable[[mqtt.MQTTMessage], None], qos: int = 0) -> None:
+        """
+        Subscribes to a topic, callback is called on the network thread for every message.
+        Subscriptions are renewed after every reconnect.
+        """
+        self.subscriptions[topic] = (callback, qos)
+        if self.is_connected:
+            self.client.subscribe(topic, qos)
+
+    @property
+    def is_connected(self) -> bool:
+        """Returns True when the client is connected to the broker"""
+        return bool(self.client.is_connected())
+
+    def publish(self, topic: str, payload: str | bytes, qos: int | None = None, drop_if_disconnected: bool = False) -> mqtt.MQTTMessageInfo | None:
+        """
+        Publishes a message with the QoS configured for its topic, unless qos is given.
+        With drop_if_disconnected, the message is dropped instead of being buffered while
+        the connection is down, so stale messages are never delivered after a reconnect.
+        """
+        if drop_if_disconnected and not self.is_connected:
+            with self._lock:
+                self.dropped_messages += 1
+            DROPPED.labels(self.broker, topic).inc()
+            return None
+        if qos is None:
+            qos = self.topic_qos.get(topic, 0)
+        publish_seconds = self._publish_seconds.get(topic)
+        if publish_seconds is None:
+            publish_seconds = self._publish_seconds[topic] = PUBLISH_SECONDS.labels(self.broker, topic)
+        start = time.perf_counter()
+        try:
+            info = self.client.publish(topic, payload, qos=qos)
+        except Exception:
+            PUBLISH_ERRORS.labels(self.broker, topic).inc()
+            raise
+        publish_seconds.observe(time.perf_counter() - start)
+        return info
+
+    def get_status(self) -> dict:
+        """Returns the connection state"""
+        return {
+            "broker_address": self.broker_address,
+            "broker_port": self.broker_port,
+            "state": STATE_CONNECTED if self.is_connected else self.state,
+            "connected_at": self.connected_at,
+            "disconnects": self.disconnects,
+            "dropped_messages": self.dropped_messages
+        }
+
+    def _on_connect(self, _client, _userdata, _flags, reason_code, _properties) -> None:
+        """Called by the network loop when the broker answered the connection request"""
+        if reason_code.is_failure:
+            self.state = STATE_CONNECTING
+            self.logger.error("Connection to %s:%d failed: %s",
+                              self.broker_address, self.broker_port, reason_code)
+            return
+        self.state = STATE_CONNECTED
+        self.connected_at = time.time()
+        self.logger.info("Connected to %s:%d", self.broker_address, self.broker_port)
+        if self.subscriptions:
+            self.client.subscribe([(topic, qos) for topic, (_, qos) in self.subscriptions.items()])
+
+    def _on_disconnect(self, _client, _userdata, _flags, reason_code, _properties) -> None:
+        """Called by the network loop when the connection is lost, the loop reconnects by itself"""
+        if self.state == STATE_DISCONNECTED:
+            return
+        self.state = STATE_CONNECTING
+        self.disconnects += 1
+        self.logger.warning("Connection to %s:%d lost (%s), reconnecting",
+                            self.broker_address, self.broker_port, reason_code)
+
+    def _on_message(self, _client, _userdata, message: mqtt.MQTTMessage) -> None:
+        """Called by the network loop for every received message, dispatches it to the subscribers"""
+        for topic, (callback, _) in self.subscriptions.items():
+            if mqtt.topic_matches_sub(topic, message.topic):
+                try:
+                    callback(message)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    self.logger.error("Error handling message on %s: %s", message.topic, e)
@@ -0,0 +1,59 @@
+"""Module containing distance tracking from the odometry of a Capra Hircus"""
+import json
+import math
+import threading
+from clock import SYSTEM_CLOCK, Clock
+
+# pylint: disable=line-too-long
+
+
+def parse_odometry_position(payload: bytes | str | dict) -> tuple[float, float] | None:
+    """
+    Returns the x, y position in metres from an odometry message.
+    Supports nav_msgs/Odometry (pose.pose.position), geometry_msgs/PoseStamped (pose.position)
+    and flat (position) messages, returns None when no position is found.
+    """
+    try:
+        data = json.loads(payload) if isinstance(payload, (bytes, str)) else payload
+        pose = data.get("pose", data)
+        pose = pose.get("pose", pose)
+        position = pose["position"]
+        return float(position["x"]), float(position["y"])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+class OdometryTracker:
+    """Integrates the distance travelled by the robot from consecutive odometry positions"""
+
+    def __init__(self, clock: Clock = SYSTEM_CLOCK) -> None:
+        self.clock = clock
+        self.travelled = 0.0
+        self.updates = 0
+        self.last_position: tuple[float, float] | None = None
+        self.last_update: float | None = None
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        """Starts a new measurement, the next position received is the starting point"""
+        with self._lock:
+            self.travelled = 0.0
+            self.updates = 0
+            self.last_position = None
+
+    def add_position(self, x: float, y: float) -> None:
+        """Adds the distance between the previous and the given position"""
+        with self._lock:
+            if self.last_position is not None:
+                self.travelled += math.hypot(x - self.last_position[0], y - self.last_position[1])
+            self.last_position = (x, y)
+            self.updates += 1
+            self.last_update = self.clock.monotonic()
+
+    def add_message(self, payload: bytes | str | dict) -> bool:
+        """Adds the position of an odometry message, returns False when it contains no position"""
+        position = parse_odometry_position(payload)
+        if position is None:
+            return False
+        self.add_position(*position)
+        return True
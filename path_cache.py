@@ -0,0 +1,124 @@
+"""Module containing a content-addressed cache of encoded send_path payloads"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable
+import path_simplify
+from path_transport import PathTransport
+
+# pylint: disable=line-too-long
+
+# Encoded payloads kept in memory at most, by number and by total size in bytes
+PATH_CACHE_SIZE = 32
+PATH_CACHE_BYTES = 64 * 1024 * 1024
+# Separators of compact payloads, without the whitespace json.dumps adds by default
+COMPACT_SEPARATORS = (",", ":")
+# Sources of the encoded document, a path file is sent as it is and a stored path as loaded from the database
+SOURCE_FILE = "file"
+SOURCE_STORED = "stored"
+
+
+class PathPayloadCache():
+    """
+    Keeps the encoded payloads of recently sent paths, keyed by the SHA-256 of their contents, the source
+    of the document, the simplification and the transport encoding applied, so sending a path again only
+    costs a publish. Files are looked up
+    by their real path and re-read when their modification time or size changes; two files with
+    the same contents share one payload.
+    """
+
+    def __init__(self, maxsize: int = PATH_CACHE_SIZE, max_bytes: int = PATH_CACHE_BYTES, compact: bool = True) -> None:
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.compact = compact
+        self.hits = 0
+        self.misses = 0
+        self._payloads: OrderedDict[tuple, bytes] = OrderedDict()
+        self._files: OrderedDict[str, tuple[int, int, str]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def encode(self, data: dict) -> bytes:
+        """Encodes a path as a send_path payload"""
+        separators = COMPACT_SEPARATORS if self.compact else None
+        return json.dumps(data, separators=separators).encode("utf-8")
+
+    def get(self, key: tuple, count_miss: bool = True) -> bytes | None:
+        """Returns a cached payload and marks it as recently used"""
+        with self._lock:
+            payload = self._payloads.get(key)
+            if payload is None:
+                self.misses += count_miss
+                return None
+            self._payloads.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key: tuple, payload: bytes) -> None:
+        """Caches a payload, evicting the least recently used ones over the limits"""
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._payloads.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._payloads[key] = payload
+            self._size += len(payload)
+            while len(self._payloads) > self.maxsize or self._size > self.max_bytes:
+                _, evicted = self._payloads.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get_or_encode(self, content_hash: str, load: Callable[[], dict], tolerance: float | None = None, min_spacing: float = 0.0,
+                      transport: PathTransport | None = None, source: str = SOURCE_STORED) -> bytes:
+        """
+        Returns the payload of a path, loading, simplifying and encoding it on a cache miss.
+        The source tells apart documents loaded differently from the same contents, like a file and its stored path.
+        """
+        key = (content_hash, source, tolerance, min_spacing, transport)
+        payload = self.get(key)
+        if payload is None:
+            data = load()
+            if tolerance is not None and data:
+                data, _ = path_simplify.simplify_path(data, tolerance, min_spacing)
+            payload = transport.encode(data) if transport is not None else self.encode(data)
+            self.put(key, payload)
+        return payload
+
+    def get_file_payload(self, filename: str, tolerance: float | None = None, min_spacing: float = 0.0,
+                         transport: PathTransport | None = None) -> bytes:
+        """
+        Returns the payload of a path file. The file is only read when it is not cached or it changed
+        on disk since it was read. Raises FileNotFoundError when the file does not exist.
+        """
+        real_path = os.path.realpath(filename)
+        stat = os.stat(real_path)
+        with self._lock:
+            entry = self._files.get(real_path)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            payload = self.get((entry[2], SOURCE_FILE, tolerance, min_spacing, transport), count_miss=False)
+            if payload is not None:
+                return payload
+
+        with open(real_path, "rb") as f:
+            contents = f.read()
+        content_hash = hashlib.sha256(contents).hexdigest()
+        with self._lock:
+            self._files[real_path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+            self._files.move_to_end(real_path)
+            while len(self._files) > self.maxsize:
+                self._files.popitem(last=False)
+        return self.get_or_encode(content_hash, lambda: json.loads(contents), tolerance, min_spacing, transport, SOURCE_FILE)
+
+    def clear(self) -> None:
+        """Removes all cached payloads"""
+        with self._lock:
+            self._payloads.clear()
+            self._files.clear()
+            self._size = 0
+
+    def get_stats(self) -> dict:
+        """Returns the number of cached payloads, their total size and the hit and miss counts"""
+        with self._lock:
+            return {"entries": len(self._payloads), "bytes": self._size, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,360 @@
+"""Module for streaming, validated ingestion of uploaded Capra Hircus path files"""
+import codecs
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from typing import BinaryIO, Iterator
+from models.edge import Edge
+from models.node import Node
+from path_store import StoredPath, PathNode, PathEdge, find_path
+
+# pylint: disable=line-too-long
+
+# Bytes read from the upload at once
+CHUNK_SIZE = 64 * 1024
+# Largest accepted path file in bytes, and most nodes and edges in one path
+MAX_PATH_SIZE = 256 * 1024 * 1024
+MAX_ELEMENTS = 2_000_000
+# Largest single node, edge or header value in bytes, bounds the parse buffer
+MAX_VALUE_SIZE = 64 * 1024
+# Rows written per INSERT statement
+INSERT_BATCH_SIZE = 5000
+# Top-level arrays that are parsed one element at a time
+STREAMED_KEYS = ("nodes", "edges")
+# Separators of the JSON stored for the header and the extra fields of nodes and edges
+COMPACT_SEPARATORS = (",", ":")
+
+_WHITESPACE = " \t\n\r"
+# Characters that can continue a number
+_NUMBER_CHARS = "0123456789+-.eE"
+# Decoding errors this close to the end of the buffer can be a token cut by the chunk, like -Infinity or \uXXXX
+_TRUNCATED_TOKEN_SIZE = 10
+
+# Parser states, what is expected next
+_START = "start"
+_KEY_OR_END = "key or end"
+_KEY = "key"
+_COLON = "colon"
+_VALUE = "value"
+_NEXT_KEY = "next key"
+_ELEMENT_OR_END = "element or end"
+_ELEMENT = "element"
+_NEXT_ELEMENT = "next element"
+_DONE = "done"
+
+
+class PathIngestError(ValueError):
+    """Raised when an uploaded path file is not a valid Capra Hircus path"""
+
+
+class PathTooLargeError(PathIngestError):
+    """Raised when an uploaded path file exceeds the size limits"""
+
+
+class PathStreamParser():
+    """
+    Incremental parser of a Capra Hircus path document. Bytes are fed in chunks of any size;
+    every node and edge is yielded as soon as it is complete as ("nodes", node) or ("edges", edge),
+    other top-level values as (key, value). Only one value is held in memory at a time.
+    """
+
+    def __init__(self, max_value_size: int = MAX_VALUE_SIZE) -> None:
+        self.max_value_size = max_value_size
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = _START
+        self._key = None
+
+    def feed(self, chunk: bytes) -> Iterator[tuple[str, object]]:
+        """Parses the next chunk of the document"""
+        try:
+            text = self._text.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise PathIngestError("Path file is not valid UTF-8") from e
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        yield from self._parse(final=False)
+
+    def close(self) -> Iterator[tuple[str, object]]:
+        """Parses the rest of the document, raises PathIngestError when it is incomplete"""
+        yield from self.feed(b"")
+        yield from self._parse(final=True)
+        if self._state != _DONE:
+            raise PathIngestError("Unexpected end of the path file")
+
+    def _skip_whitespace(self) -> int:
+        """Moves past whitespace, returns the position of the next character"""
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return pos
+
+    def _is_truncated(self, error: json.JSONDecodeError) -> bool:
+        """Returns whether a decoding error is caused by the value running past the end of the buffer"""
+        return error.msg.startswith("Unterminated string") or len(self._buffer) - error.pos < _TRUNCATED_TOKEN_SIZE
+
+    def _decode(self, pos: int, final: bool) -> tuple[object, int] | None:
+        """
+        Decodes the value at pos, returns None when more data is needed. Values that are cut at the end
+        of the buffer wait for the next chunk, any other syntax error is raised at once.
+        """
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, pos)
+        except json.JSONDecodeError as e:
+            if final or not self._is_truncated(e):
+                raise PathIngestError(f"Invalid JSON: {e.msg} at character {e.pos}") from e
+            value, end = None, None
+        # A value at the end of the buffer can continue in the next chunk, like a number or its exponent
+        if end is None or (not final and len(self._buffer) - end <= 2 and not self._buffer[end:].strip(_NUMBER_CHARS)):
+            if len(self._buffer) - pos > self.max_value_size:
+                raise PathTooLargeError(f"A value in the path file is larger than {self.max_value_size} bytes")
+            return None
+        return value, end
+
+    def _parse(self, final: bool) -> Iterator[tuple[str, object]]:
+        """Parses as much of the buffer as possible"""
+        while True:
+            pos = self._skip_whitespace()
+            if pos == len(self._buffer):
+                return
+            char = self._buffer[pos]
+            state = self._state
+
+            if state == _START:
+                if char != "{":
+                    raise PathIngestError("Path file must contain a JSON object")
+                self._pos, self._state = pos + 1, _KEY_OR_END
+            elif state in (_KEY_OR_END, _NEXT_KEY) and char == "}":
+                self._pos, self._state = pos + 1, _DONE
+            elif state == _NEXT_KEY:
+                if char != ",":
+                    raise PathIngestError(f"Expected ',' or '}}' at character {pos}")
+                self._pos, self._state = pos + 1, _KEY
+            elif state in (_KEY_OR_END, _KEY):
+                if char != '"':
+                    raise PathIngestError(f"Expected a key at character {pos}")
+                decoded = self._decode(pos, final)
+                if decoded is None:
+                    return
+                self._key, self._pos = decoded
+                self._state = _COLON
+            elif state == _COLON:
+                if char != ":":
+                    raise PathIngestError(f"Expected ':' at character {pos}")
+                self._pos, self._state = pos + 1, _VALUE
+            elif state == _VALUE:
+                if self._key in STREAMED_KEYS:
+                    if char != "[":
+                        raise PathIngestError(f"{self._key} must be a list")
+                    self._pos, self._state = pos + 1, _ELEMENT_OR_END
+                    continue
+                decoded = self._decode(pos, final)
+                if decoded is None:
+                    return
+                value, self._pos = decoded
+                self._state = _NEXT_KEY
+                yield self._key, value
+            elif state in (_ELEMENT_OR_END, _NEXT_ELEMENT) and char == "]":
+                self._pos, self._state = pos + 1, _NEXT_KEY
+            elif state == _NEXT_ELEMENT:
+                if char != ",":
+                    raise PathIngestError(f"Expected ',' or ']' at character {pos}")
+                self._pos, self._state = pos + 1, _ELEMENT
+            elif state in (_ELEMENT_OR_END, _ELEMENT):
+                decoded = self._decode(pos, final)
+                if decoded is None:
+                    return
+                value, self._pos = decoded
+                self._state = _NEXT_ELEMENT
+                yield self._key, value
+            else:
+                raise PathIngestError(f"Unexpected data after the path at character {pos}")
+
+
+class _PathWriter():
+    """
+    Validates nodes and edges and stages their rows in temporary files while the upload is read,
+    so the path tables are only written once the whole file is valid, in one short transaction.
+    """
+
+    def __init__(self, max_elements: int) -> None:
+        self.max_elements = max_elements
+        self.header = {}
+        self.node_count = 0
+        self.edge_count = 0
+        self.node_uuids = set()
+        self.referenced_uuids = set()
+        # Rows are staged in batches of INSERT_BATCH_SIZE
+        self._node_rows = []
+        self._edge_rows = []
+        self._node_file = tempfile.TemporaryFile()
+        self._edge_file = tempfile.TemporaryFile()
+
+    def __enter__(self) -> "_PathWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._node_file.close()
+        self._edge_file.close()
+
+    def add(self, key: str, value) -> None:
+        """Adds a parsed top-level value of the document"""
+        if key == "nodes":
+            self.add_node(value)
+        elif key == "edges":
+            self.add_edge(value)
+        else:
+            self.header[key] = value
+
+    def add_node(self, data) -> None:
+        """Validates a node and stages its row"""
+        try:
+            node = Node.from_formatted_node(data)
+        except ValueError as e:
+            raise PathIngestError(f"Invalid node {self.node_count}: {e}") from e
+        if node.uuid in self.node_uuids:
+            raise PathIngestError(f"Duplicate node uuid: {node.uuid}")
+        self.node_uuids.add(node.uuid)
+        self._node_rows.append({
+            "position": self.node_count, "uuid": node.uuid, "sequence_number": node.sequence_number,
+            "x": node.x, "y": node.y, "z": node.z, "extra": _dump_extra(node.extra)
+        })
+        self.node_count += 1
+        self._check_size()
+        if len(self._node_rows) >= INSERT_BATCH_SIZE:
+            self.flush()
+
+    def add_edge(self, data) -> None:
+        """Validates an edge and stages its row, its nodes are checked at the end"""
+        try:
+            edge = Edge.from_formatted_edge(data)
+        except ValueError as e:
+            raise PathIngestError(f"Invalid edge {self.edge_count}: {e}") from e
+        for uuid in (edge.start_node_uuid, edge.end_node_uuid):
+            if uuid not in self.node_uuids:
+                self.referenced_uuids.add(uuid)
+        self._edge_rows.append({
+            "position": self.edge_count, "uuid": edge.uuid, "start_node_uuid": edge.start_node_uuid,
+            "end_node_uuid": edge.end_node_uuid, "speed": edge.speed, "extra": _dump_extra(edge.extra)
+        })
+        self.edge_count += 1
+        self._check_size()
+        if len(self._edge_rows) >= INSERT_BATCH_SIZE:
+            self.flush()
+
+    def _check_size(self) -> None:
+        if self.node_count + self.edge_count > self.max_elements:
+            raise PathTooLargeError(f"Path files can contain at most {self.max_elements} nodes and edges")
+
+    def flush(self) -> None:
+        """Moves the staged batches from memory to the temporary files"""
+        if self._node_rows:
+            pickle.dump(self._node_rows, self._node_file, pickle.HIGHEST_PROTOCOL)
+            self._node_rows = []
+        if self._edge_rows:
+            pickle.dump(self._edge_rows, self._edge_file, pickle.HIGHEST_PROTOCOL)
+            self._edge_rows = []
+
+    def finish(self) -> None:
+        """Checks the path as a whole once every node and edge was read"""
+        self.flush()
+        if not self.node_count:
+            raise PathIngestError("Path must contain at least one node")
+        missing = self.referenced_uuids - self.node_uuids
+        if missing:
+            raise PathIngestError(f"Edges refer to unknown nodes: {', '.join(sorted(missing)[:5])}")
+
+    def write(self, db, path_id: int) -> None:
+        """Inserts the staged rows of the path, one batch at a time"""
+        for table, staged in ((PathNode.__table__, self._node_file), (PathEdge.__table__, self._edge_file)):
+            staged.seek(0)
+            while True:
+                try:
+                    batch = pickle.load(staged)
+                except EOFError:
+                    break
+                for row in batch:
+                    row["path_id"] = path_id
+                db.execute(table.insert(), batch)
+
+
+def ingest_path(stream: BinaryIO, session_factory, filename: str | None = None,
+                max_size: int = MAX_PATH_SIZE, max_elements: int = MAX_ELEMENTS, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Parses, validates and stores a Capra Hircus path file read from a binary stream. The file is
+    read and validated first, its rows are staged in temporary files, and they are stored in one
+    transaction afterwards, so a slow upload never holds the database's write lock.
+    Memory use does not depend on the size of the file, apart from the set of node uuids.
+    Returns the metadata of the stored path, or of the stored path with the same contents.
+    Raises PathIngestError for an invalid file.
+    """
+    parser = PathStreamParser()
+    digest = hashlib.sha256()
+    size = 0
+    with _PathWriter(max_elements) as writer:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise PathTooLargeError(f"Path files can be at most {max_size} bytes")
+            digest.update(chunk)
+            for key, value in parser.feed(chunk):
+                writer.add(key, value)
+        for key, value in parser.close():
+            writer.add(key, value)
+        writer.finish()
+        path_uuid = _get_path_uuid(writer.header, filename)
+        path_encoding = _get_path_encoding(writer.header)
+
+        with session_factory() as db:
+            # Paths are content-addressed, uploading the same file again returns the stored path
+            existing = find_path(db, content_hash=digest.hexdigest())
+            if existing is not None:
+                return existing.get_formatted_path()
+
+            path = StoredPath(path_uuid=path_uuid, path_encoding=path_encoding, filename=filename,
+                              header=json.dumps(writer.header, separators=COMPACT_SEPARATORS), content_hash=digest.hexdigest(),
+                              size=size, node_count=writer.node_count, edge_count=writer.edge_count)
+            try:
+                db.add(path)
+                db.flush()
+                writer.write(db, path.id)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            logging.getLogger(__name__).info("Stored path %s with %d nodes and %d edges as %d",
+                                             path.path_uuid, path.node_count, path.edge_count, path.id)
+            return path.get_formatted_path()
+
+
+def _get_path_uuid(header: dict, filename: str | None) -> str:
+    """Returns the path_uuid of the document, or the file name without extension when it is missing"""
+    path_uuid = header.get("path_uuid")
+    if path_uuid is None and filename:
+        path_uuid = os.path.splitext(os.path.basename(filename))[0]
+    if not isinstance(path_uuid, str) or not path_uuid:
+        raise PathIngestError("path_uuid must be a non-empty string")
+    return path_uuid
+
+
+def _get_path_encoding(header: dict) -> int:
+    """Returns the path encoding of the document, files from the Capra tools call it position_encoding"""
+    encoding = header.get("path_encoding", header.get("position_encoding", 0))
+    if not isinstance(encoding, int) or isinstance(encoding, bool):
+        raise PathIngestError("path_encoding must be an integer")
+    return encoding
+
+
+def _dump_extra(extra: dict | None) -> str | None:
+    """Returns the extra fields of a node or edge as stored, None when there are none"""
+    return json.dumps(extra, separators=COMPACT_SEPARATORS) if extra else None
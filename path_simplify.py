@@ -0,0 +1,126 @@
+"""Module for simplifying Capra Hircus paths before they are sent to the robot"""
+import json
+import numpy as np
+import geometry
+from models.route_capra import CapraRoute
+from models.route_geojson import GeoJSONRoute
+
+# pylint: disable=line-too-long
+
+
+def project_to_metres(positions: np.ndarray) -> np.ndarray:
+    """Projects (lat, lon) degrees onto a local plane in metres, accurate for paths of a few kilometres"""
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    if not len(positions):
+        return positions
+    lat0 = np.radians(positions[:, 0].mean())
+    scale = np.radians(1.0) * geometry.EARTH_RADIUS
+    return np.column_stack((positions[:, 0] * scale, positions[:, 1] * scale * np.cos(lat0)))
+
+
+def douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Returns a mask of the points kept by the Douglas-Peucker algorithm: every removed point
+    lies within tolerance of the simplified line. Distances of a span to its chord are computed
+    in one vectorised step, typically O(n log n) for the whole path.
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        span = points[first + 1:last]
+        chord = end - start
+        chord_length = np.hypot(chord[0], chord[1])
+        if chord_length == 0:
+            deviation = np.hypot(span[:, 0] - start[0], span[:, 1] - start[1])
+        else:
+            deviation = np.abs(chord[0] * (span[:, 1] - start[1]) - chord[1] * (span[:, 0] - start[0])) / chord_length
+        index = int(np.argmax(deviation))
+        if deviation[index] > tolerance:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def min_spacing_mask(points: np.ndarray, spacing: float) -> np.ndarray:
+    """Returns a mask keeping the first point of every spacing metres along the path, plus the last point"""
+    keep = np.ones(len(points), dtype=bool)
+    if spacing <= 0 or len(points) < 3:
+        return keep
+    steps = np.hypot(*np.diff(points, axis=0).T)
+    buckets = np.floor(np.concatenate(([0.0], np.cumsum(steps))) / spacing)
+    keep[:] = False
+    keep[np.unique(buckets, return_index=True)[1]] = True
+    keep[-1] = True
+    return keep
+
+
+def simplify_positions(positions: np.ndarray, tolerance: float = 0.5, min_spacing: float = 0.0) -> np.ndarray:
+    """Returns the indices of the (lat, lon) positions kept after simplification"""
+    points = project_to_metres(positions)
+    keep = min_spacing_mask(points, min_spacing)
+    indices = np.flatnonzero(keep)
+    if tolerance > 0 and len(indices) > 2:
+        indices = indices[douglas_peucker(points[indices], tolerance)]
+    return indices
+
+
+def simplify_path(path: dict | CapraRoute, tolerance: float = 0.5, min_spacing: float = 0.0) -> tuple[dict, dict]:
+    """
+    Simplifies a Capra Hircus path with a tolerance and minimum node spacing in metres.
+    Edges between kept nodes take the actions of the first original edge they replace.
+    Returns the simplified path and a report of the node count and payload size reduction.
+    """
+    if isinstance(path, CapraRoute):
+        path = path.get_formatted_route()
+    nodes = path.get("nodes", [])
+    indices = simplify_positions(geometry.load_positions(path), tolerance, min_spacing)
+
+    edges_by_start = {edge["start_node_uuid"]: edge for edge in path.get("edges", [])}
+    kept_nodes = [nodes[i] for i in indices.tolist()]
+    kept_edges = []
+    for start, end in zip(kept_nodes, kept_nodes[1:]):
+        edge = edges_by_start.get(start["uuid"])
+        if edge is not None:
+            kept_edges.append({**edge, "end_node_uuid": end["uuid"]})
+
+    simplified = {**path, "nodes": kept_nodes, "edges": kept_edges}
+    bytes_before = len(json.dumps(path))
+    bytes_after = len(json.dumps(simplified))
+    report = {
+        "nodes_before": len(nodes),
+        "nodes_after": len(kept_nodes),
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "reduction": 1 - bytes_after / bytes_before if bytes_before else 0.0
+    }
+    return simplified, report
+
+
+def simplify_line(coordinates: list, tolerance: float = 0.5, min_spacing: float = 0.0) -> list:
+    """Simplifies the coordinates of a GeoJSON LineString, positions are (lon, lat[, alt]) or Coordinates"""
+    if len(coordinates) < 3:
+        return list(coordinates)
+    lon_lat = [position.get_coordinate() if hasattr(position, "get_coordinate") else position for position in coordinates]
+    positions = np.array([(position[1], position[0]) for position in lon_lat], dtype=np.float64)
+    return [coordinates[i] for i in simplify_positions(positions, tolerance, min_spacing).tolist()]
+
+
+def simplify_geojson_route(route: GeoJSONRoute, tolerance: float = 0.5, min_spacing: float = 0.0) -> dict:
+    """Simplifies every LineString of a GeoJSONRoute in place, returns the node count reduction"""
+    nodes_before = nodes_after = 0
+    for feature in route.features:
+        if feature.feature_type == "LineString":
+            nodes_before += len(feature.coordinates)
+            feature.coordinates = simplify_line(feature.coordinates, tolerance, min_spacing)
+            nodes_after += len(feature.coordinates)
+    return {"nodes_before": nodes_before, "nodes_after": nodes_after}
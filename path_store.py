@@ -0,0 +1,108 @@
+"""Module containing the database tables of uploaded Capra Hircus paths"""
+import json
+from datetime import datetime
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey
+from sqlalchemy.orm import Session
+from database import Base
+from models.edge import Edge
+from models.node import Node
+from models.route_capra import CapraRoute
+
+# pylint: disable=line-too-long
+
+
+class StoredPath(Base):
+    """
+    Creates the table of uploaded paths, one row per upload. header holds the other top-level
+    fields of the file as JSON, like timestamp, map_uuid and position_encoding.
+    """
+    __tablename__ = "paths"
+    id = Column(Integer, primary_key=True, index=True)
+    path_uuid = Column(String, nullable=False, index=True)
+    path_encoding = Column(Integer, nullable=False, default=0)
+    filename = Column(String)
+    content_hash = Column(String, index=True)
+    size = Column(Integer, nullable=False)
+    node_count = Column(Integer, nullable=False)
+    edge_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    header = Column(Text)
+
+    def get_formatted_path(self) -> dict:
+        """Returns the metadata of the path"""
+        return {
+            "path_id": self.id,
+            "path_uuid": self.path_uuid,
+            "filename": self.filename,
+            "content_hash": self.content_hash,
+            "size": self.size,
+            "nodes": self.node_count,
+            "edges": self.edge_count
+        }
+
+
+class PathNode(Base):
+    """Creates the table of path nodes, ordered by their position in the uploaded file"""
+    __tablename__ = "path_nodes"
+    path_id = Column(Integer, ForeignKey("paths.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    uuid = Column(String, nullable=False)
+    sequence_number = Column(Integer, nullable=False)
+    x = Column(Float, nullable=False)
+    y = Column(Float, nullable=False)
+    z = Column(Float, nullable=False)
+    # Other fields of the node as JSON, like actions and isIndoor
+    extra = Column(Text)
+
+
+class PathEdge(Base):
+    """Creates the table of path edges, ordered by their position in the uploaded file"""
+    __tablename__ = "path_edges"
+    path_id = Column(Integer, ForeignKey("paths.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    uuid = Column(String, nullable=False)
+    start_node_uuid = Column(String, nullable=False)
+    end_node_uuid = Column(String, nullable=False)
+    speed = Column(Float, nullable=False)
+    # Other fields of the edge as JSON, like its actions
+    extra = Column(Text)
+
+
+def load_route(db: Session, path_id: int) -> CapraRoute | None:
+    """
+    Loads a stored path as a CapraRoute, returns None when the path does not exist.
+    Extra fields that are the same for many nodes or edges, like empty actions, are decoded once and shared.
+    """
+    path = db.get(StoredPath, path_id)
+    if path is None:
+        return None
+    route = CapraRoute(path.path_uuid, path.path_encoding, json.loads(path.header) if path.header else None)
+    extras: dict[str, dict] = {}
+
+    def load_extra(text: str | None) -> dict | None:
+        if text is None:
+            return None
+        extra = extras.get(text)
+        if extra is None:
+            extra = extras[text] = json.loads(text)
+        return extra
+
+    nodes = db.query(PathNode.uuid, PathNode.sequence_number, PathNode.x, PathNode.y, PathNode.z, PathNode.extra).filter(
+        PathNode.path_id == path_id).order_by(PathNode.position)
+    for row in nodes:
+        route.add_node(Node(row.uuid, row.sequence_number, row.x, row.y, row.z, load_extra(row.extra)))
+    edges = db.query(PathEdge.uuid, PathEdge.start_node_uuid, PathEdge.end_node_uuid, PathEdge.speed, PathEdge.extra).filter(
+        PathEdge.path_id == path_id).order_by(PathEdge.position)
+    for row in edges:
+        route.add_edge(Edge(row.uuid, row.start_node_uuid, row.end_node_uuid, row.speed, load_extra(row.extra)))
+    return route
+
+
+def find_path(db: Session, path_uuid: str | None = None, content_hash: str | None = None) -> StoredPath | None:
+    """Returns the most recently stored path with a path_uuid and/or content hash"""
+    query = db.query(StoredPath)
+    if path_uuid is not None:
+        query = query.filter(StoredPath.path_uuid == path_uuid)
+    if content_hash is not None:
+        query = query.filter(StoredPath.content_hash == content_hash)
+    return query.order_by(StoredPath.id.desc()).first()
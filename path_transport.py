@@ -0,0 +1,123 @@
+"""Module containing compact, compressed and chunked encodings of send_path messages"""
+import hashlib
+import json
+import zlib
+from dataclasses import dataclass
+
+# pylint: disable=line-too-long
+
+# Chunked paths are published on their own topic, the plain send_path topic only accepts JSON
+TOPIC_SEND_PATH_CHUNK = "capra/navigation/send_path_chunk"
+# Bytes of path data per chunk message
+CHUNK_SIZE = 32 * 1024
+# Decimals kept of latitude and longitude (about 1 cm) and of the altitude in metres (1 mm)
+POSITION_DECIMALS = 7
+ALTITUDE_DECIMALS = 3
+COMPACT_SEPARATORS = (",", ":")
+# Bytes of an MQTT PUBLISH packet besides topic and payload: fixed header, topic length, packet id
+MQTT_FIXED_HEADER = 2
+MQTT_TOPIC_LENGTH = 2
+MQTT_PACKET_ID = 2
+# Bytes of the PUBACK packet the broker sends for a QoS 1 message
+MQTT_PUBACK = 4
+
+
+@dataclass(frozen=True)
+class PathTransport:
+    """
+    Class for defining how a path is encoded for sending. Positions are rounded to a number of
+    decimals (None keeps them as they are) and written as compact JSON with the shortest float repr.
+    With compression or a chunk size, the path is sent as zlib compressed and/or sequenced chunk
+    messages on TOPIC_SEND_PATH_CHUNK, every chunk starts with a JSON header line describing the
+    transfer: transfer_id, index, count, encoding ("json" or "zlib"), size and sha256 of the whole payload.
+    """
+
+    name: str = "compact"
+    decimals: int | None = POSITION_DECIMALS
+    compress: bool = False
+    chunk_size: int | None = None
+
+    @property
+    def chunked(self) -> bool:
+        """Whether the path is sent as chunk messages instead of one JSON message"""
+        return self.compress or self.chunk_size is not None
+
+    def encode(self, data: dict) -> bytes:
+        """Encodes a path as compact JSON with rounded positions, compressed when enabled"""
+        if self.decimals is not None:
+            data = quantize_path(data, self.decimals)
+        payload = json.dumps(data, separators=COMPACT_SEPARATORS).encode("utf-8")
+        if self.compress:
+            payload = zlib.compress(payload, 9)
+        return payload
+
+    def get_messages(self, payload: bytes) -> list[bytes]:
+        """Splits an encoded path into chunk messages, each with a header line for reassembly"""
+        chunk_size = self.chunk_size or len(payload) or 1
+        digest = hashlib.sha256(payload).hexdigest()
+        count = max(1, -(-len(payload) // chunk_size))
+        messages = []
+        for index in range(count):
+            header = {
+                "transfer_id": digest[:16],
+                "index": index,
+                "count": count,
+                "encoding": "zlib" if self.compress else "json",
+                "size": len(payload),
+                "sha256": digest
+            }
+            chunk = payload[index * chunk_size:(index + 1) * chunk_size]
+            messages.append(json.dumps(header, separators=COMPACT_SEPARATORS).encode("utf-8") + b"\n" + chunk)
+        return messages
+
+
+# Transports that can be selected by name, None sends the path as plain JSON like the Capra tools
+TRANSPORTS = {
+    "json": None,
+    "compact": PathTransport("compact"),
+    "compressed": PathTransport("compressed", compress=True),
+    "chunked": PathTransport("chunked", compress=True, chunk_size=CHUNK_SIZE)
+}
+
+
+def quantize_path(data: dict, decimals: int = POSITION_DECIMALS) -> dict:
+    """Returns a copy of a path with latitude and longitude rounded to decimals, and altitude to millimetres"""
+    nodes = []
+    for node in data.get("nodes", []):
+        position = node["position"]
+        nodes.append({**node, "position": {
+            "x": round(position["x"], decimals),
+            "y": round(position["y"], decimals),
+            "z": round(position.get("z", 0.0), ALTITUDE_DECIMALS)
+        }})
+    return {**data, "nodes": nodes}
+
+
+def reassemble(messages: list[bytes]) -> dict:
+    """Reassembles chunk messages received in any order into the path, raises ValueError when they do not match"""
+    chunks = {}
+    header = None
+    for message in messages:
+        header_line, chunk = message.split(b"\n", 1)
+        header = json.loads(header_line)
+        chunks[header["index"]] = chunk
+    if header is None or sorted(chunks) != list(range(header["count"])):
+        raise ValueError("Chunks of the path are missing")
+    payload = b"".join(chunks[index] for index in range(header["count"]))
+    if hashlib.sha256(payload).hexdigest() != header["sha256"]:
+        raise ValueError("Checksum of the reassembled path does not match")
+    if header["encoding"] == "zlib":
+        payload = zlib.decompress(payload)
+    return json.loads(payload)
+
+
+def bytes_on_air(messages: list[bytes], topic: str, qos: int = 1) -> int:
+    """Returns the bytes sent over the network for publishing messages, including MQTT packet overhead"""
+    total = 0
+    for message in messages:
+        remaining = MQTT_TOPIC_LENGTH + len(topic.encode("utf-8")) + len(message) + (MQTT_PACKET_ID if qos else 0)
+        # The remaining length field takes one byte per 7 bits
+        total += MQTT_FIXED_HEADER - 1 + max(1, -(-remaining.bit_length() // 7)) + remaining
+        if qos:
+            total += MQTT_PUBACK
+    return total
@@ -0,0 +1,145 @@
+"""Module for compiling GeoJSON routes into Capra Hircus paths and driving plans"""
+import itertools
+import math
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+import numpy as np
+import geometry
+from models.driving_instruction import DrivingInstruction
+from models.edge import Edge
+from models.node import Node
+from models.route_capra import CapraRoute
+from models.route_geojson import GeoJSONRoute
+from interfaces.feature_abc import FeatureAbstractClass
+
+# pylint: disable=line-too-long
+
+# Coordinates converted to arrays at once when computing a driving plan
+CHUNK_SIZE = 4096
+# Steering limits in radians, as validated by InstructionCreate
+MAX_LEFT_ANGLE = 1.5
+MAX_RIGHT_ANGLE = -0.8
+# Turns smaller than this (in degrees) are driven straight
+MIN_TURN = 1.0
+
+
+@dataclass
+class PlanStep:
+    """Class for defining one step of a driving plan: an instruction held for a distance"""
+
+    instruction: DrivingInstruction
+    distance: float
+    duration: float
+
+
+def iter_coordinates(source) -> Iterator[tuple[float, float, float]]:
+    """
+    Yields the (lon, lat, alt) positions of a route one at a time. The source can be a
+    GeoJSONRoute, a LineString feature, a GeoJSON dict (FeatureCollection, Feature or
+    LineString geometry) or an iterable of GeoJSON positions or Coordinates.
+    Positions follow GeoJSON order, longitude first.
+    """
+    if isinstance(source, GeoJSONRoute):
+        positions = itertools.chain.from_iterable(
+            feature.coordinates for feature in source.features if feature.feature_type == "LineString")
+    elif isinstance(source, FeatureAbstractClass):
+        positions = source.coordinates
+    elif isinstance(source, dict):
+        positions = _iter_geojson_positions(source)
+    else:
+        positions = source
+
+    for position in positions:
+        if hasattr(position, "get_coordinate"):
+            position = position.get_coordinate()
+        yield float(position[0]), float(position[1]), float(position[2]) if len(position) > 2 else 0.0
+
+
+def _iter_geojson_positions(data: dict) -> Iterator:
+    """Yields the positions of every LineString in a GeoJSON object"""
+    geojson_type = data.get("type")
+    if geojson_type == "FeatureCollection":
+        for feature in data.get("features", []):
+            yield from _iter_geojson_positions(feature)
+    elif geojson_type == "Feature":
+        yield from _iter_geojson_positions(data.get("geometry") or {})
+    elif geojson_type == "LineString":
+        yield from data.get("coordinates", [])
+
+
+def iter_nodes(coordinates: Iterable[tuple[float, float, float]], prefix: str = "Node_") -> Iterator[Node]:
+    """Yields a Node for every (lon, lat, alt) position, Capra nodes store latitude as x"""
+    for sequence_number, (lon, lat, alt) in enumerate(coordinates):
+        yield Node(f"{prefix}{sequence_number}", sequence_number, lat, lon, alt)
+
+
+def iter_edges(nodes: Iterable[Node], speed: float = 1.0, prefix: str = "Edge_") -> Iterator[tuple[Node, Edge | None]]:
+    """Yields every node together with the edge arriving at it, the first node has no edge"""
+    previous = None
+    for node in nodes:
+        edge = None
+        if previous is not None:
+            edge = Edge(f"{prefix}{previous.sequence_number}", previous.uuid, node.uuid, speed)
+        yield node, edge
+        previous = node
+
+
+def compile_route(source, path_uuid: str, speed: float = 1.0) -> CapraRoute:
+    """Compiles a GeoJSON route into a CapraRoute, consuming the coordinates one at a time"""
+    route = CapraRoute(path_uuid)
+    for node, edge in iter_edges(iter_nodes(iter_coordinates(source)), speed):
+        route.add_node(node)
+        if edge is not None:
+            route.add_edge(edge)
+    return route
+
+
+def _iter_chunks(coordinates: Iterable[tuple[float, float, float]], chunk_size: int) -> Iterator[np.ndarray]:
+    """Yields (n, 2) arrays of (lat, lon), each chunk starts with the last position of the previous one"""
+    previous = None
+    iterator = iter(coordinates)
+    while True:
+        chunk = [(lat, lon) for lon, lat, _ in itertools.islice(iterator, chunk_size)]
+        if not chunk:
+            return
+        if previous is not None:
+            chunk.insert(0, previous)
+        previous = chunk[-1]
+        if len(chunk) > 1:
+            yield np.array(chunk, dtype=np.float64)
+
+
+def _turn_step(turn: float, speed: float) -> PlanStep:
+    """Returns the arc that turns the robot by turn degrees (positive to the left) while driving"""
+    angle = MAX_LEFT_ANGLE if turn > 0 else MAX_RIGHT_ANGLE
+    duration = math.radians(abs(turn)) / abs(angle)
+    return PlanStep(DrivingInstruction(speed, angle), abs(speed) * duration, duration)
+
+
+def iter_driving_plan(source, speed: float = 1.0, method: str = geometry.HAVERSINE, chunk_size: int = CHUNK_SIZE) -> Iterator[PlanStep]:
+    """
+    Yields a timed plan of DrivingInstructions that follows a route: a straight step for every
+    segment, preceded by an arc at the steering limit for every turn. The robot is assumed to
+    face the first segment when the plan starts. Coordinates are processed in chunks, so the
+    geometry is vectorised without holding the whole route in memory.
+    """
+    if speed <= 0:
+        raise ValueError("Speed must be positive")
+    previous_bearing = None
+    for positions in _iter_chunks(iter_coordinates(source), chunk_size):
+        path_geometry = geometry.compute_path_geometry(positions, method)
+        turns = np.empty(len(path_geometry.lengths))
+        if previous_bearing is not None:
+            turns[0] = geometry.turn_angles(previous_bearing, path_geometry.bearings[0])
+        else:
+            turns[0] = 0.0
+        turns[1:] = path_geometry.turn_angles
+        previous_bearing = path_geometry.final_bearings[-1]
+
+        for length, turn in zip(path_geometry.lengths.tolist(), turns.tolist()):
+            if abs(turn) >= MIN_TURN:
+                step = _turn_step(turn, speed)
+                yield step
+                length = max(length - step.distance, 0.0)
+            if length > 0:
+                yield PlanStep(DrivingInstruction(speed, 0.0), length, length / speed)
@@ -0,0 +1,370 @@
+"""
+Module containing an in-process Capra Hircus simulator for tests and benchmarks without a robot.
+FakeBroker stands in for the MQTT broker, FakeMqttClient for the paho client and FakeHircus
+subscribes to the robot's topics, simulates its motion and publishes telemetry.
+With a VirtualClock the broker and robot run on simulated time instead of threads: messages are
+delivered and the robot moves while the clock advances, so long drives replay in milliseconds.
+"""
+import json
+import math
+import queue
+import threading
+from collections import defaultdict, deque
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.reasoncodes import ReasonCode
+from clock import SYSTEM_CLOCK, Clock, VirtualClock
+from capra_control import (STOP_MODE, TOPIC_BATTERY, TOPIC_ODOMETRY, TOPIC_REMOTE, TOPIC_SEND_PATH,
+                           TOPIC_SET_MODE, TOPIC_STATUS, ControlCapra)
+from mqtt_connection import MqttConnection
+from path_transport import TOPIC_SEND_PATH_CHUNK, reassemble
+
+# pylint: disable=line-too-long
+
+# Seconds between simulation steps, and between telemetry messages of the robot
+SIMULATION_PERIOD = 0.02
+TELEMETRY_PERIOD = 0.1
+# The simulated robot stops when it receives no velocity message for this many seconds
+VELOCITY_TIMEOUT = 0.5
+# Receive times of velocity messages kept for the rate and jitter statistics
+MAX_RECORDED_FRAMES = 100_000
+
+
+class FakeMessageInfo():
+    """Stand-in for paho's MQTTMessageInfo, published once the broker delivered the message"""
+
+    def __init__(self, mid: int, rc: int = mqtt.MQTT_ERR_SUCCESS, clock: Clock = SYSTEM_CLOCK) -> None:
+        self.mid = mid
+        self.rc = rc
+        self.clock = clock
+        self._published = threading.Event()
+
+    def wait_for_publish(self, timeout: float | None = None) -> None:
+        """Waits until the broker delivered the message, raises RuntimeError when it was not sent"""
+        if self.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise RuntimeError(mqtt.error_string(self.rc))
+        self.clock.wait(self._published, timeout)
+
+    def is_published(self) -> bool:
+        """Returns True when the broker delivered the message"""
+        return self._published.is_set()
+
+
+class FakeBroker():
+    """
+    Routes messages between FakeMqttClients in publish order on one delivery thread, optionally
+    after a simulated network delay. Messages are acknowledged once delivered to the subscribers.
+    With a VirtualClock there is no delivery thread, messages are delivered when the clock reaches them.
+    """
+
+    def __init__(self, delay: float = 0.0, clock: Clock = SYSTEM_CLOCK) -> None:
+        self.delay = delay
+        self.clock = clock
+        self.virtual = isinstance(clock, VirtualClock)
+        self.delivered = 0
+        self._clients: list["FakeMqttClient"] = []
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._mid = 0
+        self._worker: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Starts the delivery thread if it is not running yet"""
+        if self.virtual:
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name="fake-broker", daemon=True)
+            self._worker.start()
+
+    def stop(self) -> None:
+        """Stops the delivery thread after the queued messages were delivered"""
+        self._queue.put(None)
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def attach(self, client: "FakeMqttClient") -> None:
+        """Connects a client"""
+        with self._lock:
+            self._clients.append(client)
+        self.start()
+
+    def detach(self, client: "FakeMqttClient") -> None:
+        """Disconnects a client"""
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def publish(self, topic: str, payload: bytes, qos: int) -> FakeMessageInfo:
+        """Queues a message for delivery"""
+        with self._lock:
+            self._mid += 1
+            info = FakeMessageInfo(self._mid, clock=self.clock)
+        if self.virtual:
+            self.clock.call_at(self.clock.monotonic() + self.delay, lambda: self._deliver(topic, payload, qos, info))
+        else:
+            self._queue.put((self.clock.monotonic() + self.delay, topic, payload, qos, info))
+        return info
+
+    def _run(self) -> None:
+        """Delivers queued messages to every client subscribed to their topic"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            due, topic, payload, qos, info = item
+            self.clock.sleep(due - self.clock.monotonic())
+            self._deliver(topic, payload, qos, info)
+
+    def _deliver(self, topic: str, payload: bytes, qos: int, info: FakeMessageInfo) -> None:
+        """Passes a message to the clients and acknowledges it"""
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.deliver(topic, payload, qos)
+        self.delivered += 1
+        info._published.set()  # pylint: disable=protected-access
+
+
+class FakeMqttClient():
+    """Stand-in for the parts of paho's Client used by MqttConnection, connected to a FakeBroker"""
+
+    def __init__(self, broker: FakeBroker) -> None:
+        self.broker = broker
+        self.subscriptions: dict[str, int] = {}
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self._connected = False
+
+    def connect(self, _host: str = "localhost", _port: int = 1883, _keepalive: int = 60) -> int:
+        """Connects to the broker, on_connect is called when the loop starts"""
+        self.broker.attach(self)
+        self._connected = True
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_start(self) -> int:
+        """Calls on_connect like paho's network loop after connecting"""
+        if self._connected and self.on_connect is not None:
+            self.on_connect(self, None, mqtt.ConnectFlags(False), ReasonCode(PacketTypes.CONNACK, "Success"), None)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_stop(self) -> int:
+        """The fake client has no network loop"""
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def disconnect(self) -> int:
+        """Disconnects from the broker"""
+        self._connected = False
+        self.broker.detach(self)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def is_connected(self) -> bool:
+        """Returns True when connected to the broker"""
+        return self._connected
+
+    def reconnect_delay_set(self, *_args) -> None:
+        """The fake client does not reconnect"""
+
+    def max_queued_messages_set(self, *_args) -> None:
+        """The fake client does not limit its queue"""
+
+    def subscribe(self, topic: str | list, qos: int = 0) -> tuple[int, int]:
+        """Subscribes to a topic or a list of (topic, qos)"""
+        for sub_topic, sub_qos in topic if isinstance(topic, list) else [(topic, qos)]:
+            self.subscriptions[sub_topic] = sub_qos
+        return mqtt.MQTT_ERR_SUCCESS, 0
+
+    def publish(self, topic: str, payload: str | bytes | None = None, qos: int = 0, _retain: bool = False) -> FakeMessageInfo:
+        """Publishes a message through the broker"""
+        if not self._connected:
+            return FakeMessageInfo(0, mqtt.MQTT_ERR_NO_CONN)
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        return self.broker.publish(topic, payload or b"", qos)
+
+    def deliver(self, topic: str, payload: bytes, qos: int) -> None:
+        """Called by the broker for every message, passes it to on_message when subscribed to its topic"""
+        if self.on_message is None or not any(mqtt.topic_matches_sub(sub, topic) for sub in self.subscriptions):
+            return
+        message = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+        message.payload = payload
+        message.qos = qos
+        self.on_message(self, None, message)
+
+
+def use_fake_broker(connection: MqttConnection, broker: FakeBroker) -> FakeMqttClient:
+    """Replaces the paho client of a connection by a fake client of the broker"""
+    client = FakeMqttClient(broker)
+    client.on_connect = connection._on_connect  # pylint: disable=protected-access
+    client.on_disconnect = connection._on_disconnect  # pylint: disable=protected-access
+    client.on_message = connection._on_message  # pylint: disable=protected-access
+    connection.client = client
+    return client
+
+
+def attach_controller(controller: ControlCapra, broker: FakeBroker) -> None:
+    """Connects both MQTT connections of a controller to the fake broker instead of a robot"""
+    use_fake_broker(controller.connection, broker)
+    use_fake_broker(controller.priority, broker)
+
+
+class FakeHircus():
+    """
+    Simulated Capra Hircus. Velocity messages set the forward speed (linear x, m/s) and the yaw rate
+    (angular z, rad/s), the position is integrated every SIMULATION_PERIOD and published as odometry.
+    The robot stops on STOP_MODE and when velocity messages stop arriving. Paths, mode changes and
+    the receive times of velocity messages are recorded for tests and benchmarks.
+    The robot uses the clock of the broker, with a VirtualClock it moves whenever the clock advances.
+    """
+
+    def __init__(self, broker: FakeBroker, period: float = SIMULATION_PERIOD, telemetry_period: float = TELEMETRY_PERIOD) -> None:
+        self.broker = broker
+        self.clock = broker.clock
+        self.period = period
+        self.telemetry_period = telemetry_period
+        self.client = FakeMqttClient(broker)
+        self.client.on_message = self._on_message
+        for topic in (TOPIC_REMOTE, TOPIC_SET_MODE, TOPIC_SEND_PATH, TOPIC_SEND_PATH_CHUNK):
+            self.client.subscribe(topic, 1)
+
+        self.mode = 0
+        self.x = self.y = self.heading = 0.0
+        self.speed = self.yaw_rate = 0.0
+        self.travelled = 0.0
+        self.battery = 100.0
+        self.last_velocity_at: float | None = None
+        self.velocity_frames: deque[float] = deque(maxlen=MAX_RECORDED_FRAMES)
+        self.ignored_frames = 0
+        self.mode_changes: list[tuple[float, int]] = []
+        self.paths: list[dict] = []
+        self._chunks: dict[str, list[bytes]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stopping = threading.Event()
+        self._worker: threading.Thread | None = None
+        self._timer: int | None = None
+        self._last_step = 0.0
+        self._next_telemetry = 0.0
+
+    def start(self) -> None:
+        """Connects to the broker and starts simulating"""
+        self.client.connect()
+        self._stopping.clear()
+        self._last_step = self._next_telemetry = self.clock.monotonic()
+        if self.broker.virtual:
+            self._timer = self.clock.call_every(self.period, self.step)
+            return
+        self._worker = threading.Thread(target=self._run, name="fake-hircus", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        """Stops simulating and disconnects"""
+        self._stopping.set()
+        if self._timer is not None:
+            self.clock.cancel(self._timer)
+            self._timer = None
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        self.client.disconnect()
+
+    def reset(self) -> None:
+        """Forgets the recorded messages and puts the robot back at the origin"""
+        with self._lock:
+            self.x = self.y = self.heading = self.travelled = 0.0
+            self.speed = self.yaw_rate = 0.0
+            self.velocity_frames.clear()
+            self.ignored_frames = 0
+            self.mode_changes.clear()
+            self.paths.clear()
+
+    def wait_for(self, predicate, timeout: float = 5.0) -> bool:
+        """Waits until predicate(robot) is true, returns False on timeout. A virtual clock is advanced while waiting"""
+        if self.broker.virtual:
+            deadline = self.clock.monotonic() + timeout
+            while True:
+                with self._lock:
+                    if predicate(self):
+                        return True
+                if self.clock.monotonic() >= deadline:
+                    return False
+                self.clock.advance(min(self.period, deadline - self.clock.monotonic()))
+        with self._changed:
+            return self._changed.wait_for(lambda: predicate(self), timeout)
+
+    def get_velocity_stats(self, expected_period: float = 0.1) -> dict:
+        """Returns the rate of received velocity messages and the jitter of their intervals in milliseconds"""
+        with self._lock:
+            frames = list(self.velocity_frames)
+        intervals = [b - a for a, b in zip(frames, frames[1:])]
+        if not intervals:
+            return {"frames": len(frames), "rate_hz": None, "mean_interval_ms": None, "jitter_ms": None, "max_deviation_ms": None}
+        mean = sum(intervals) / len(intervals)
+        variance = sum((interval - mean) ** 2 for interval in intervals) / len(intervals)
+        return {
+            "frames": len(frames),
+            "rate_hz": len(intervals) / (frames[-1] - frames[0]) if frames[-1] > frames[0] else None,
+            "mean_interval_ms": mean * 1000,
+            "jitter_ms": math.sqrt(variance) * 1000,
+            "max_deviation_ms": max(abs(interval - expected_period) for interval in intervals) * 1000
+        }
+
+    def _on_message(self, _client, _userdata, message: mqtt.MQTTMessage) -> None:
+        """Handles a command sent to the robot"""
+        now = self.clock.monotonic()
+        with self._changed:
+            if message.topic == TOPIC_REMOTE:
+                if self.mode == STOP_MODE:
+                    self.ignored_frames += 1
+                else:
+                    twist = json.loads(message.payload)["twist"]
+                    self.speed = float(twist["linear"]["x"])
+                    self.yaw_rate = float(twist["angular"]["z"])
+                    self.last_velocity_at = now
+                    self.velocity_frames.append(now)
+            elif message.topic == TOPIC_SET_MODE:
+                self.mode = json.loads(message.payload)["operation_mode"]
+                self.mode_changes.append((now, self.mode))
+                if self.mode == STOP_MODE:
+                    self.speed = self.yaw_rate = 0.0
+            elif message.topic == TOPIC_SEND_PATH:
+                self.paths.append(json.loads(message.payload))
+            elif message.topic == TOPIC_SEND_PATH_CHUNK:
+                header = json.loads(message.payload.split(b"\n", 1)[0])
+                chunks = self._chunks[header["transfer_id"]]
+                chunks.append(message.payload)
+                if len(chunks) == header["count"]:
+                    self.paths.append(reassemble(self._chunks.pop(header["transfer_id"])))
+            self._changed.notify_all()
+
+    def _run(self) -> None:
+        """Simulates the robot every period until stopped"""
+        while not self._stopping.wait(self.period):
+            self.step()
+
+    def step(self) -> None:
+        """Integrates the motion of the robot since the previous step and publishes telemetry when it is due"""
+        now = self.clock.monotonic()
+        with self._changed:
+            if self.last_velocity_at is None or now - self.last_velocity_at > VELOCITY_TIMEOUT:
+                self.speed = self.yaw_rate = 0.0
+            dt = now - self._last_step
+            self.heading += self.yaw_rate * dt
+            self.x += self.speed * math.cos(self.heading) * dt
+            self.y += self.speed * math.sin(self.heading) * dt
+            self.travelled += abs(self.speed) * dt
+            self.battery = max(0.0, self.battery - abs(self.speed) * dt * 0.001)
+            odometry = {"pose": {"pose": {"position": {"x": self.x, "y": self.y, "z": 0.0}}},
+                        "twist": {"twist": {"linear": {"x": self.speed}, "angular": {"z": self.yaw_rate}}}}
+            status = {"operation_mode": self.mode, "speed": self.speed}
+            battery = {"level": round(self.battery, 2)}
+            self._last_step = now
+            self._changed.notify_all()
+        if now >= self._next_telemetry:
+            self._next_telemetry = now + self.telemetry_period
+            self.client.publish(TOPIC_ODOMETRY, json.dumps(odometry))
+            self.client.publish(TOPIC_STATUS, json.dumps(status))
+            self.client.publish(TOPIC_BATTERY, json.dumps(battery))
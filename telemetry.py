@@ -0,0 +1,159 @@
+"""Module containing in-memory storage and fan-out for telemetry of a Capra Hircus"""
+import asyncio
+import json
+import threading
+import time
+from typing import AsyncIterator
+
+# pylint: disable=line-too-long
+
+# Number of messages kept per topic
+TELEMETRY_BUFFER_SIZE = 256
+# Seconds between keep-alive comments on an idle stream
+KEEPALIVE_INTERVAL = 15.0
+
+
+class TelemetryMessage:
+    """Class for defining a received telemetry message, encoded once for every stream client"""
+
+    __slots__ = ("sequence", "topic", "timestamp", "payload", "frame")
+
+    def __init__(self, sequence: int, topic: str, timestamp: float, payload: bytes) -> None:
+        self.sequence = sequence
+        self.topic = topic
+        self.timestamp = timestamp
+        self.payload = payload
+        # Server-Sent Event, JSON newlines are insignificant whitespace
+        self.frame = b"event: %s\nid: %d\ndata: %s\n\n" % (
+            topic.encode("utf-8"), sequence, payload.replace(b"\r", b"").replace(b"\n", b""))
+
+    def get_formatted_message(self) -> dict:
+        """Returns the message as a dict, the payload is decoded when it is JSON"""
+        try:
+            payload = json.loads(self.payload)
+        except ValueError:
+            payload = self.payload.decode("utf-8", errors="replace")
+        return {
+            "sequence": self.sequence,
+            "topic": self.topic,
+            "timestamp": self.timestamp,
+            "payload": payload
+        }
+
+
+class RingBuffer:
+    """Fixed-size buffer that overwrites its oldest item, memory use does not grow over time"""
+
+    def __init__(self, capacity: int = TELEMETRY_BUFFER_SIZE) -> None:
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1")
+        self.capacity = capacity
+        self._items: list = [None] * capacity
+        self._written = 0
+
+    def __len__(self) -> int:
+        return min(self._written, self.capacity)
+
+    @property
+    def written(self) -> int:
+        """Total number of items ever appended, used as a read cursor"""
+        return self._written
+
+    def append(self, item) -> None:
+        """Appends an item, overwriting the oldest one when the buffer is full"""
+        self._items[self._written % self.capacity] = item
+        self._written += 1
+
+    def latest(self):
+        """Returns the most recent item, or None when the buffer is empty"""
+        if not self._written:
+            return None
+        return self._items[(self._written - 1) % self.capacity]
+
+    def read_since(self, cursor: int) -> tuple[list, int]:
+        """
+        Returns the items appended since cursor and the new cursor.
+        A reader that fell more than capacity items behind continues at the oldest item.
+        """
+        end = self._written
+        start = max(cursor, end - self.capacity)
+        return [self._items[i % self.capacity] for i in range(start, end)], end
+
+
+class TelemetryHub:
+    """
+    Stores telemetry in one ring buffer per topic and wakes up stream clients.
+    Messages are written by the MQTT network thread and read by any number of clients,
+    every client only keeps read cursors into the shared buffers.
+    """
+
+    def __init__(self, topics: list[str], capacity: int = TELEMETRY_BUFFER_SIZE) -> None:
+        self.buffers = {topic: RingBuffer(capacity) for topic in topics}
+        self.sequence = 0
+        self._lock = threading.Lock()
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def add_message(self, topic: str, payload: bytes) -> TelemetryMessage | None:
+        """Stores a received message, messages on unknown topics are ignored"""
+        buffer = self.buffers.get(topic)
+        if buffer is None:
+            return None
+        with self._lock:
+            self.sequence += 1
+            message = TelemetryMessage(self.sequence, topic, time.time(), payload)
+            buffer.append(message)
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+        return message
+
+    def latest(self, topic: str) -> TelemetryMessage | None:
+        """Returns the most recent message on a topic"""
+        buffer = self.buffers.get(topic)
+        return buffer.latest() if buffer is not None else None
+
+    def get_snapshot(self) -> dict:
+        """Returns the most recent message of every topic"""
+        snapshot = {}
+        for topic, buffer in self.buffers.items():
+            message = buffer.latest()
+            snapshot[topic] = message.get_formatted_message() if message is not None else None
+        return snapshot
+
+    async def wait(self, sequence: int, timeout: float) -> None:
+        """Waits until a message newer than sequence arrives or timeout expires"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.sequence > sequence:
+                return
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if (loop, future) in self._waiters:
+                    self._waiters.remove((loop, future))
+
+    async def stream(self, topics: list[str] | None = None, keepalive: float = KEEPALIVE_INTERVAL) -> AsyncIterator[bytes]:
+        """Yields Server-Sent Event frames for new messages, starting with the latest message per topic"""
+        buffers = [self.buffers[topic] for topic in (topics or self.buffers) if topic in self.buffers]
+        cursors = [max(buffer.written - 1, 0) for buffer in buffers]
+        while True:
+            sequence = self.sequence
+            sent = False
+            for i, buffer in enumerate(buffers):
+                messages, cursors[i] = buffer.read_since(cursors[i])
+                for message in messages:
+                    sent = True
+                    yield message.frame
+            if not sent:
+                await self.wait(sequence, keepalive)
+                if self.sequence == sequence:
+                    yield b": keepalive\n\n"
+
+
+def _wake(future: asyncio.Future) -> None:
+    """Resolves a waiter future on its own event loop"""
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,58 @@
+"""Pytest testcases for testing the real and virtual clocks"""
+import threading
+import pytest
+from clock import Clock, VirtualClock
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="clock")
+def virtual_clock():
+    """Create a virtual clock"""
+    return VirtualClock(start=100.0, epoch=1_000_000.0)
+
+
+def test_system_clock_wait():
+    """Tests if the real clock returns as soon as the event is set"""
+    event = threading.Event()
+    event.set()
+    assert Clock().wait(event, 10) is True
+    assert Clock().wait(None, 0) is False
+
+
+def test_sleep_advances(clock):
+    """Tests if sleeping moves virtual time without blocking"""
+    clock.sleep(3600)
+    assert clock.monotonic() == 3700.0
+    assert clock() == 3700.0
+    assert clock.time() == 1_003_700.0
+
+
+def test_callbacks_run_in_order(clock):
+    """Tests if scheduled callbacks run at their due time in time order"""
+    calls = []
+    clock.call_at(100.3, lambda: calls.append(("once", clock.monotonic())))
+    clock.call_every(0.25, lambda: calls.append(("every", clock.monotonic())))
+    clock.advance(0.6)
+    assert calls == [("every", 100.25), ("once", 100.3), ("every", 100.5)]
+    assert clock.monotonic() == pytest.approx(100.6)
+
+
+def test_cancel(clock):
+    """Tests if a cancelled callback does not run again"""
+    calls = []
+    timer = clock.call_every(1.0, lambda: calls.append(clock.monotonic()))
+    clock.advance(2.5)
+    clock.cancel(timer)
+    clock.advance(5.0)
+    assert calls == [101.0, 102.0]
+
+
+def test_wait_returns_when_callback_sets_event(clock):
+    """Tests if waiting stops at the callback that sets the event"""
+    event = threading.Event()
+    clock.call_at(102.0, event.set)
+    assert clock.wait(event, 10.0) is True
+    assert clock.monotonic() == 102.0
+    assert clock.wait(threading.Event(), 1.0) is False
+    assert clock.monotonic() == 103.0
@@ -1,22 +1,29 @@
 """Pytest testcases for testing the ControlCapra class using MagicMock.
 MagicMock is used to be able to test ControlCapra without needing a connection to the robot"""
+import json
+import threading
 from unittest.mock import MagicMock
+import paho.mqtt.client as mqtt
 import pytest
-from capra_control import ControlCapra
+from capra_control import CHUNK_WINDOW, ControlCapra, encode_instruction
+from clock import VirtualClock
+from path_transport import PathTransport, reassemble
 
 # pylint: disable=line-too-long
 
 
 @pytest.fixture(name="mqtt_client")
 def mock_mqtt_client():
-    """Create mock mqtt client"""
-    return MagicMock()
+    """Create mock mqtt client, every message is accepted"""
+    client = MagicMock()
+    client.publish.return_value.rc = mqtt.MQTT_ERR_SUCCESS
+    return client
 
 
 @pytest.fixture(name="controller")
 def control_capra(mqtt_client):
-    """Create instance of ControlCapra Class"""
-    capra = ControlCapra("test_broker_address", 1234)
+    """Create instance of ControlCapra Class, drives run on virtual time"""
+    capra = ControlCapra("test_broker_address", 1234, clock=VirtualClock())
     capra.client = mqtt_client
     return capra
 
@@ -32,14 +39,29 @@ def test_mq_set_mode_stop(controller, mqtt_client):
     """Tests if the Capra Controller can set the mode to 1 (Stopped)"""
     controller.mq_set_mode(1)
     mqtt_client.publish.assert_called_once_with(
-        "capra/robot/set_operation_mode", '{"operation_mode": 1}')
+        "capra/robot/set_operation_mode", '{"operation_mode": 1}', qos=1)
+
+
+def test_set_drive_mode(controller, mqtt_client):
+    """Tests if the drive mode lifts an emergency stop only when no stop arrived since the drive started"""
+    stops = controller.stop_count
+    controller.emergency_stop()
+    assert not controller.set_drive_mode(None, stops)
+    cancelled = threading.Event()
+    cancelled.set()
+    assert not controller.set_drive_mode(cancelled)
+    assert controller.halted.is_set()
+
+    assert controller.set_drive_mode(threading.Event(), controller.stop_count)
+    assert not controller.halted.is_set()
+    assert mqtt_client.publish.call_args.args[1] == '{"operation_mode": 1}'
 
 
 def test_mq_set_mode_run(controller, mqtt_client):
     """Tests if the Capra Controller can set the mode to 2 (Running)"""
     controller.mq_set_mode(2)
     mqtt_client.publish.assert_called_once_with(
-        "capra/robot/set_operation_mode", '{"operation_mode": 2}')
+        "capra/robot/set_operation_mode", '{"operation_mode": 2}', qos=1)
 
 
 def test_load_path_file(controller):
@@ -62,6 +84,8 @@ def test_calculate_distance_angle(controller):
     assert "angle" in result
     assert distance == 1431.1784
     assert angle == 0.2246
+    assert round(result["initial_bearing"], 2) == 275.08
+    assert round(result["final_bearing"], 2) == 258.58
 
 
 def test_calculate_distances_from_path(controller):
@@ -77,7 +101,27 @@ def test_send_instruction(controller, mqtt_client):
     controller.send_instruction(1, 0.4)
     mqtt_client.publish.assert_called_once_with(
         'capra/remote/direct_velocity',
-        '{"header": {"frame_id": "frame_id"}, "twist": {"linear": {"x": 1}, "angular": {"z": 0.4}}}')
+        b'{"header": {"frame_id": "frame_id"}, "twist": {"linear": {"x": 1}, "angular": {"z": 0.4}}}', qos=0)
+
+
+def test_send_instruction_disconnected(controller, mqtt_client):
+    """Tests if velocity instructions are dropped while the connection is down"""
+    mqtt_client.is_connected.return_value = False
+    controller.send_instruction(1, 0.4)
+    mqtt_client.publish.assert_not_called()
+    assert controller.connection.dropped_messages == 1
+
+
+def test_send_instruction_cached(controller, mqtt_client):
+    """Tests if repeated instructions reuse the encoded message"""
+    encode_instruction.cache_clear()
+    controller.send_instruction(2, 0.1)
+    controller.send_instruction(2, 0.1)
+    controller.send_instruction(1, 0.1)
+    assert encode_instruction.cache_info().hits == 1
+    assert encode_instruction.cache_info().misses == 2
+    first_payload = mqtt_client.publish.call_args_list[0].args[1]
+    assert mqtt_client.publish.call_args_list[1].args[1] is first_payload
 
 
 def test_remote_control(controller):
@@ -86,3 +130,175 @@ def test_remote_control(controller):
     controller.remote_control(0.2, 1, 1.2)
     # Distance = 0.2 and distance per iteration = 0.1, so send_instruction should be called twice
     assert controller.send_instruction.call_count == 2
+
+
+def test_remote_control_virtual_time(controller):
+    """Tests if a 100 meter drive at 1 m/s is replayed on virtual time without sleeping"""
+    controller.send_instruction = MagicMock()
+    report = controller.remote_control(100, 1, 0.0)
+    assert controller.send_instruction.call_count == 1000
+    assert report["elapsed"] == pytest.approx(100.0)
+    assert report["distance_covered"] == pytest.approx(100.0)
+    assert report["missed_deadlines"] == 0
+    assert controller.clock.monotonic() == pytest.approx(100.0)
+
+
+def test_remote_control_stop_event(controller):
+    """Tests if setting the stop event interrupts remote control"""
+    controller.send_instruction = MagicMock()
+    stop_event = threading.Event()
+    stop_event.set()
+    controller.remote_control(10, 1, 0.0, stop_event=stop_event)
+    controller.send_instruction.assert_not_called()
+
+
+def test_remote_control_report(controller):
+    """Tests if remote control reports the distance covered and tick statistics"""
+    controller.send_instruction = MagicMock()
+    report = controller.remote_control(0.3, 2, 0.0)
+    # 0.3 meter at 2 m/s takes 0.15 seconds, so two instructions are sent
+    assert controller.send_instruction.call_count == 2
+    assert report["ticks"] == 2
+    assert report["distance_covered"] >= 0.3
+
+
+def test_remote_control_odometry(controller):
+    """Tests if a closed loop drive ends when odometry reports the distance was covered"""
+    positions = iter([(0.0, 0.0), (0.3, 0.0), (0.6, 0.0), (0.9, 0.4), (1.2, 0.8)])
+
+    def move(*_args):
+        controller.odometry.add_position(*next(positions))
+
+    controller.send_instruction = MagicMock(side_effect=move)
+    report = controller.remote_control(1.0, 2, 0.0, odometry=True)
+    # Travelled 0.0, 0.3, 0.6, 1.1 meter after each instruction
+    assert controller.send_instruction.call_count == 4
+    assert report["distance_covered"] == pytest.approx(1.1)
+    assert report["time_limit_reached"] is False
+
+
+def test_remote_control_odometry_time_limit(controller):
+    """Tests if a closed loop drive without odometry is aborted"""
+    controller.send_instruction = MagicMock()
+    report = controller.remote_control(0.1, 1, 0.0, odometry=True)
+    # 0.1 meter at 1 m/s is expected to take 0.1 seconds, aborted after 0.2 seconds
+    assert controller.send_instruction.call_count == 2
+    assert report["time_limit_reached"] is True
+
+
+def test_remote_control_odometry_stalled(controller):
+    """Tests if a closed loop drive stops soon after the odometry topic goes silent"""
+    positions = iter([(0.0, 0.0), (0.1, 0.0), (0.2, 0.0)])
+
+    def move(*_args):
+        position = next(positions, None)
+        if position is not None:
+            controller.odometry.add_position(*position)
+
+    controller.send_instruction = MagicMock(side_effect=move)
+    report = controller.remote_control(10.0, 1, 0.0, odometry=True)
+    # The last position arrived with the third instruction, 0.5 seconds later the drive is aborted
+    assert controller.send_instruction.call_count == 7
+    assert report["time_limit_reached"] is True
+    assert report["odometry_stalled"] is True
+    assert report["distance_covered"] == pytest.approx(0.2)
+
+    controller.send_instruction = MagicMock()
+    report = controller.remote_control(10.0, 1, 0.0, odometry=True)
+    # Without any odometry the drive is aborted 0.5 seconds after it started, not after 20 seconds
+    assert controller.send_instruction.call_count == 5
+    assert report["odometry_stalled"] is True
+
+
+def test_odometry_message(controller):
+    """Tests if odometry messages received from the robot update the travelled distance"""
+    for x in (1.0, 4.0):
+        message = MagicMock(topic="capra/robot/odometry", payload=b'{"pose": {"pose": {"position": {"x": %f, "y": 0.0}}}}' % x)
+        controller._on_telemetry(message)  # pylint: disable=protected-access
+    assert controller.odometry.travelled == pytest.approx(3.0)
+
+
+def test_send_path_simplified(controller, mqtt_client):
+    """Tests if a path can be simplified before it is sent"""
+    controller.send_path("data/Path2.json", tolerance=0.5)
+    topic, payload = mqtt_client.publish.call_args.args
+    assert topic == "capra/navigation/send_path"
+    assert len(json.loads(payload)["nodes"]) == 2
+
+
+def test_send_path_cached(controller, mqtt_client):
+    """Tests if a path file is encoded once and sent again from the cache"""
+    controller.send_path("data/Path2.json")
+    controller.send_path("data/Path2.json")
+    first, second = mqtt_client.publish.call_args_list
+    assert second.args[1] is first.args[1]
+    assert json.loads(first.args[1])["path_uuid"] == "Path2"
+
+
+def test_send_path_chunked(controller, mqtt_client):
+    """Tests if a path can be sent as compressed chunks"""
+    controller.send_path("data/Path2.json", transport=PathTransport(compress=True, chunk_size=100))
+    messages = [c.args[1] for c in mqtt_client.publish.call_args_list]
+    assert {c.args[0] for c in mqtt_client.publish.call_args_list} == {"capra/navigation/send_path_chunk"}
+    assert len(messages) > 1
+    assert reassemble(messages)["path_uuid"] == "Path2"
+
+
+def test_send_path_chunk_windows(controller, mqtt_client):
+    """Tests if chunks are published in windows that are acknowledged before the next window"""
+    transport = PathTransport(chunk_size=2)
+    payload = transport.encode(controller.load_path_file("data/Path2.json"))
+    messages = transport.get_messages(payload)
+    assert len(messages) > 2 * CHUNK_WINDOW
+    assert controller.send_payload(payload, transport)
+    assert mqtt_client.publish.call_count == len(messages)
+    assert mqtt_client.publish.return_value.wait_for_publish.call_count == (len(messages) - 1) // CHUNK_WINDOW * CHUNK_WINDOW
+
+    mqtt_client.reset_mock()
+    mqtt_client.publish.return_value.is_published.return_value = False
+    assert not controller.send_payload(payload, transport)
+    assert mqtt_client.publish.call_count == CHUNK_WINDOW
+
+
+def test_send_path_chunk_refused(controller, mqtt_client):
+    """Tests if a path is reported as not sent when the client refuses a chunk, like when its queue is full"""
+    refused = MagicMock(rc=mqtt.MQTT_ERR_QUEUE_SIZE)
+    mqtt_client.publish.side_effect = [mqtt_client.publish.return_value] * 3 + [refused]
+    transport = PathTransport(chunk_size=100)
+    payload = transport.encode(controller.load_path_file("data/Path2.json"))
+    assert not controller.send_payload(payload, transport)
+    assert mqtt_client.publish.call_count == 4
+
+
+def test_emergency_stop(controller, mqtt_client):
+    """Tests if an emergency stop is sent at QoS 1, acknowledged and halts the velocity stream"""
+    result = controller.emergency_stop()
+    mqtt_client.publish.assert_called_once_with(
+        "capra/robot/set_operation_mode", '{"operation_mode": 5}', qos=1)
+    mqtt_client.publish.return_value.wait_for_publish.assert_called_once()
+    assert result["acknowledged"]
+    assert controller.stop_latency.count == 1
+
+    controller.send_instruction(1, 0.0)
+    assert mqtt_client.publish.call_count == 1
+
+    controller.mq_set_mode(1)
+    controller.send_instruction(1, 0.0)
+    assert mqtt_client.publish.call_count == 3
+
+
+def test_emergency_stop_priority_connection(controller, mqtt_client):
+    """Tests if the stop uses the priority connection when it is connected"""
+    priority_client = MagicMock()
+    controller.priority.client = priority_client
+    controller.emergency_stop()
+    mqtt_client.publish.assert_not_called()
+    priority_client.publish.assert_called_once()
+
+
+def test_emergency_stop_not_acknowledged(controller, mqtt_client):
+    """Tests if a stop that is not acknowledged is counted as a failure"""
+    mqtt_client.publish.return_value.wait_for_publish.side_effect = RuntimeError("not connected")
+    result = controller.emergency_stop()
+    assert not result["acknowledged"]
+    assert controller.stop_latency.failures == 1
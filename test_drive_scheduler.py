@@ -0,0 +1,133 @@
+"""Pytest testcases for testing the DriveScheduler using a mocked ControlCapra"""
+import threading
+import time
+from unittest.mock import MagicMock
+import paho.mqtt.client as mqtt
+import pytest
+from capra_control import STOP_MODE, ControlCapra
+from clock import VirtualClock
+from drive_scheduler import DriveJob, DriveScheduler, JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED
+
+# pylint: disable=line-too-long
+
+
+def wait_for(job, timeout=2.0):
+    """Waits until a job has finished"""
+    deadline = time.monotonic() + timeout
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.fixture(name="controller")
+def mock_controller():
+    """Create mock ControlCapra, its drives cover their distance"""
+    capra = MagicMock()
+    capra.remote_control.side_effect = lambda distance, *args, **kwargs: {"distance_covered": distance, "time_limit_reached": False}
+    return capra
+
+
+@pytest.fixture(name="scheduler")
+def drive_scheduler(controller):
+    """Create instance of DriveScheduler"""
+    capra_scheduler = DriveScheduler(controller)
+    yield capra_scheduler
+    capra_scheduler.shutdown()
+
+
+def test_submit_runs_job(scheduler, controller):
+    """Tests if a submitted job is executed on the worker thread"""
+    job = scheduler.submit(1, 0.5, 1, 0.2)
+    wait_for(job)
+    assert job.status == JOB_COMPLETED
+    controller.set_drive_mode.assert_called_once_with(job.cancel_event, controller.stop_count)
+    controller.remote_control.assert_called_once_with(
+        0.5, 1, 0.2, stop_event=job.cancel_event, odometry=False, on_progress=job.set_progress)
+
+
+def test_submit_returns_immediately(scheduler, controller):
+    """Tests if submitting does not wait for the drive to finish"""
+    release = threading.Event()
+    controller.remote_control.side_effect = lambda *args, **kwargs: {"distance_covered": 100, "time_limit_reached": not release.wait(2)}
+    start = time.monotonic()
+    job = scheduler.submit(1, 100, 1)
+    assert time.monotonic() - start < 0.5
+    release.set()
+    wait_for(job)
+    assert job.status == JOB_COMPLETED
+
+
+def test_cancel_all_preempts_running_job(scheduler, controller):
+    """Tests if cancel_all interrupts the running job and skips queued jobs"""
+    controller.remote_control.side_effect = lambda *args, stop_event, **kwargs: {"distance_covered": 0, "stopped": stop_event.wait(2)}
+    running = scheduler.submit(1, 100, 1)
+    queued = scheduler.submit(2, 100, 1)
+    while scheduler.current_job is None:
+        time.sleep(0.01)
+
+    assert scheduler.cancel_all() == 2
+    wait_for(running)
+    wait_for(queued)
+    assert running.status == JOB_CANCELLED
+    assert queued.status == JOB_CANCELLED
+    assert controller.remote_control.call_count == 1
+
+
+def test_failed_job(scheduler, controller):
+    """Tests if an exception during driving marks the job as failed"""
+    controller.remote_control.side_effect = ValueError("invalid speed")
+    job = scheduler.submit(1, 1, 1)
+    wait_for(job)
+    assert job.status == JOB_FAILED
+    assert job.error == "invalid speed"
+
+
+def test_odometry_time_limit_fails_job(scheduler, controller):
+    """Tests if a closed-loop drive that ran out of time before covering its distance fails"""
+    controller.remote_control.side_effect = lambda *args, **kwargs: {"distance_covered": 0.3, "time_limit_reached": True}
+    job = scheduler.submit(1, 1, 1, odometry=True)
+    wait_for(job)
+    assert job.status == JOB_FAILED
+    assert "0.30 of 1.00 m" in job.error
+
+    controller.remote_control.side_effect = lambda *args, **kwargs: {"distance_covered": 0.3, "time_limit_reached": True, "odometry_stalled": True}
+    job = scheduler.submit(2, 1, 1, odometry=True)
+    wait_for(job)
+    assert job.status == JOB_FAILED
+    assert job.error == "Odometry stopped reporting at 0.30 of 1.00 m"
+
+
+def test_stop_before_drive_mode():
+    """Tests if an emergency stop landing between the cancel check and the drive mode is not lifted by the drive"""
+    controller = ControlCapra("test_broker_address", 1234, clock=VirtualClock())
+    controller.client = MagicMock()
+    controller.client.publish.return_value.rc = mqtt.MQTT_ERR_SUCCESS
+    controller.remote_control = MagicMock()
+    set_drive_mode = controller.set_drive_mode
+
+    def stop_first(*args):
+        controller.emergency_stop()
+        return set_drive_mode(*args)
+
+    controller.set_drive_mode = stop_first
+    scheduler = DriveScheduler(controller)
+    scheduler.start()
+    try:
+        job = scheduler.submit(1, 1, 1)
+        wait_for(job)
+    finally:
+        scheduler.shutdown()
+    assert job.status == JOB_CANCELLED
+    controller.remote_control.assert_not_called()
+    assert controller.halted.is_set()
+    modes = [call.args[1] for call in controller.client.publish.call_args_list if call.args[0] == "capra/robot/set_operation_mode"]
+    assert modes == ['{"operation_mode": %d}' % STOP_MODE]
+
+
+def test_submit_many_in_order(scheduler, controller):
+    """Tests if jobs submitted together are driven one after another in order"""
+    jobs = scheduler.submit_many([DriveJob(i, 1, 1) for i in range(3)])
+    for job in jobs:
+        wait_for(job)
+    assert [job.status for job in jobs] == [JOB_COMPLETED] * 3
+    assert jobs[0].finished_at <= jobs[1].started_at <= jobs[2].started_at
+    assert controller.remote_control.call_count == 3
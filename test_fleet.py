@@ -0,0 +1,73 @@
+"""Pytest testcases for the registry of robots"""
+import threading
+import time
+import pytest
+from fleet import FleetRegistry, parse_fleet
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="fleet")
+def fleet_registry():
+    """A fleet of two robots that are not connected"""
+    registry = FleetRegistry()
+    registry.register("hircus-1", "10.0.0.1", 1883)
+    registry.register("hircus-2", "10.0.0.2", 1884)
+    yield registry
+    registry.shutdown()
+
+
+def test_parse_fleet():
+    """Tests if a fleet description is parsed into addresses and ports"""
+    assert parse_fleet("hircus-1=10.0.0.1:1883, hircus-2=10.0.0.2") == {
+        "hircus-1": ("10.0.0.1", 1883), "hircus-2": ("10.0.0.2", 1883)}
+    with pytest.raises(ValueError):
+        parse_fleet("10.0.0.1:1883")
+
+
+def test_register(fleet):
+    """Tests if every robot has its own controller and scheduler, and the first is the default"""
+    assert fleet.default.robot_id == "hircus-1"
+    assert fleet.get("hircus-2").controller.broker_port == 1884
+    assert fleet.get("hircus-1").controller is not fleet.get("hircus-2").controller
+    assert fleet.get("hircus-1").scheduler is not fleet.get("hircus-2").scheduler
+    with pytest.raises(KeyError):
+        fleet.get("unknown")
+    with pytest.raises(ValueError):
+        fleet.register("hircus-1", "10.0.0.3", 1883)
+
+
+def test_dispatch_concurrent(fleet):
+    """Tests if a slow robot does not delay the command for the other robot"""
+    release = threading.Event()
+    finished = {}
+
+    def command(robot):
+        if robot.robot_id == "hircus-1":
+            release.wait(2)
+        finished[robot.robot_id] = time.monotonic()
+        return robot.robot_id
+
+    start = time.monotonic()
+    results = fleet.dispatch(command, timeout=0.2)
+    assert results["hircus-1"] == {"status": "pending"}
+    assert results["hircus-2"] == {"status": "ok", "result": "hircus-2"}
+    assert finished["hircus-2"] - start < 0.2
+    release.set()
+
+
+def test_dispatch_failure(fleet):
+    """Tests if a failing robot is reported without affecting the others"""
+    def command(robot):
+        if robot.robot_id == "hircus-2":
+            raise ConnectionError("unreachable")
+
+    results = fleet.dispatch(command)
+    assert results["hircus-1"]["status"] == "ok"
+    assert results["hircus-2"] == {"status": "failed", "error": "unreachable"}
+
+
+def test_unregister(fleet):
+    """Tests if a robot can be removed"""
+    fleet.unregister("hircus-2")
+    assert list(fleet.robots) == ["hircus-1"]
@@ -0,0 +1,91 @@
+"""Pytest testcases for testing the vectorised path geometry"""
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+import geometry
+
+# pylint: disable=line-too-long
+
+WARSAW = (52.2296756, 21.0122287)
+LONDON = (51.5074, 0.1278)
+
+
+@pytest.fixture(name="positions")
+def path_positions():
+    """Create a short path near the Capra test site"""
+    return np.array([
+        [52.040360393900656, 5.567137289287426],
+        [52.04027615536029, 5.567062540014308],
+        [52.04027615536029, 5.568062540014308],
+        [52.04127615536029, 5.568062540014308]
+    ])
+
+
+def test_haversine_distance():
+    """Tests if the haversine distance matches the spherical formula of ControlCapra"""
+    distance = geometry.haversine_distances(np.array(WARSAW), np.array(LONDON))
+    assert round(float(distance) / 1000, 4) == 1431.1784
+
+
+def test_ellipsoidal_matches_geopy(positions):
+    """Tests if the ellipsoidal distances match geopy's geodesic"""
+    path_geometry = geometry.compute_path_geometry(positions, geometry.ELLIPSOIDAL)
+    expected = [geodesic(positions[i], positions[i + 1]).m for i in range(len(positions) - 1)]
+    assert path_geometry.lengths == pytest.approx(expected, abs=1e-4)
+    assert float(geometry.ellipsoidal_distances(np.array(WARSAW), np.array(LONDON))) == pytest.approx(geodesic(WARSAW, LONDON).m, abs=1e-3)
+
+
+def test_path_geometry(positions):
+    """Tests if bearings and cumulative distances are calculated for every segment"""
+    path_geometry = geometry.compute_path_geometry(positions)
+    assert len(path_geometry.lengths) == 3
+    assert path_geometry.bearings[1] == pytest.approx(90, abs=0.01)
+    assert path_geometry.bearings[2] == pytest.approx(0, abs=0.01)
+    assert path_geometry.cumulative == pytest.approx(np.cumsum(path_geometry.lengths))
+    assert path_geometry.total_length == pytest.approx(sum(path_geometry.lengths))
+
+
+def test_single_node_path():
+    """Tests if a path without segments has no length"""
+    path_geometry = geometry.compute_path_geometry(np.array([[52.0, 5.5]]))
+    assert len(path_geometry.lengths) == 0
+    assert path_geometry.total_length == 0.0
+
+
+def test_unknown_method(positions):
+    """Tests if an unknown distance method is rejected"""
+    with pytest.raises(ValueError):
+        geometry.compute_path_geometry(positions, "flat")
+
+
+def test_load_positions():
+    """Tests if node positions are loaded into an array"""
+    data = {"nodes": [{"position": {"x": 1.0, "y": 2.0, "z": 0.0}}, {"position": {"x": 3.0, "y": 4.0}}]}
+    positions = geometry.load_positions(data)
+    assert positions.dtype == np.float64
+    assert positions.tolist() == [[1.0, 2.0], [3.0, 4.0]]
+
+
+def test_compute_legs():
+    """Tests if bearings and turns are calculated for arrays of coordinate pairs"""
+    start = np.array([[0.0, 0.0], [0.0, 0.001], [0.001, 0.001]])
+    end = np.array([[0.0, 0.001], [0.001, 0.001], [0.001, 0.0]])
+    legs = geometry.compute_legs(start, end)
+    # East, north, west: a left turn followed by another left turn
+    assert legs.bearings == pytest.approx([90, 0, 270], abs=1e-3)
+    assert legs.final_bearings == pytest.approx([90, 0, 270], abs=1e-3)
+    assert legs.turn_angles == pytest.approx([90, 90], abs=1e-3)
+
+
+def test_final_bearing_long_distance():
+    """Tests if the bearing on arrival differs from the initial bearing on a great circle"""
+    legs = geometry.compute_legs(np.array(WARSAW), np.array(LONDON))
+    assert legs.bearings[0] == pytest.approx(275.08, abs=0.01)
+    assert legs.final_bearings[0] == pytest.approx(258.58, abs=0.01)
+    assert len(legs.turn_angles) == 0
+
+
+def test_turn_angles():
+    """Tests if turns are normalised to (-180, 180] and positive to the left"""
+    turns = geometry.turn_angles(np.array([0, 90, 350, 10, 0]), np.array([90, 0, 10, 350, 180]))
+    assert turns.tolist() == [-90, 90, -20, 20, 180]
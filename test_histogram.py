@@ -0,0 +1,29 @@
+"""Pytest testcases for the latency histogram"""
+from histogram import LatencyHistogram
+
+# pylint: disable=line-too-long
+
+
+def test_histogram():
+    """Tests if latencies are counted in their buckets and percentiles are bucket bounds"""
+    histogram = LatencyHistogram((1, 10, 100))
+    for seconds in [0.0005] * 90 + [0.005] * 9 + [0.5]:
+        histogram.observe(seconds)
+    histogram.observe_failure()
+    stats = histogram.get_stats()
+    assert stats["count"] == 100
+    assert stats["failures"] == 1
+    assert stats["buckets"] == {"le_1": 90, "le_10": 9, "le_100": 0, "le_inf": 1}
+    assert stats["p50_ms"] == 1
+    assert stats["p95_ms"] == 10
+    assert stats["p99_ms"] == 10
+    assert histogram.percentile(1.0) == 500
+    assert stats["max_ms"] == 500
+
+
+def test_empty_histogram():
+    """Tests if an empty histogram has no percentiles"""
+    stats = LatencyHistogram().get_stats()
+    assert stats["count"] == 0
+    assert stats["p50_ms"] is None
+    assert stats["mean_ms"] is None
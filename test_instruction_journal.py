@@ -0,0 +1,138 @@
+"""Pytest testcases for testing the InstructionJournal on an in-memory database"""
+import time
+import pytest
+from sqlalchemy import Column, Float, Integer, DateTime
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from database import create_database_engine
+from instruction_journal import InstructionJournal, JournalFullError, JournalWriteError
+
+# pylint: disable=line-too-long
+
+Base = declarative_base()
+
+
+class Record(Base):
+    """Table used for testing the journal"""
+    __tablename__ = "records"
+    id = Column(Integer, primary_key=True)
+    speed = Column(Float)
+    created_at = Column(DateTime)
+
+
+@pytest.fixture(name="session_factory")
+def in_memory_database():
+    """Create an in-memory database with the records table"""
+    engine = create_database_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def count(session_factory) -> int:
+    """Returns the number of records in the database"""
+    with session_factory() as db:
+        return db.query(Record).count()
+
+
+def test_append_assigns_ids(session_factory):
+    """Tests if ids continue from the highest id in the table"""
+    with session_factory() as db:
+        db.add(Record(id=41, speed=1))
+        db.commit()
+    journal = InstructionJournal(session_factory, Record, flush_interval=60)
+    assert journal.append({"speed": 1})["id"] == 42
+    assert journal.append({"speed": 2})["id"] == 43
+    assert journal.get(43)["speed"] == 2
+    assert count(session_factory) == 1
+    journal.shutdown()
+
+
+def test_flush_writes_batch(session_factory):
+    """Tests if pending records are written in one flush"""
+    journal = InstructionJournal(session_factory, Record, flush_interval=60)
+    for speed in range(10):
+        journal.append({"speed": speed})
+    assert journal.flush() == 10
+    assert count(session_factory) == 10
+    assert not journal.pending
+    journal.shutdown()
+
+
+def test_flush_interval(session_factory):
+    """Tests if the background thread writes records after the flush interval"""
+    journal = InstructionJournal(session_factory, Record, flush_interval=0.05)
+    journal.append({"speed": 1})
+    deadline = time.monotonic() + 2
+    while journal.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert count(session_factory) == 1
+    journal.shutdown()
+
+
+def test_max_pending(session_factory):
+    """Tests if a full journal is flushed by the caller"""
+    journal = InstructionJournal(session_factory, Record, batch_size=1000, flush_interval=60, max_pending=5)
+    for speed in range(5):
+        journal.append({"speed": speed})
+    assert count(session_factory) == 5
+    journal.shutdown()
+
+
+def test_shutdown_flushes(session_factory):
+    """Tests if shutting down writes every pending record"""
+    journal = InstructionJournal(session_factory, Record, flush_interval=60)
+    journal.append({"speed": 1})
+    journal.append({"speed": 2})
+    journal.shutdown()
+    assert count(session_factory) == 2
+
+
+def test_poison_record_quarantined(session_factory):
+    """Tests if a record that can never be written is quarantined and the others are written"""
+    journal = InstructionJournal(session_factory, Record, flush_interval=60)
+    journal.append({"speed": 1})
+    with session_factory() as db:
+        db.add(Record(id=2, speed=0))
+        db.commit()
+    journal.append({"speed": 2})
+    journal.append({"speed": 3})
+    with pytest.raises(JournalWriteError):
+        journal.flush()
+    assert not journal.pending
+    assert [record["id"] for record in journal.quarantined] == [2]
+    assert journal.flushed == 2
+    assert count(session_factory) == 3
+    assert not journal.failing
+    journal.shutdown()
+
+
+def test_failing_database(session_factory):
+    """Tests if a failing database keeps records pending, is not written on the caller's thread and bounds the journal"""
+    broken = [True]
+    calls = []
+
+    def failing_session_factory():
+        calls.append(True)
+        if broken[0]:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return session_factory()
+
+    journal = InstructionJournal(failing_session_factory, Record, batch_size=1000, flush_interval=60, max_pending=3)
+    journal._last_id = 0  # pylint: disable=protected-access
+    journal.append({"speed": 1})
+    assert journal.flush() == 0
+    assert journal.failing
+    calls.clear()
+    journal.append_many([{"speed": 2}, {"speed": 3}])
+    assert not calls
+    with pytest.raises(JournalFullError):
+        journal.append({"speed": 4})
+    assert len(journal.pending) == 3
+
+    broken[0] = False
+    assert journal.flush() == 3
+    assert not journal.failing
+    assert count(session_factory) == 3
+    journal.shutdown()
+
@@ -0,0 +1,72 @@
+"""Pytest testcases for testing sampled logging of the control loop"""
+import json
+import logging
+import pytest
+from clock import VirtualClock
+from log_config import LOG_FULL, JsonFormatter, SampledLog
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="clock")
+def virtual_clock():
+    """Create a virtual clock"""
+    return VirtualClock()
+
+
+@pytest.fixture(name="logger")
+def test_logger(caplog):
+    """Create a logger whose records are captured"""
+    caplog.set_level(logging.INFO, logger="test_log_config")
+    return logging.getLogger("test_log_config")
+
+
+def test_sampled_per_interval(logger, clock, caplog):
+    """Tests if frequent records are logged as one summary per interval with min and max"""
+    log = SampledLog(logger, "Distance covered: %f", "Drive progress", interval=1.0, clock=clock)
+    for tick in range(12):
+        log(tick * 0.25, distance=tick * 0.25)
+        clock.advance(0.25)
+    log.flush()
+    assert [record.summary["count"] for record in caplog.records] == [5, 5, 2]
+    assert caplog.records[0].summary["distance"] == {"min": 0.0, "max": 1.0}
+    assert caplog.records[0].getMessage() == "Drive progress: 5 in 1.0 s, distance 0..1"
+
+
+def test_sampled_every_n(logger, clock, caplog):
+    """Tests if a summary is logged every n records"""
+    log = SampledLog(logger, "Sent instruction: %s", "Sent instructions", interval=3600, every=5, clock=clock)
+    for _ in range(12):
+        log(b"{}", speed=1)
+    assert [record.summary["count"] for record in caplog.records] == [5, 5]
+    log.flush()
+    log.flush()
+    assert len(caplog.records) == 3
+
+
+def test_full_mode(logger, clock, caplog):
+    """Tests if every record is logged with its message in full mode"""
+    log = SampledLog(logger, "Sent instruction: %s", "Sent instructions", mode=LOG_FULL, clock=clock)
+    log("a", speed=1)
+    log("b", speed=2)
+    log.flush()
+    assert [record.getMessage() for record in caplog.records] == ["Sent instruction: a", "Sent instruction: b"]
+
+
+def test_disabled_level(logger, clock, caplog):
+    """Tests if nothing is aggregated when the level is disabled"""
+    log = SampledLog(logger, "Sent instruction: %s", "Sent instructions", level=logging.DEBUG, clock=clock)
+    log("a", speed=1)
+    assert log.count == 0
+    log.flush()
+    assert not caplog.records
+
+
+def test_json_formatter(logger, clock, caplog):
+    """Tests if summary records are formatted as JSON with their fields"""
+    log = SampledLog(logger, "Sent instruction: %s", "Sent instructions", every=2, clock=clock)
+    log("a", speed=1)
+    log("b", speed=2)
+    data = json.loads(JsonFormatter().format(caplog.records[0]))
+    assert data["level"] == "INFO"
+    assert data["summary"]["speed"] == {"min": 1, "max": 2}
@@ -1,15 +1,23 @@
 """Pytest tests for testing the FastAPI for controlling Capra Hircus"""
+import json
+import time
+from unittest.mock import MagicMock
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
-from main import app, SessionLocal, Instruction
+from clock import VirtualClock
+from main import app, controller, engine, fleet, journal, scheduler, SessionLocal, Instruction
 
 # pylint: disable=line-too-long
 
 
 @pytest.fixture(name="client")
-def test_client():
-    """Creates test client for testing the API"""
+def test_client(monkeypatch):
+    """Creates test client for testing the API, drives of the robots run on virtual time"""
+    clock = VirtualClock()
+    monkeypatch.setattr(fleet, "clock", clock)
+    monkeypatch.setattr(controller, "clock", clock)
+    monkeypatch.setattr(scheduler, "clock", clock)
     yield TestClient(app)
 
 
@@ -24,20 +32,114 @@ def test_create_instruction(client):
     assert instruction["speed"] == 1
     assert instruction["distance"] == 0.1
 
-    db: Session = SessionLocal()
-    db_instruction = db.query(Instruction).filter(
-        Instruction.id == instruction["id"]).first()
-    assert db_instruction is not None
-    assert db_instruction.angle == 0.5
-    assert db_instruction.speed == 1
-    assert db_instruction.distance == 0.1
+    journal.flush()
+    db: Session
+    with SessionLocal() as db:
+        db_instruction = db.query(Instruction).filter(
+            Instruction.id == instruction["id"]).first()
+        assert db_instruction is not None
+        assert db_instruction.angle == 0.5
+        assert db_instruction.speed == 1
+        assert db_instruction.distance == 0.1
 
 
-def test_stop_robot(client):
-    """Testing if stopping the robot results in the correct message"""
+def test_drive_returns_job(client):
+    """Testing if /drive/ returns immediately with a job that can be looked up"""
+    instruction_data = {"angle": 0.0, "speed": 1, "distance": 0.1}
+    response = client.post("/drive/", json=instruction_data)
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] in ("queued", "running", "completed")
+
+    response = client.get(f"/drive/{job['job_id']}")
+    assert response.status_code == 200
+    assert response.json()["job_id"] == job["job_id"]
+    assert response.json()["instruction_id"] == job["id"]
+
+
+def test_sessions_closed(client):
+    """Testing if database connections are returned to the pool after each request"""
+    for _ in range(20):
+        client.post("/drive/", json={"angle": 0.0, "speed": 1, "distance": 0.1})
+        client.get("/instructions/1")
+    journal.flush()
+    assert engine.pool.checkedout() == 0
+
+
+def test_drive_batch(client):
+    """Testing if a batch of instructions is stored and queued in order"""
+    instructions = [{"angle": 0.1, "speed": 1, "distance": 0.1},
+                    {"angle": -0.2, "speed": -1, "distance": 0.2}]
+    response = client.post("/drive/batch", json=instructions)
+    assert response.status_code == 200
+    jobs = response.json()
+    assert [(job["angle"], job["speed"], job["distance"]) for job in jobs] == [(0.1, 1, 0.1), (-0.2, -1, 0.2)]
+    assert jobs[1]["id"] == jobs[0]["id"] + 1
+
+    response = client.get(f"/instructions/{jobs[1]['id']}")
+    assert response.json()["distance"] == 0.2
+
+
+def test_drive_batch_validation(client):
+    """Testing if a batch with an invalid instruction is rejected as a whole"""
+    pending = len(journal.pending)
+    instructions = [{"angle": 0.1, "speed": 1, "distance": 0.1},
+                    {"angle": 0.1, "speed": 3, "distance": 0.1}]
+    response = client.post("/drive/batch", json=instructions)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", 1, "speed"]
+    assert len(journal.pending) <= pending
+
+    response = client.post("/drive/batch", json=[])
+    assert response.status_code == 422
+
+
+def test_drive_job_not_found(client):
+    """Testing if an unknown drive job results in a 404"""
+    response = client.get("/drive/unknown")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Drive job not found"}
+
+
+def test_stop_robot(client, monkeypatch):
+    """Testing if stopping the robots reports per robot whether the stop was acknowledged"""
     response = client.post("/stop/")
+    assert response.status_code == 503
+    assert response.json()["robots"]["hircus"]["acknowledged"] is False
+
+    mqtt_client = MagicMock()
+    mqtt_client.publish.return_value.rc = 0
+    monkeypatch.setattr(controller.connection, "client", mqtt_client)
+    response = client.post("/stop/")
+    assert response.status_code == 200
+    assert response.json()["message"] == "Robot stopped"
+    assert response.json()["robots"]["hircus"]["status"] == "ok"
+    assert response.json()["robots"]["hircus"]["acknowledged"] is True
+
+
+def test_robot_routes(client):
+    """Testing if commands can be addressed to a robot of the fleet"""
+    response = client.get("/robots")
+    assert response.status_code == 200
+    robot_id = response.json()[0]["robot_id"]
+
+    response = client.post(f"/robots/{robot_id}/drive/", json={"angle": 0.0, "speed": 1, "distance": 0.1})
+    assert response.status_code == 200
+    response = client.get(f"/robots/{robot_id}/drive/{response.json()['job_id']}")
+    assert response.status_code == 200
+    response = client.post(f"/robots/{robot_id}/stop/")
+    assert response.status_code == 503
+    assert response.json()["message"] == "Robot stop was not acknowledged"
+    assert response.json()["robot_id"] == robot_id
+    assert response.json()["acknowledged"] is False
+    response = client.get(f"/robots/{robot_id}/stop/latency")
     assert response.status_code == 200
-    assert response.json() == {"message": "Robot stopped"}
+    assert response.json()["count"] + response.json()["failures"] >= 1
+
+    response = client.post("/robots/unknown/drive/", json={"angle": 0.0, "speed": 1, "distance": 0.1})
+    assert response.status_code == 404
+    response = client.get("/robots/unknown/connection_status")
+    assert response.status_code == 404
 
 
 def test_connection_failed(client):
@@ -48,12 +150,26 @@ def test_connection_failed(client):
         'detail': "Failed to connect to Capra Hircus, are you connected to its wifi?"}
 
 
+def test_connection_status(client):
+    """Testing if the connection state of the robot is returned"""
+    response = client.get("/connection_status")
+    assert response.status_code == 200
+    assert response.json()["state"] in ("disconnected", "connecting", "connected")
+    assert response.json()["broker_port"] == 1883
+
+
+def test_get_telemetry(client):
+    """Testing if the latest telemetry per topic is returned"""
+    controller.telemetry.add_message("capra/robot/battery", b'{"level": 80}')
+    response = client.get("/telemetry")
+    assert response.status_code == 200
+    assert response.json()["capra/robot/battery"]["payload"] == {"level": 80}
+
+
 def test_get_instruction(client):
     """Testing retrieving instructions"""
-    db: Session = SessionLocal()
-    instruction = Instruction(angle=0.5, speed=1, distance=10)
-    db.add(instruction)
-    db.commit()
+    journal.append({"angle": 0.5, "speed": 1, "distance": 10})
+    journal.flush()
 
     response = client.get("/instructions/1")
     assert response.status_code == 200
@@ -62,13 +178,84 @@ def test_get_instruction(client):
 
 
 def test_upload_json(client):
-    """Testing uploading JSOn files"""
+    """Testing if uploaded path files are stored and can be sent to the robot"""
+    with open("data/Path2.json", "rb") as f:
+        files = {"file": ("Path2.json", f.read())}
+    response = client.post("/upload-json", files=files)
+    assert response.status_code == 200
+    path = response.json()
+    assert path["message"] == "JSON file uploaded and processed successfully"
+    assert path["path_uuid"] == "Path2"
+    assert path["nodes"] == 2
+
+    response = client.get(f"/paths/{path['path_id']}")
+    assert response.status_code == 200
+    assert response.json()["edges"] == 1
+
+    response = client.post(f"/paths/{path['path_id']}/send")
+    assert response.status_code == 200
+    assert response.json()["path_uuid"] == "Path2"
+
+    response = client.post(f"/paths/{path['path_id']}/send", params={"transport": "chunked"})
+    assert response.status_code == 200
+    response = client.post(f"/paths/{path['path_id']}/send", params={"transport": "unknown"})
+    assert response.status_code == 422
+
+
+def test_upload_json_invalid(client):
+    """Testing if files that are not a valid path are rejected"""
     files = {
         "file": ("test.json", b'{"angle": 0.5, "speed": 1, "distance": 0.1}')}
     response = client.post("/upload-json", files=files)
+    assert response.status_code == 422
+
+    files = {"file": ("test.txt", b"{}")}
+    response = client.post("/upload-json", files=files)
+    assert response.status_code == 400
+
+    response = client.get("/paths/0")
+    assert response.status_code == 404
+
+
+def test_get_instructions_paginated(client):
+    """Testing if instructions are listed page by page using the keyset cursor"""
+    ids = [journal.append({"angle": 0.1 * i, "speed": 1 + i % 2, "distance": 1})["id"] for i in range(5)]
+    journal.flush()
+    after_id = ids[0] - 1
+
+    response = client.get("/instructions", params={"after_id": after_id, "limit": 2}, headers={"Origin": "http://localhost:5173"})
     assert response.status_code == 200
-    assert response.json() == {
-        "message": "JSON file uploaded and processed successfully"}
+    # The frontend follows the cursor, so browsers must be allowed to read it
+    assert response.headers["Access-Control-Expose-Headers"] == "X-Next-After-Id"
+    assert [i["id"] for i in response.json()] == ids[:2]
+    assert response.headers["X-Next-After-Id"] == str(ids[1])
+
+    response = client.get("/instructions", params={"after_id": response.headers["X-Next-After-Id"], "limit": 10})
+    assert [i["id"] for i in response.json()] == ids[2:]
+    assert "X-Next-After-Id" not in response.headers
+
+    response = client.get("/instructions", params={"after_id": after_id, "min_speed": 2, "max_angle": 0.35})
+    assert [i["id"] for i in response.json()] == [ids[1], ids[3]]
+
+
+def test_get_instructions_ndjson(client):
+    """Testing if instructions can be streamed as newline delimited JSON"""
+    ids = [journal.append({"angle": 0.5, "speed": 2, "distance": i + 1})["id"] for i in range(3)]
+    journal.flush()
+
+    response = client.get("/instructions", params={"after_id": ids[0] - 1, "format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == [{"id": ids[i], "angle": 0.5, "speed": 2, "distance": i + 1} for i in range(3)]
+
+
+def test_get_pending_instruction(client):
+    """Testing if an instruction that is not written to the database yet can be retrieved"""
+    record = journal.append({"angle": 0.2, "speed": 1, "distance": 3})
+    response = client.get(f"/instructions/{record['id']}")
+    assert response.status_code == 200
+    assert response.json() == {"id": record["id"], "angle": 0.2, "speed": 1, "distance": 3}
 
 
 @pytest.mark.parametrize("angle", [
@@ -144,3 +331,46 @@ def test_distance_validation(client, distance):
             }
         ]
     }
+
+
+def test_metrics(client):
+    """Testing if /metrics exposes request, database and robot metrics in the Prometheus text format"""
+    client.post("/drive/", json={"angle": 0.0, "speed": 1, "distance": 0.1})
+    client.get("/robots")
+    journal.flush()
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'capra_http_requests_total{method="POST",route="/drive/",status="200"}' in text
+    assert 'capra_http_request_duration_seconds_count{method="GET",route="/robots"}' in text
+    assert 'capra_db_query_seconds_count{statement="INSERT"}' in text
+    assert '# TYPE capra_stop_latency_seconds histogram' in text
+    assert 'capra_robot_connected{robot="hircus"}' in text
+    assert "capra_journal_pending" in text
+
+
+def test_missions(client):
+    """Testing if a mission is queued, executed and can be looked up, and impossible changes are refused"""
+    steps = [{"instruction": {"angle": 0.0, "speed": 1, "distance": 0.1}}, {"instruction": {"angle": 0.5, "speed": 2, "distance": 0.1}}]
+    response = client.post("/robots/hircus/missions", json={"name": "patrol", "steps": steps})
+    assert response.status_code == 200
+    mission_id = response.json()["mission_id"]
+
+    deadline = time.monotonic() + 5
+    while client.get(f"/missions/{mission_id}").json()["status"] != "completed" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    mission = client.get(f"/missions/{mission_id}").json()
+    assert mission["status"] == "completed"
+    assert mission["name"] == "patrol"
+    assert [step["status"] for step in mission["steps"]] == ["completed", "completed"]
+    assert mission_id in [m["mission_id"] for m in client.get("/robots/hircus/missions", params={"status": "completed"}).json()]
+
+    assert client.post(f"/missions/{mission_id}/cancel").status_code == 409
+    assert client.post("/missions/0/pause").status_code == 404
+    assert client.get("/missions/0").status_code == 404
+    response = client.post("/robots/hircus/missions", json={"steps": [{"instruction": steps[0]["instruction"], "path_id": 1}]})
+    assert response.status_code == 422
+    response = client.post("/robots/hircus/missions", json={"steps": [{"path_id": 0}]})
+    assert response.status_code == 422
+    assert client.post("/robots/hircus/missions", json={"steps": []}).status_code == 422
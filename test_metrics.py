@@ -0,0 +1,74 @@
+"""Pytest testcases for testing the metrics registry and its Prometheus text format"""
+import pytest
+from histogram import LatencyHistogram
+from metrics import Histogram, Metric, MetricsRegistry
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="registry")
+def metrics_registry():
+    """Create an empty registry"""
+    return MetricsRegistry()
+
+
+def test_counter(registry):
+    """Tests if labelled counters are rendered per label value"""
+    published = registry.counter("published_total", "Published messages", ("topic",))
+    published.labels("capra/remote").inc()
+    published.labels("capra/remote").inc(2)
+    published.labels('a "quoted" topic').inc()
+    text = registry.render()
+    assert "# TYPE published_total counter" in text
+    assert 'published_total{topic="capra/remote"} 3' in text
+    assert 'published_total{topic="a \\"quoted\\" topic"} 1' in text
+
+
+def test_get_or_create(registry):
+    """Tests if a metric is created once by name and conflicting definitions are refused"""
+    assert registry.counter("drives_total", "Drives") is registry.counter("drives_total", "Drives")
+    with pytest.raises(ValueError):
+        registry.gauge("drives_total", "Drives")
+    with pytest.raises(ValueError):
+        registry.counter("drives_total", "Drives").labels("unexpected")
+
+
+def test_metric_is_abstract():
+    """Tests if only the metric types implementing values and samples can be created"""
+    with pytest.raises(TypeError):
+        Metric("capra_untyped", "Untyped")
+
+
+def test_histogram(registry):
+    """Tests if histograms are rendered with cumulative buckets in seconds"""
+    latency = registry.histogram("publish_seconds", "Publish latency", buckets_ms=(1, 10, 100))
+    latency.observe(0.0005)
+    latency.observe(0.005)
+    latency.observe(0.5)
+    with latency.time():
+        pass
+    lines = registry.render().splitlines()
+    assert 'publish_seconds_bucket{le="0.001"} 2' in lines
+    assert 'publish_seconds_bucket{le="0.01"} 3' in lines
+    assert 'publish_seconds_bucket{le="0.1"} 3' in lines
+    assert 'publish_seconds_bucket{le="+Inf"} 4' in lines
+    assert "publish_seconds_count 4" in lines
+    assert any(line.startswith("publish_seconds_sum 0.505") for line in lines)
+
+
+def test_collector(registry):
+    """Tests if collectors are called on every scrape and existing histograms can be attached"""
+    stop_latency = LatencyHistogram()
+    stop_latency.observe(0.003)
+    calls = []
+
+    def collect():
+        calls.append(1)
+        histogram = Histogram("stop_seconds", "Stop latency", ("robot",))
+        histogram.attach(stop_latency, "hircus")
+        return [histogram]
+
+    registry.add_collector(collect)
+    assert 'stop_seconds_count{robot="hircus"} 1' in registry.render()
+    registry.render()
+    assert len(calls) == 2
@@ -0,0 +1,247 @@
+"""Pytest testcases for testing the mission queue with a fleet of mocked robots"""
+import threading
+import time
+from unittest.mock import MagicMock
+import paho.mqtt.client as mqtt
+import pytest
+from sqlalchemy.orm import sessionmaker
+from clock import VirtualClock
+from database import Base, create_database_engine
+from fleet import FleetRegistry
+from mission_queue import Mission, MissionQueue, MISSION_CANCELLED, MISSION_COMPLETED, MISSION_PAUSED, MISSION_RUNNING
+from path_ingest import ingest_path
+
+# pylint: disable=line-too-long
+
+
+class BlockingDrive:
+    """Stand-in for remote_control that drives until released or stopped, it covers 40 % right away"""
+
+    def __init__(self) -> None:
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, distance, speed, angle, stop_event=None, odometry=False, on_progress=None):
+        self.calls.append(distance)
+        if on_progress is not None:
+            on_progress(distance * 0.4)
+        self.started.set()
+        while not self.release.is_set():
+            if stop_event.wait(0.01):
+                return {"distance_covered": distance * 0.4}
+        return {"distance_covered": distance}
+
+
+def drive_step(distance, speed=1):
+    """A mission step driving a distance"""
+    return {"instruction": {"angle": 0.0, "speed": speed, "distance": distance}}
+
+
+def wait_for_status(queue, mission_id, status, timeout=5.0):
+    """Waits until a mission has a status, returns the mission"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        mission = queue.get(mission_id)
+        if mission["status"] == status:
+            return mission
+        time.sleep(0.01)
+    raise AssertionError(f"Mission {mission_id} is {queue.get(mission_id)['status']}, expected {status}")
+
+
+@pytest.fixture(name="session_factory")
+def file_database(tmp_path):
+    """Create a database file with the mission and path tables, executors use their own connections"""
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'missions.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture(name="fleet")
+def mocked_fleet():
+    """A fleet with one robot whose MQTT client is mocked and whose drives run on virtual time"""
+    registry = FleetRegistry(clock=VirtualClock())
+    robot = registry.register("hircus", "test_broker_address", 1234)
+    robot.controller.client = MagicMock()
+    robot.controller.client.publish.return_value.rc = mqtt.MQTT_ERR_SUCCESS
+    registry.start()
+    yield registry
+    registry.shutdown()
+
+
+@pytest.fixture(name="drive")
+def blocking_drive(fleet):
+    """Replaces the drives of the robot by a drive that runs until released"""
+    drive = BlockingDrive()
+    fleet.default.controller.remote_control = drive
+    return drive
+
+
+@pytest.fixture(name="queue")
+def mission_queue(fleet, session_factory):
+    """Create a mission queue for the fleet"""
+    queue = MissionQueue(fleet, session_factory)
+    queue.start()
+    yield queue
+    queue.shutdown()
+
+
+def test_mission_runs_steps(queue, fleet, session_factory):
+    """Tests if drive and path steps are executed in order"""
+    with open("data/Path2.json", "rb") as f:
+        path = ingest_path(f, session_factory, "Path2.json")
+    mission = queue.submit("hircus", [drive_step(0.3), {"path_id": path["path_id"], "transport": "compact"}, drive_step(0.2, 2)], "patrol")
+    assert mission["status"] == "queued"
+
+    mission = wait_for_status(queue, mission["mission_id"], MISSION_COMPLETED)
+    assert mission["current_step"] == 3
+    assert mission["progress"] == 1.0
+    assert [step["status"] for step in mission["steps"]] == [MISSION_COMPLETED] * 3
+    topics = [call.args[0] for call in fleet.default.controller.client.publish.call_args_list]
+    assert topics.count("capra/remote/direct_velocity") == 4
+    assert topics.count("capra/navigation/send_path") == 1
+    assert topics.index("capra/navigation/send_path") < topics.index("capra/remote/direct_velocity", 4)
+
+
+def test_pause_resume_from_checkpoint(queue, drive):
+    """Tests if a paused drive keeps its progress and the resumed mission drives the rest"""
+    mission = queue.submit("hircus", [drive_step(1.0), drive_step(0.5)])
+    assert drive.started.wait(2)
+
+    mission = queue.pause(mission["mission_id"])
+    assert mission["status"] == MISSION_PAUSED
+    assert mission["current_step"] == 0
+    assert mission["step_progress"] == pytest.approx(0.4)
+    assert mission["steps"][0]["status"] == MISSION_PAUSED
+
+    drive.release.set()
+    queue.resume(mission["mission_id"])
+    wait_for_status(queue, mission["mission_id"], MISSION_COMPLETED)
+    assert drive.calls == [1.0, pytest.approx(0.6), 0.5]
+
+
+def test_cancel(queue, drive):
+    """Tests if a cancelled mission stops its drive and the next mission runs"""
+    first = queue.submit("hircus", [drive_step(1.0), drive_step(1.0)])
+    second = queue.submit("hircus", [drive_step(0.5)])
+    assert drive.started.wait(2)
+    assert queue.cancel(first["mission_id"])["status"] == MISSION_CANCELLED
+    drive.release.set()
+    wait_for_status(queue, second["mission_id"], MISSION_COMPLETED)
+    assert drive.calls == [1.0, 0.5]
+    with pytest.raises(ValueError):
+        queue.resume(first["mission_id"])
+
+
+def test_paused_mission_holds_queue(queue, drive):
+    """Tests if missions after a paused mission wait until it is resumed or cancelled"""
+    drive.release.set()
+    fleet_robot = queue.fleet.default
+    fleet_robot.scheduler.shutdown()
+    first = queue.submit("hircus", [drive_step(0.5)])
+    queue.pause(first["mission_id"])
+    second = queue.submit("hircus", [drive_step(0.5)])
+    fleet_robot.scheduler.start()
+    time.sleep(0.1)
+    assert queue.get(second["mission_id"])["status"] == "queued"
+    queue.cancel(first["mission_id"])
+    wait_for_status(queue, second["mission_id"], MISSION_COMPLETED)
+
+
+def test_emergency_stop_pauses_mission(queue, drive, fleet):
+    """Tests if stopping the robot's drives pauses the mission instead of driving the next step"""
+    mission = queue.submit("hircus", [drive_step(1.0), drive_step(1.0)])
+    assert drive.started.wait(2)
+    fleet.default.scheduler.cancel_all()
+    mission = wait_for_status(queue, mission["mission_id"], MISSION_PAUSED)
+    assert mission["error"] == "Drive was stopped"
+    assert drive.calls == [1.0]
+
+
+def test_stop_during_path_step(queue, drive, fleet, session_factory):
+    """Tests if an emergency stop while a path is sent pauses the mission before its next drive, until it is resumed"""
+    with open("data/Path2.json", "rb") as f:
+        path = ingest_path(f, session_factory, "Path2.json")
+    controller = fleet.default.controller
+    sending, sent = threading.Event(), threading.Event()
+
+    def send_payload(payload, transport=None):
+        sending.set()
+        return sent.wait(2)
+
+    controller.send_payload = send_payload
+    mission = queue.submit("hircus", [{"path_id": path["path_id"]}, drive_step(5.0)])
+    assert sending.wait(2)
+    assert queue.interrupt("hircus") == mission["mission_id"]
+    fleet.default.scheduler.cancel_all()
+    controller.emergency_stop()
+    sent.set()
+
+    mission = wait_for_status(queue, mission["mission_id"], MISSION_PAUSED)
+    assert mission["error"] == "Robot was stopped"
+    assert mission["current_step"] == 1
+    assert drive.calls == []
+    assert controller.halted.is_set()
+
+    # Missions started while the robot is halted are paused before their first step
+    queue.cancel(mission["mission_id"])
+    mission = wait_for_status(queue, queue.submit("hircus", [drive_step(0.5)])["mission_id"], MISSION_PAUSED)
+    assert mission["error"] == "Robot is stopped"
+    assert drive.calls == []
+
+    drive.release.set()
+    queue.resume(mission["mission_id"])
+    wait_for_status(queue, mission["mission_id"], MISSION_COMPLETED)
+    assert drive.calls == [0.5]
+
+
+def test_checkpoint_while_driving(queue, drive, session_factory):
+    """Tests if the distance covered is stored while a drive step runs, not only when it ends"""
+    queue.get_executor("hircus").checkpoint_interval = 0.01
+    mission_id = queue.submit("hircus", [drive_step(0.5), drive_step(2.0)])["mission_id"]
+    assert drive.started.wait(2)
+    deadline = time.monotonic() + 2
+    while queue.get(mission_id)["step_progress"] == 0.0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with session_factory() as db:
+        mission = db.get(Mission, mission_id)
+        assert (mission.status, mission.current_step, mission.step_progress) == (MISSION_RUNNING, 0, 0.2)
+
+    drive.release.set()
+    mission = wait_for_status(queue, mission_id, MISSION_COMPLETED)
+    assert mission["step_progress"] == 0.0
+    assert drive.calls == [0.5, 2.0]
+
+
+def test_recover_after_crash(fleet, session_factory):
+    """Tests if a mission left running by a crash is paused and resumes from its checkpoint"""
+    queue = MissionQueue(fleet, session_factory)
+    mission_id = queue.submit("hircus", [drive_step(0.5), drive_step(0.3), drive_step(0.2)])["mission_id"]
+    queue.shutdown()
+    with session_factory() as db:
+        db.query(Mission).filter(Mission.id == mission_id).update(
+            {"status": MISSION_RUNNING, "current_step": 1, "step_progress": 0.1})
+        db.commit()
+
+    drive = BlockingDrive()
+    drive.release.set()
+    fleet.default.controller.remote_control = drive
+    restarted = MissionQueue(fleet, session_factory)
+    restarted.start()
+    mission = restarted.get(mission_id)
+    assert mission["status"] == MISSION_PAUSED
+    assert "step 2" in mission["error"]
+    restarted.resume(mission_id)
+    wait_for_status(restarted, mission_id, MISSION_COMPLETED)
+    restarted.shutdown()
+    assert drive.calls == [pytest.approx(0.2), 0.2]
+
+
+def test_invalid_missions(queue):
+    """Tests if unknown paths, transports and missions are refused"""
+    with pytest.raises(ValueError):
+        queue.submit("hircus", [{"path_id": 12345}])
+    with pytest.raises(KeyError):
+        queue.submit("unknown", [drive_step(0.5)])
+    with pytest.raises(KeyError):
+        queue.pause(12345)
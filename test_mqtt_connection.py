@@ -0,0 +1,79 @@
+"""Pytest testcases for testing the MqttConnection using MagicMock"""
+from unittest.mock import MagicMock
+import pytest
+from paho.mqtt.reasoncodes import ReasonCode
+from paho.mqtt.packettypes import PacketTypes
+from mqtt_connection import MqttConnection, STATE_CONNECTED, STATE_CONNECTING, STATE_DISCONNECTED
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="mqtt_client")
+def mock_mqtt_client():
+    """Create mock mqtt client"""
+    return MagicMock()
+
+
+@pytest.fixture(name="connection")
+def mqtt_connection(mqtt_client):
+    """Create instance of MqttConnection"""
+    connection = MqttConnection("test_broker_address", 1234, {"topic/qos1": 1})
+    connection.client = mqtt_client
+    return connection
+
+
+def test_connect_starts_loop(connection, mqtt_client):
+    """Tests if connecting starts the network loop"""
+    connection.connect()
+    mqtt_client.connect.assert_called_once_with("test_broker_address", 1234)
+    mqtt_client.loop_start.assert_called_once()
+    assert connection.state == STATE_CONNECTING
+
+
+def test_connect_refused(connection, mqtt_client):
+    """Tests if a refused connection is raised and leaves the loop stopped"""
+    mqtt_client.connect.side_effect = ConnectionRefusedError
+    with pytest.raises(ConnectionRefusedError):
+        connection.connect()
+    mqtt_client.loop_start.assert_not_called()
+    assert connection.state == STATE_DISCONNECTED
+
+
+def test_publish_topic_qos(connection, mqtt_client):
+    """Tests if the QoS configured for a topic is used, unless overridden"""
+    connection.publish("topic/qos1", "message")
+    connection.publish("topic/other", "message")
+    connection.publish("topic/qos1", "message", qos=2)
+    assert [c.kwargs["qos"] for c in mqtt_client.publish.call_args_list] == [1, 0, 2]
+
+
+def test_set_qos_invalid(connection):
+    """Tests if only valid QoS levels can be configured"""
+    with pytest.raises(ValueError):
+        connection.set_qos("topic", 3)
+
+
+def test_connection_callbacks(connection, mqtt_client):
+    """Tests if the connection state follows the network loop callbacks"""
+    mqtt_client.is_connected.return_value = False
+    connection.connect()
+    connection._on_connect(mqtt_client, None, None, ReasonCode(PacketTypes.CONNACK, "Success"), None)  # pylint: disable=protected-access
+    assert connection.state == STATE_CONNECTED
+    assert connection.connected_at is not None
+
+    connection._on_disconnect(mqtt_client, None, None, ReasonCode(PacketTypes.DISCONNECT, "Unspecified error"), None)  # pylint: disable=protected-access
+    assert connection.get_status()["state"] == STATE_CONNECTING
+    assert connection.disconnects == 1
+
+
+def test_subscribe_dispatch(connection, mqtt_client):
+    """Tests if subscriptions are renewed on connect and messages are dispatched to their callback"""
+    received = []
+    connection.subscribe("capra/robot/#", received.append)
+    connection._on_connect(mqtt_client, None, None, ReasonCode(PacketTypes.CONNACK, "Success"), None)  # pylint: disable=protected-access
+    mqtt_client.subscribe.assert_called_with([("capra/robot/#", 0)])
+
+    message = MagicMock(topic="capra/robot/battery")
+    connection._on_message(mqtt_client, None, message)  # pylint: disable=protected-access
+    connection._on_message(mqtt_client, None, MagicMock(topic="capra/other"))  # pylint: disable=protected-access
+    assert received == [message]
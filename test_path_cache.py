@@ -0,0 +1,85 @@
+"""Pytest testcases for the cache of encoded send_path payloads"""
+import hashlib
+import json
+import os
+import shutil
+import pytest
+from path_cache import PathPayloadCache
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="path_file")
+def copy_path_file(tmp_path):
+    """A copy of the example path file that can be modified"""
+    filename = tmp_path / "Path2.json"
+    shutil.copy("data/Path2.json", filename)
+    return str(filename)
+
+
+def test_file_payload_cached(path_file):
+    """Tests if a file is encoded once and compact"""
+    cache = PathPayloadCache()
+    payload = cache.get_file_payload(path_file)
+    with open(path_file, "rb") as f:
+        assert json.loads(payload) == json.load(f)
+    assert b", " not in payload and b": " not in payload
+    assert cache.get_file_payload(path_file) is payload
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_file_payload_invalidated(path_file):
+    """Tests if a changed file is read again"""
+    cache = PathPayloadCache()
+    payload = cache.get_file_payload(path_file)
+    data = json.loads(payload)
+    data["path_uuid"] = "Changed"
+    with open(path_file, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    stat = os.stat(path_file)
+    os.utime(path_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert json.loads(cache.get_file_payload(path_file))["path_uuid"] == "Changed"
+
+
+def test_same_contents_shared(path_file, tmp_path):
+    """Tests if files with the same contents share a payload"""
+    copy = tmp_path / "Copy.json"
+    shutil.copy(path_file, copy)
+    cache = PathPayloadCache()
+    assert cache.get_file_payload(path_file) is cache.get_file_payload(str(copy))
+    assert cache.get_stats()["entries"] == 1
+
+
+def test_simplified_payload_separate(path_file):
+    """Tests if simplified payloads are cached separately"""
+    cache = PathPayloadCache()
+    cache.get_file_payload(path_file)
+    cache.get_file_payload(path_file, tolerance=0.5)
+    assert cache.get_stats()["entries"] == 2
+
+
+def test_sources_separate(path_file):
+    """Tests if a file and a stored path with the same contents do not share a payload"""
+    cache = PathPayloadCache()
+    with open(path_file, "rb") as f:
+        content_hash = hashlib.sha256(f.read()).hexdigest()
+    stored = cache.get_or_encode(content_hash, lambda: {"path_uuid": "Stored"})
+    assert cache.get_file_payload(path_file) != stored
+    assert cache.get_or_encode(content_hash, lambda: {}) is stored
+    assert cache.get_stats()["entries"] == 2
+
+
+def test_eviction():
+    """Tests if the least recently used payloads are evicted over the limits"""
+    cache = PathPayloadCache(maxsize=2, max_bytes=10)
+    cache.put(("a",), b"1234")
+    cache.put(("b",), b"1234")
+    cache.get(("a",))
+    cache.put(("c",), b"1234")
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == b"1234"
+    cache.put(("d",), b"123456")
+    assert cache.get_stats()["bytes"] <= 10
+    cache.put(("e",), b"x" * 11)
+    assert cache.get(("e",)) is None
@@ -0,0 +1,173 @@
+"""Pytest testcases for streaming ingestion of Capra Hircus path files"""
+import io
+import json
+from unittest.mock import MagicMock
+import pytest
+from sqlalchemy.orm import sessionmaker
+from database import Base, create_database_engine
+from path_ingest import PathIngestError, PathStreamParser, PathTooLargeError, ingest_path
+from path_store import PathNode, StoredPath, find_path, load_route
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="session_factory")
+def in_memory_database():
+    """Create an in-memory database with the path tables"""
+    engine = create_database_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture(name="path_file")
+def load_path_file() -> bytes:
+    """The example path file"""
+    with open("data/Path2.json", "rb") as f:
+        return f.read()
+
+
+def parse(document: bytes, chunk_size: int) -> list:
+    """Feeds a document to the parser in chunks, returns all events"""
+    parser = PathStreamParser()
+    events = []
+    for i in range(0, len(document), chunk_size):
+        events.extend(parser.feed(document[i:i + chunk_size]))
+    events.extend(parser.close())
+    return events
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_parser_chunks(path_file, chunk_size):
+    """Tests if the parser yields the same values as json.loads for any chunk size"""
+    data = json.loads(path_file)
+    events = parse(path_file, chunk_size)
+    assert [value for key, value in events if key == "nodes"] == data["nodes"]
+    assert [value for key, value in events if key == "edges"] == data["edges"]
+    assert ("path_uuid", "Path2") in events
+    assert ("position_encoding", 0) in events
+
+
+def test_parser_numbers_split():
+    """Tests if a number split over two chunks is not cut short"""
+    events = parse(b'{"path_encoding": 12345, "nodes": []}', 3)
+    assert events == [("path_encoding", 12345)]
+
+
+@pytest.mark.parametrize("document", [
+    b'[1, 2]',
+    b'{"nodes": [{"uuid": "Node_0"}',
+    b'{"nodes": {}}',
+    b'{"nodes": [] "edges": []}',
+    b'{"nodes": []} trailing',
+    b'{"nodes": [{"uuid": }]}',
+])
+def test_parser_invalid(document):
+    """Tests if invalid documents are rejected"""
+    with pytest.raises(PathIngestError):
+        parse(document, 4)
+
+
+def test_parser_values_split():
+    """Tests if literals, exponents, strings and escapes split over chunks wait for the next chunk"""
+    document = b'{"a": true, "b": null, "c": 1.5e-3, "d": "caf\\u00e9", "e": false, "nodes": []}'
+    assert parse(document, 1) == list(json.loads(document).items())[:-1]
+
+
+def test_parser_syntax_error_not_too_large():
+    """Tests if a syntax error is reported as soon as it is read, not as a value that is too large"""
+    parser = PathStreamParser(max_value_size=50)
+    with pytest.raises(PathIngestError) as error:
+        for i in range(0, 300, 10):
+            list(parser.feed((b'{"nodes": [{"uuid": "A" "x": 1}' + b" " * 300)[i:i + 10]))
+    assert not isinstance(error.value, PathTooLargeError)
+
+
+def test_parser_value_size():
+    """Tests if a single value larger than the limit is rejected without buffering the rest"""
+    parser = PathStreamParser(max_value_size=100)
+    with pytest.raises(PathTooLargeError):
+        list(parser.feed(b'{"nodes": [{"uuid": "' + b"a" * 200))
+
+
+def test_ingest_path(session_factory, path_file):
+    """Tests if a path file is stored and can be loaded as a route"""
+    path = ingest_path(io.BytesIO(path_file), session_factory, "Path2.json", chunk_size=10)
+    assert path["path_uuid"] == "Path2"
+    assert path["nodes"] == 2
+    assert path["edges"] == 1
+    assert path["size"] == len(path_file)
+
+    with session_factory() as db:
+        route = load_route(db, path["path_id"]).get_formatted_route()
+    data = json.loads(path_file)
+    assert [node["position"] for node in route["nodes"]] == [node["position"] for node in data["nodes"]]
+    assert route["edges"][0]["end_node_uuid"] == "Node_1"
+    assert route["edges"][0]["actions"][0]["parameters"][0]["value_float32"] == 0.4
+
+
+def test_ingest_path_roundtrip(session_factory, path_file):
+    """Tests if a stored path is sent as it was uploaded, with its header, node fields and edge actions"""
+    path = ingest_path(io.BytesIO(path_file), session_factory, "Path2.json")
+    with session_factory() as db:
+        route = load_route(db, path["path_id"])
+    assert route.get_formatted_route() == json.loads(path_file)
+    assert route.path_encoding == 0
+
+
+def test_ingest_does_not_lock_database(tmp_path, path_file):
+    """Tests if other writes succeed while a path file is still being read"""
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'paths.db'}")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    upload = io.BytesIO(path_file)
+    writes = []
+
+    def read(size):
+        if upload.tell() > 0 and not writes:
+            with session_factory() as db:
+                db.add(StoredPath(path_uuid="Other", size=0, node_count=0, edge_count=0))
+                db.commit()
+                writes.append(True)
+        return upload.read(size)
+
+    stream = MagicMock()
+    stream.read.side_effect = read
+    path = ingest_path(stream, session_factory, "Path2.json", chunk_size=100)
+    assert writes
+    with session_factory() as db:
+        assert db.query(StoredPath).count() == 2
+        assert db.query(PathNode).filter(PathNode.path_id == path["path_id"]).count() == 2
+
+
+@pytest.mark.parametrize("document, message", [
+    ({"path_uuid": "P", "nodes": [{"uuid": "A", "sequence_number": 0, "position": {"x": 200, "y": 0}}], "edges": []}, "latitude"),
+    ({"path_uuid": "P", "nodes": [{"uuid": "A", "sequence_number": 0, "position": {"x": 1, "y": 1}}] * 2, "edges": []}, "Duplicate"),
+    ({"path_uuid": "P", "nodes": [{"uuid": "A", "sequence_number": 0, "position": {"x": 1, "y": 1}}],
+      "edges": [{"uuid": "E", "start_node_uuid": "A", "end_node_uuid": "B"}]}, "unknown nodes"),
+    ({"path_uuid": "P", "nodes": [], "edges": []}, "at least one node"),
+])
+def test_ingest_invalid_path(session_factory, document, message):
+    """Tests if invalid paths are rejected and nothing is stored"""
+    with pytest.raises(PathIngestError, match=message):
+        ingest_path(io.BytesIO(json.dumps(document).encode()), session_factory, "path.json")
+    with session_factory() as db:
+        assert db.query(StoredPath).count() == 0
+        assert db.query(PathNode).count() == 0
+
+
+def test_ingest_size_limit(session_factory, path_file):
+    """Tests if files larger than the limit are rejected"""
+    with pytest.raises(PathTooLargeError):
+        ingest_path(io.BytesIO(path_file), session_factory, "Path2.json", max_size=100)
+    with pytest.raises(PathTooLargeError):
+        ingest_path(io.BytesIO(path_file), session_factory, "Path2.json", max_elements=2)
+
+
+def test_ingest_same_contents(session_factory, path_file):
+    """Tests if uploading the same file twice returns the stored path"""
+    first = ingest_path(io.BytesIO(path_file), session_factory, "Path2.json")
+    second = ingest_path(io.BytesIO(path_file), session_factory, "Copy.json")
+    assert second == first
+    with session_factory() as db:
+        assert db.query(StoredPath).count() == 1
+        assert find_path(db, path_uuid="Path2").id == first["path_id"]
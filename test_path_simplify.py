@@ -0,0 +1,84 @@
+"""Pytest testcases for simplifying Capra Hircus paths"""
+import numpy as np
+import pytest
+from models.coordinate import Coordinate
+from models.edge import Edge
+from models.feature_types.line_string import LineString
+from models.node import Node
+from models.route_capra import CapraRoute
+from models.route_geojson import GeoJSONRoute
+import path_simplify
+
+# pylint: disable=line-too-long
+
+# One degree of latitude is about 111 km, 1e-6 degrees is about 0.11 m
+METRE = 1 / 111195.0
+
+
+def straight_path(nodes: int, noise: float = 0.0) -> np.ndarray:
+    """Returns a path going north with optional sideways noise in metres"""
+    rng = np.random.default_rng(1)
+    lat = 52.04 + np.arange(nodes) * METRE
+    lon = 5.567 + rng.uniform(-noise, noise, nodes) * METRE / np.cos(np.radians(52.04))
+    return np.column_stack((lat, lon))
+
+
+def capra_route(positions: np.ndarray) -> CapraRoute:
+    """Creates a CapraRoute through the given positions"""
+    route = CapraRoute("Path")
+    for i, (lat, lon) in enumerate(positions.tolist()):
+        route.add_node(Node(f"Node_{i}", i, lat, lon))
+        if i:
+            route.add_edge(Edge(f"Edge_{i - 1}", f"Node_{i - 1}", f"Node_{i}", 0.4))
+    return route
+
+
+def test_douglas_peucker_keeps_corners():
+    """Tests if Douglas-Peucker removes collinear points and keeps corners"""
+    points = np.array([[0, 0], [1, 0.01], [2, 0], [3, 0], [3, 1], [3, 2]], dtype=float)
+    keep = path_simplify.douglas_peucker(points, 0.1)
+    assert np.flatnonzero(keep).tolist() == [0, 3, 5]
+
+
+def test_min_spacing():
+    """Tests if nodes closer together than the spacing are removed"""
+    points = np.column_stack((np.arange(11) * 0.3, np.zeros(11)))
+    keep = path_simplify.min_spacing_mask(points, 1.0)
+    assert np.flatnonzero(keep).tolist() == [0, 4, 7, 10]
+
+
+def test_simplify_path():
+    """Tests if a noisy straight path is reduced to its end points and edges are reconnected"""
+    route = capra_route(straight_path(1000, noise=0.2))
+    simplified, report = path_simplify.simplify_path(route, tolerance=0.5)
+    assert [node["uuid"] for node in simplified["nodes"]] == ["Node_0", "Node_999"]
+    assert simplified["edges"][0]["start_node_uuid"] == "Node_0"
+    assert simplified["edges"][0]["end_node_uuid"] == "Node_999"
+    assert simplified["edges"][0]["actions"][0]["parameters"][0]["value_float32"] == 0.4
+    assert report["nodes_before"] == 1000
+    assert report["nodes_after"] == 2
+    assert report["bytes_after"] < report["bytes_before"]
+
+
+def test_simplify_path_tolerance():
+    """Tests if no node further than the tolerance from the simplified path is removed"""
+    positions = straight_path(500, noise=3.0)
+    indices = path_simplify.simplify_positions(positions, tolerance=1.0)
+    points = path_simplify.project_to_metres(positions)
+    for first, last in zip(indices, indices[1:]):
+        start, end = points[first], points[last]
+        chord = (end - start) / np.linalg.norm(end - start)
+        span = points[first:last + 1] - start
+        assert np.max(np.abs(span[:, 0] * chord[1] - span[:, 1] * chord[0])) <= 1.0 + 1e-9
+
+
+def test_simplify_geojson_route():
+    """Tests if LineStrings of a GeoJSONRoute are simplified"""
+    line = LineString()
+    for lat, lon in straight_path(100).tolist():
+        line.add_coordinate(Coordinate(lon, lat))
+    route = GeoJSONRoute()
+    route.add_feature(line)
+    report = path_simplify.simplify_geojson_route(route, tolerance=0.5)
+    assert report == {"nodes_before": 100, "nodes_after": 2}
+    assert line.coordinates[-1].get_coordinate()[1] == pytest.approx(52.04 + 99 * METRE)
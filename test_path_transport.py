@@ -0,0 +1,62 @@
+"""Pytest testcases for compact, compressed and chunked path messages"""
+import json
+import random
+import pytest
+from path_transport import PathTransport, TOPIC_SEND_PATH_CHUNK, bytes_on_air, quantize_path, reassemble
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="path")
+def survey_path() -> dict:
+    """A path of 500 nodes"""
+    nodes = [{"uuid": f"Node_{i}", "sequence_number": i, "position": {"x": 52.040360393900656 + i * 1.23456789e-6, "y": 5.567137289287426, "z": 53.61400798801333}} for i in range(500)]
+    edges = [{"uuid": f"Edge_{i}", "start_node_uuid": f"Node_{i}", "end_node_uuid": f"Node_{i + 1}", "actions": []} for i in range(499)]
+    return {"path_uuid": "Survey", "path_encoding": 0, "nodes": nodes, "edges": edges}
+
+
+def test_quantize_path(path):
+    """Tests if positions are rounded and the original path is not changed"""
+    quantized = quantize_path(path, 7)
+    assert quantized["nodes"][0]["position"] == {"x": 52.0403604, "y": 5.5671373, "z": 53.614}
+    assert path["nodes"][0]["position"]["x"] == 52.040360393900656
+    assert quantized["edges"] is path["edges"]
+
+
+def test_compact_encoding(path):
+    """Tests if the compact encoding is plain JSON and smaller"""
+    payload = PathTransport(decimals=7).encode(path)
+    assert json.loads(payload) == quantize_path(path, 7)
+    assert len(payload) < len(json.dumps(path))
+
+
+def test_chunked_roundtrip(path):
+    """Tests if compressed chunks reassemble into the path in any order"""
+    transport = PathTransport(decimals=None, compress=True, chunk_size=1000)
+    messages = transport.get_messages(transport.encode(path))
+    assert len(messages) > 1
+    header = json.loads(messages[0].split(b"\n", 1)[0])
+    assert header["count"] == len(messages)
+    assert header["encoding"] == "zlib"
+    random.Random(1).shuffle(messages)
+    assert reassemble(messages) == path
+
+
+def test_reassemble_invalid(path):
+    """Tests if missing or corrupt chunks are detected"""
+    transport = PathTransport(chunk_size=1000)
+    messages = transport.get_messages(transport.encode(path))
+    with pytest.raises(ValueError, match="missing"):
+        reassemble(messages[1:])
+    messages[0] = messages[0][:-1] + b"_"
+    with pytest.raises(ValueError, match="Checksum"):
+        reassemble(messages)
+
+
+def test_bytes_on_air():
+    """Tests the MQTT overhead of published messages"""
+    topic = TOPIC_SEND_PATH_CHUNK
+    # Fixed header and one length byte, topic length and name, packet id, and the PUBACK
+    assert bytes_on_air([b"x" * 10], topic) == 2 + 2 + len(topic) + 2 + 10 + 4
+    assert bytes_on_air([b"x" * 10], topic, qos=0) == 2 + 2 + len(topic) + 10
+    assert bytes_on_air([b"x" * 1000], topic) == 3 + 2 + len(topic) + 2 + 1000 + 4
@@ -0,0 +1,51 @@
+"""Pytest testcases for the column storage of CapraRoute"""
+import json
+import pytest
+from models.coordinate import Coordinate
+from models.edge import Edge
+from models.node import Node
+from models.route_capra import CapraRoute
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="route")
+def example_route() -> CapraRoute:
+    """The example path as a CapraRoute"""
+    with open("data/Path2.json", encoding="utf-8") as f:
+        data = json.load(f)
+    route = CapraRoute(data["path_uuid"])
+    for node in data["nodes"]:
+        route.add_node(Node.from_formatted_node(node))
+    for edge in data["edges"]:
+        route.add_edge(Edge.from_formatted_edge(edge))
+    return route
+
+
+def test_formatted_route(route):
+    """Tests if the route is formatted in the Capra Hircus shape, other fields of nodes and edges are kept"""
+    extra = {"actions": [], "isIndoor": False}
+    expected = [Node("Node_0", 0, 52.040360393900656, 5.567137289287426, 53.61400798801333, extra).get_formatted_node(),
+                Node("Node_1", 1, 52.04027615536029, 5.567062540014308, 0.0, extra).get_formatted_node()]
+    formatted = route.get_formatted_route()
+    assert formatted["path_uuid"] == "Path2"
+    assert formatted["nodes"] == expected
+    with open("data/Path2.json", encoding="utf-8") as f:
+        assert formatted["edges"] == json.load(f)["edges"]
+    edge = Edge("Edge_0", "Node_0", "Node_1", 0.4).get_formatted_edge()
+    assert edge["actions"][0]["parameters"][0]["value_float32"] == 0.4
+
+
+def test_columns(route):
+    """Tests if positions are stored in one array and uuids are shared"""
+    assert route.node_count == 2
+    assert route.edge_count == 1
+    assert route.positions.shape == (2, 3)
+    assert route.positions[1, 0] == 52.04027615536029
+    assert next(route.iter_edges()).start_node_uuid is next(route.iter_nodes()).uuid
+
+
+def test_slots():
+    """Tests if nodes, edges and coordinates have no instance dict"""
+    for instance in (Node("Node_0", 0, 1.0, 2.0), Edge("Edge_0", "Node_0", "Node_1"), Coordinate(1.0, 2.0)):
+        assert not hasattr(instance, "__dict__")
@@ -0,0 +1,74 @@
+"""Pytest testcases for compiling GeoJSON routes into Capra paths and driving plans"""
+import math
+import pytest
+from models.coordinate import Coordinate
+from models.feature_types.line_string import LineString
+from models.feature_types.point import Point
+from models.route_geojson import GeoJSONRoute
+import route_compiler
+
+# pylint: disable=line-too-long
+
+# East, then north: a left turn of 90 degrees
+LINE = [[5.5670, 52.0400], [5.5680, 52.0400, 2.0], [5.5680, 52.0410]]
+
+
+@pytest.fixture(name="geojson")
+def geojson_route():
+    """Create a GeoJSON FeatureCollection with one LineString"""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": [5.0, 52.0]}},
+            {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": LINE}}
+        ]
+    }
+
+
+def test_compile_route(geojson):
+    """Tests if a GeoJSON LineString is compiled into Capra nodes and edges"""
+    route = route_compiler.compile_route(geojson, "Path3", speed=0.4).get_formatted_route()
+    assert route["path_uuid"] == "Path3"
+    assert [node["uuid"] for node in route["nodes"]] == ["Node_0", "Node_1", "Node_2"]
+    assert route["nodes"][1]["position"] == {"x": 52.0400, "y": 5.5680, "z": 2.0}
+    assert [(edge["start_node_uuid"], edge["end_node_uuid"]) for edge in route["edges"]] == [("Node_0", "Node_1"), ("Node_1", "Node_2")]
+    assert route["edges"][0]["actions"][0]["parameters"][0]["value_float32"] == 0.4
+
+
+def test_compile_route_from_models():
+    """Tests if GeoJSONRoute and LineString models can be compiled"""
+    line = LineString()
+    for lon, lat, *_ in LINE:
+        line.add_coordinate(Coordinate(lon, lat))
+    route = GeoJSONRoute()
+    route.add_feature(Point())
+    route.add_feature(line)
+    assert route.get_formatted_route()["type"] == "FeatureCollection"
+
+    compiled = route_compiler.compile_route(route, "Path3").get_formatted_route()
+    assert len(compiled["nodes"]) == 3
+    assert len(compiled["edges"]) == 2
+
+
+def test_driving_plan(geojson):
+    """Tests if a plan drives every segment and turns left between them"""
+    plan = list(route_compiler.iter_driving_plan(geojson, speed=1.0))
+    assert [step.instruction.angle for step in plan] == [0.0, route_compiler.MAX_LEFT_ANGLE, 0.0]
+    assert plan[1].duration == pytest.approx(math.radians(90) / 1.5, abs=1e-2)
+    total = sum(step.distance for step in plan)
+    # About 68.5 m east and 111.2 m north
+    assert total == pytest.approx(68.5 + 111.2, abs=0.5)
+    assert all(step.duration == pytest.approx(step.distance) for step in plan)
+
+
+def test_driving_plan_across_chunks(geojson):
+    """Tests if the plan does not depend on the chunk size"""
+    small = list(route_compiler.iter_driving_plan(geojson, chunk_size=1))
+    large = list(route_compiler.iter_driving_plan(geojson))
+    assert [(s.instruction.angle, round(s.distance, 6)) for s in small] == [(s.instruction.angle, round(s.distance, 6)) for s in large]
+
+
+def test_driving_plan_invalid_speed(geojson):
+    """Tests if a plan needs a positive speed"""
+    with pytest.raises(ValueError):
+        list(route_compiler.iter_driving_plan(geojson, speed=0))
@@ -0,0 +1,99 @@
+"""Pytest testcases driving the ControlCapra against the in-process Capra Hircus simulator"""
+import pytest
+from capra_control import ControlCapra, STOP_MODE
+from clock import VirtualClock
+from path_transport import PathTransport
+from simulator import FakeBroker, FakeHircus, attach_controller
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="robot")
+def fake_hircus():
+    """A simulated robot on a fake broker"""
+    broker = FakeBroker()
+    robot = FakeHircus(broker)
+    robot.start()
+    yield robot
+    robot.stop()
+    broker.stop()
+
+
+@pytest.fixture(name="controller")
+def connected_controller(robot):
+    """A controller connected to the simulated robot"""
+    controller = ControlCapra("simulator", 1883)
+    attach_controller(controller, robot.broker)
+    controller.connect_to_robot()
+    yield controller
+    controller.disconnect_from_robot()
+
+
+def test_connect(controller):
+    """Tests if both connections of the controller are connected"""
+    assert controller.connection.get_status()["state"] == "connected"
+    assert controller.priority.is_connected
+
+
+def test_velocity_stream(controller, robot):
+    """Tests if the robot receives the velocity stream at 10 Hz and moves"""
+    report = controller.remote_control(0.3, 1, 0.0)
+    assert report["ticks"] == 3
+    assert robot.wait_for(lambda r: len(r.velocity_frames) == 3)
+    assert robot.get_velocity_stats()["mean_interval_ms"] == pytest.approx(100, abs=30)
+    assert robot.wait_for(lambda r: r.x > 0.1)
+
+
+def test_odometry_drive(controller, robot):
+    """Tests if a closed loop drive ends on the odometry of the simulated robot"""
+    report = controller.remote_control(0.3, 1, 0.0, odometry=True)
+    assert report["odometry"]
+    assert not report["time_limit_reached"]
+    assert report["distance_covered"] >= 0.3
+    assert robot.travelled >= 0.3
+
+
+def test_emergency_stop(controller, robot):
+    """Tests if an emergency stop is acknowledged and the robot ignores velocity afterwards"""
+    result = controller.emergency_stop()
+    assert result["acknowledged"]
+    assert robot.mode == STOP_MODE
+    controller.send_instruction(1, 0.0)
+    controller.connection.client.publish("capra/remote/direct_velocity", b'{"twist": {"linear": {"x": 1}, "angular": {"z": 0}}}')
+    assert robot.wait_for(lambda r: r.ignored_frames == 1)
+    assert not robot.velocity_frames
+
+
+@pytest.mark.parametrize("transport", [None, PathTransport(compress=True, chunk_size=200)])
+def test_send_path(controller, robot, transport):
+    """Tests if the robot receives a path sent as one message or in chunks"""
+    controller.send_path("data/Path2.json", transport=transport)
+    assert robot.wait_for(lambda r: len(r.paths) == 1)
+    assert robot.paths[0]["path_uuid"] == "Path2"
+
+
+def test_telemetry(controller, robot):
+    """Tests if the telemetry of the simulated robot reaches the controller"""
+    assert robot.wait_for(lambda r: controller.telemetry.latest("capra/robot/odometry") is not None, 2)
+    assert controller.telemetry.get_snapshot()["capra/robot/battery"] is not None
+
+
+def test_virtual_time_drive():
+    """Tests if a long closed loop drive against the simulator replays on virtual time"""
+    clock = VirtualClock()
+    broker = FakeBroker(delay=0.005, clock=clock)
+    robot = FakeHircus(broker)
+    robot.start()
+    controller = ControlCapra("simulator", 1883, clock=clock)
+    attach_controller(controller, broker)
+    controller.connect_to_robot()
+
+    report = controller.remote_control(200, 2, 0.0, odometry=True)
+    assert not report["time_limit_reached"]
+    assert report["distance_covered"] >= 200
+    assert clock.monotonic() == pytest.approx(100, abs=1)
+    assert robot.get_velocity_stats()["mean_interval_ms"] == pytest.approx(100)
+    assert controller.emergency_stop()["latency_ms"] == pytest.approx(5)
+    assert robot.wait_for(lambda r: r.mode == STOP_MODE and r.speed == 0.0)
+    robot.stop()
+    controller.disconnect_from_robot()
@@ -0,0 +1,67 @@
+"""Pytest testcases for testing the telemetry ring buffers and stream"""
+import asyncio
+import threading
+import pytest
+from telemetry import RingBuffer, TelemetryHub
+
+# pylint: disable=line-too-long
+
+
+@pytest.fixture(name="hub")
+def telemetry_hub():
+    """Create instance of TelemetryHub"""
+    return TelemetryHub(["capra/robot/status", "capra/robot/battery"], capacity=4)
+
+
+def test_ring_buffer_overwrites_oldest():
+    """Tests if the ring buffer keeps a fixed number of items"""
+    buffer = RingBuffer(3)
+    for i in range(5):
+        buffer.append(i)
+    assert len(buffer) == 3
+    assert buffer.latest() == 4
+    assert buffer.read_since(0) == ([2, 3, 4], 5)
+    assert buffer.read_since(4) == ([4], 5)
+    assert buffer.read_since(5) == ([], 5)
+
+
+def test_ring_buffer_capacity():
+    """Tests if a ring buffer without capacity is rejected"""
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+
+def test_snapshot(hub):
+    """Tests if the snapshot contains the latest decoded message per topic"""
+    hub.add_message("capra/robot/battery", b'{"level": 80}')
+    hub.add_message("capra/robot/battery", b'{"level": 79}')
+    hub.add_message("capra/unknown", b'{}')
+    snapshot = hub.get_snapshot()
+    assert snapshot["capra/robot/battery"]["payload"] == {"level": 79}
+    assert snapshot["capra/robot/battery"]["sequence"] == 2
+    assert snapshot["capra/robot/status"] is None
+
+
+def test_stream_shares_frames(hub):
+    """Tests if stream clients are woken up by new messages and receive the same encoded frame"""
+
+    async def read_two(stream):
+        return [await stream.__anext__(), await stream.__anext__()]
+
+    async def run():
+        first = hub.stream()
+        second = hub.stream(["capra/robot/status"])
+        readers = asyncio.gather(read_two(first), read_two(second))
+        await asyncio.sleep(0.01)
+        thread = threading.Thread(target=lambda: [
+            hub.add_message("capra/robot/status", b'{"state":\n "idle"}'),
+            hub.add_message("capra/robot/status", b'{"state": "driving"}')])
+        thread.start()
+        result = await asyncio.wait_for(readers, 2)
+        thread.join()
+        return result
+
+    first, second = asyncio.run(run())
+    assert first[0] == b'event: capra/robot/status\nid: 1\ndata: {"state": "idle"}\n\n'
+    assert first[0] is second[0]
+    assert first[1] is second[1]
@@ -0,0 +1,84 @@
+"""Pytest testcases for testing the DeadlineTicker using a fake clock"""
+import threading
+import pytest
+from clock import VirtualClock
+from ticker import DeadlineTicker
+
+# pylint: disable=line-too-long
+
+
+class FakeClock:
+    """Clock that only moves when told to"""
+
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeEvent(threading.Event):
+    """Event whose wait advances the fake clock instead of sleeping"""
+
+    def __init__(self, clock: FakeClock) -> None:
+        super().__init__()
+        self.clock = clock
+
+    def wait(self, timeout=None):
+        self.clock.now += timeout
+        return self.is_set()
+
+
+@pytest.fixture(name="clock")
+def fake_clock():
+    """Create a fake clock"""
+    return FakeClock()
+
+
+def test_ticks_on_absolute_deadlines(clock):
+    """Tests if time spent between ticks is compensated"""
+    ticker = DeadlineTicker(0.1, clock)
+    ticker.start()
+    event = FakeEvent(clock)
+    for _ in range(10):
+        clock.now += 0.03  # Time spent publishing
+        assert ticker.wait(event) is False
+
+    assert clock.now == pytest.approx(101.0)
+    assert ticker.elapsed == pytest.approx(1.0)
+    assert ticker.get_stats()["missed_deadlines"] == 0
+
+
+def test_missed_deadlines(clock):
+    """Tests if overrunning a period is counted and the ticker realigns"""
+    ticker = DeadlineTicker(0.1, clock)
+    ticker.start()
+    clock.now += 0.35
+    ticker.wait(FakeEvent(clock))
+
+    stats = ticker.get_stats()
+    assert stats["ticks"] == 1
+    assert stats["missed_deadlines"] == 2
+    assert stats["max_jitter_ms"] == pytest.approx(250)
+    assert ticker.deadline == pytest.approx(100.4)
+
+
+def test_wait_interrupted(clock):
+    """Tests if setting the stop event interrupts waiting"""
+    ticker = DeadlineTicker(0.1, clock)
+    ticker.start()
+    event = FakeEvent(clock)
+    event.set()
+    assert ticker.wait(event) is True
+    assert ticker.ticks == 0
+
+
+def test_virtual_clock():
+    """Tests if the ticker paces an hour of ticks on a virtual clock without sleeping"""
+    clock = VirtualClock()
+    ticker = DeadlineTicker(0.1, clock)
+    ticker.start()
+    for _ in range(36_000):
+        ticker.wait()
+    assert ticker.elapsed == pytest.approx(3600.0)
+    assert ticker.get_stats()["max_jitter_ms"] == pytest.approx(0.0, abs=1e-6)
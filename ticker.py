@@ -0,0 +1,77 @@
+"""Module containing a drift-free ticker for periodic MQTT streams"""
+import threading
+from typing import Callable
+from clock import SYSTEM_CLOCK, Clock
+
+
+class DeadlineTicker():
+    """
+    Paces a periodic loop on absolute deadlines of a monotonic clock.
+    Time spent between ticks (publishing, serialization, logging) is compensated,
+    so the average rate stays at 1/period. Jitter and missed deadlines are recorded.
+    The clock is a Clock, like a VirtualClock for replaying drives faster than real time,
+    or a function returning monotonic seconds.
+    """
+
+    def __init__(self, period: float, clock: Clock | Callable[[], float] = SYSTEM_CLOCK) -> None:
+        self.period = period
+        self.clock = clock if isinstance(clock, Clock) else Clock(clock)
+        self.started_at = 0.0
+        self.deadline = 0.0
+        self.last_tick = 0.0
+        self.ticks = 0
+        self.missed_deadlines = 0
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+        self.last_jitter = 0.0
+        self._index = 0
+
+    def start(self) -> float:
+        """Starts the ticker, the first deadline is one period from now"""
+        self.started_at = self.clock()
+        self.last_tick = self.started_at
+        self._index = 1
+        self.deadline = self.started_at + self.period
+        return self.started_at
+
+    def wait(self, stop_event: threading.Event | None = None) -> bool:
+        """
+        Blocks until the next deadline. Returns True when stop_event was set while waiting.
+        When a deadline was missed by one or more full periods, the skipped ticks are counted
+        and the ticker realigns to the next deadline in the future instead of bursting.
+        """
+        remaining = self.deadline - self.clock()
+        while remaining > 0:
+            if self.clock.wait(stop_event, remaining):
+                return True
+            remaining = self.deadline - self.clock()
+
+        now = self.clock()
+        jitter = now - self.deadline
+        self.ticks += 1
+        self.total_jitter += jitter
+        self.last_jitter = jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+
+        skipped = int(jitter // self.period)
+        self.missed_deadlines += skipped
+        self._index += 1 + skipped
+        self.deadline = self.started_at + self._index * self.period
+        self.last_tick = now
+        return False
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds between the start of the ticker and the last tick"""
+        return self.last_tick - self.started_at
+
+    def get_stats(self) -> dict:
+        """Returns tick count, jitter in milliseconds and the number of missed deadlines"""
+        mean_jitter = self.total_jitter / self.ticks if self.ticks else 0.0
+        return {
+            "ticks": self.ticks,
+            "missed_deadlines": self.missed_deadlines,
+            "mean_jitter_ms": mean_jitter * 1000,
+            "max_jitter_ms": self.max_jitter * 1000,
+            "elapsed": self.elapsed
+        }